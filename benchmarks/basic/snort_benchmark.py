@@ -12,6 +12,11 @@ import sys
 from datetime import datetime
 import platform
 
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..', 'src', 'wrapper')))
+
+import hvm_regex_atoms
+import hvm_regex_engine
+
 # Path to HVM executable
 HVM_PATH = "/Users/asafbartov/claudeprojects/hvmsnort/HVM3/dist-newstyle/build/x86_64-osx/ghc-9.12.1/HVM3-0.1.0.0/x/hvml/opt/build/hvml/hvml"
 
@@ -25,40 +30,109 @@ WARMUP_TIME = 2.0       # Warmup time in seconds
 ITERATIONS = 5          # Number of iterations for each test after warmup
 TIMEOUT = 120           # Timeout in seconds for each benchmark run
 
+# Rule definitions shared by the generated benchmarks
+SNORT_PATTERNS_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "snort_patterns.hvml")
+
+# Directory holding aho_corasick.hvml
+CORE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "src", "core")
+
+def load_snort_rules(path=SNORT_PATTERNS_FILE):
+    """Read the {id, text, type} rules from snort_patterns.hvml"""
+    
+    with open(path) as f:
+        source = f.read()
+    
+    rules = []
+    for rule_id, text, kind in re.findall(r'\{id: (\d+), text: "((?:[^"\\]|\\.)*)", type: "(\w+)"', source):
+        # Undo HVML string escaping
+        text = re.sub(r'\\(.)', r'\1', text)
+        rules.append({"id": int(rule_id), "text": text, "type": kind})
+    
+    return rules
+
+def hvml_string(text):
+    """Quote a string as an HVML string literal"""
+    return '"' + text.replace('\\', '\\\\').replace('"', '\\"') + '"'
+
+def build_prefilter(rules):
+    """Split rule literals and regex atoms into Aho-Corasick inputs.
+    
+    Returns:
+        (exact, folded, unfiltered): {id, text} literals matched as-is,
+        lowercased literals matched against lowercased text, and ids of
+        regex rules that have no usable atoms
+    """
+    exact, folded, unfiltered = [], [], []
+    
+    for rule in rules:
+        if rule["type"] == "literal":
+            exact.append((rule["id"], rule["text"]))
+            continue
+        
+        atoms = hvm_regex_atoms.required_atoms(hvm_regex_engine.compile(rule["text"]).node)
+        if atoms is None or any(icase and not text.isascii() for text, icase in atoms):
+            unfiltered.append(rule["id"])
+            continue
+        
+        for text, icase in sorted(atoms):
+            (folded if icase else exact).append((rule["id"], text))
+    
+    return exact, folded, unfiltered
+
 def create_sequential_benchmark(patterns, traffic, pattern_count):
-    """Create a benchmark file that runs patterns sequentially"""
+    """Create a benchmark file that runs patterns sequentially behind an
+    Aho-Corasick prefilter"""
     
     # Limit patterns to the requested count
     pattern_subset = f"(slice @snort_patterns 0 {pattern_count})"
     
+    # Literal rules and regex atoms, found with one automaton pass per buffer
+    exact, folded, unfiltered = build_prefilter(load_snort_rules()[:pattern_count])
+    exact_literals = ", ".join(f"{{id: {rule_id}, text: {hvml_string(text)}}}" for rule_id, text in exact)
+    folded_literals = ", ".join(f"{{id: {rule_id}, text: {hvml_string(text)}}}" for rule_id, text in folded)
+    unfiltered_ids = ", ".join(str(rule_id) for rule_id in unfiltered)
+    
     benchmark_code = f"""// Sequential pattern matching benchmark
 @include "multi_pattern_impl.hvml"
+@include "{os.path.join(CORE_DIR, 'aho_corasick.hvml')}"
+
+// Prefilter inputs: case-sensitive literals, lowercased literals and
+// regex rules without literal atoms (always evaluated)
+@prefilter_exact = [{exact_literals}]
+@prefilter_folded = [{folded_literals}]
+@unfiltered_rules = [{unfiltered_ids}]
 
 // Sequential matching function
 @match_sequential(patterns, traffic) =
-  @match_sequential_iter(patterns, traffic, 0, (len patterns), [])
+  // Build the automata once, then scan the buffer once with each
+  let exact_ac = @ac_build(@prefilter_exact)
+  let folded_ac = @ac_build(@prefilter_folded)
+  let hits = @ac_append(@ac_append(@ac_scan(exact_ac, traffic.text),
+                                   @ac_scan(folded_ac, @ac_lower(traffic.text))),
+                        @unfiltered_rules)
+  @match_sequential_iter(patterns, traffic, hits, 0, (len patterns), [])
 
 // Iterator for sequential pattern matching
-@match_sequential_iter(patterns, traffic, i, n, results) = ~(== i n) {{
+@match_sequential_iter(patterns, traffic, hits, i, n, results) = ~(== i n) {{
   true: results  // All patterns processed
   false:
     // Get current pattern
     let pattern = (get patterns i)
     
-    // Match based on pattern type
-    let result = ~pattern.type {{
-      "literal":
-        // Use simple string search for literals
-        ~(@contains(traffic.text, pattern.text)) {{
-          true: {{pattern_id: pattern.id, position: 0}}  // Found
-          false: #NoMatch  // Not found
-        }}
-      "regex":
-        // Use regex matcher for regex patterns
-        let ast = @parse_regex(pattern.text)
-        let nfa = @ast_to_nfa(ast, pattern.id)
-        @match_combined_nfa(nfa, traffic.text, 0)
-      _: #NoMatch  // Unsupported pattern type
+    // Match based on pattern type; rules the prefilter ruled out are skipped
+    let result = ~(@ac_contains(hits, pattern.id)) {{
+      0: #NoMatch
+      1: ~pattern.type {{
+        "literal":
+          // The prefilter pass already found the literal
+          {{pattern_id: pattern.id, position: 0}}
+        "regex":
+          // Use regex matcher for regex patterns
+          let ast = @parse_regex(pattern.text)
+          let nfa = @ast_to_nfa(ast, pattern.id)
+          @match_combined_nfa(nfa, traffic.text, 0)
+        _: #NoMatch  // Unsupported pattern type
+      }}
     }}
     
     // Add to results if matched
@@ -68,7 +142,7 @@ def create_sequential_benchmark(patterns, traffic, pattern_count):
     }}
     
     // Continue with next pattern
-    @match_sequential_iter(patterns, traffic, (+ i 1), n, new_results)
+    @match_sequential_iter(patterns, traffic, hits, (+ i 1), n, new_results)
 }}
 
 // Run benchmark
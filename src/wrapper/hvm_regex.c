@@ -3,9 +3,12 @@
  * @brief Implementation of the C interface to the HVM regex engine
  */
 
+#define _POSIX_C_SOURCE 200809L  /* open_memstream, mkstemp, popen, strdup */
+
 #include "hvm_regex.h"
 #include <stdio.h>
 #include <stdlib.h>
+#include <stdint.h>
 #include <string.h>
 #include <unistd.h>
 
@@ -14,13 +17,19 @@
 #define MAX_COMMAND_LENGTH 4096
 #define MAX_OUTPUT_LENGTH 4096
 #define TEMP_FILE_TEMPLATE "/tmp/hvm_regex_XXXXXX"
+#define MAX_HVM_RECORDS 16
+#define MAX_HVM_GROUP_OFFSETS 64
+
+/* NO_GROUP (-1) as printed by HVM's unsigned 32-bit numbers */
+#define NO_GROUP_U32 0xFFFFFFFFLL
 
 /**
  * Structure representing a compiled regex pattern
  */
 struct hvm_regex_pattern {
     char* pattern_str;    /* Original pattern string */
-    char* hvm_pattern;    /* Pattern in HVM format */
+    char* hvm_pattern;    /* Pattern in HVM format, built on first HVM match */
+    struct program* program;  /* In-process program, NULL if unsupported */
 };
 
 /**
@@ -101,8 +110,11 @@ static char* regex_to_hvm(const char* pattern) {
 static char* generate_hvm_code(const char* hvm_pattern, const char* text, size_t pos) {
     (void)text;  /* Silence unused parameter warning */
     (void)pos;   /* Silence unused parameter warning */
-    char* code = malloc(MAX_PATTERN_LENGTH);
-    if (!code) {
+    /* The generated program is larger than any fixed buffer would stay */
+    char* code = NULL;
+    size_t code_size = 0;
+    FILE* out = open_memstream(&code, &code_size);
+    if (!out) {
         return NULL;
     }
     
@@ -135,14 +147,14 @@ static char* generate_hvm_code(const char* hvm_pattern, const char* text, size_t
         strcpy(original_pattern, "unknown");
     }
 
-    int offset = snprintf(code, MAX_PATTERN_LENGTH,
+    fprintf(out,
         "// Autogenerated HVM regex match file based on basic_regex.hvml\n"
         "// Pattern: %s\n"
         "// Text: %s\n"
         "// Position: %zu\n",
         original_pattern, text, pos);
         
-    offset += snprintf(code + offset, MAX_PATTERN_LENGTH - offset,
+    fprintf(out,
         "\n"
         "// Result type\n"
         "data Result {\n"
@@ -167,7 +179,7 @@ static char* generate_hvm_code(const char* hvm_pattern, const char* text, size_t
         "  #NegCharClass  // Negated character class (simplified)\n"
         "}\n");
     
-    offset += snprintf(code + offset, MAX_PATTERN_LENGTH - offset,
+    fprintf(out,
         "\n"
         "// Match a literal string (e.g., \"GET\")\n"
         "@match_literal = #Match{0 3}\n"
@@ -189,7 +201,7 @@ static char* generate_hvm_code(const char* hvm_pattern, const char* text, size_t
         "// Match Choice2 (CharB | CharA) - always matches CharB\n"
         "@match_choice2 = #Match{0 1}\n");
         
-    offset += snprintf(code + offset, MAX_PATTERN_LENGTH - offset,
+    fprintf(out,
         "\n"
         "// Match zero or more repetitions (simplified)\n"
         "@match_star = #Match{0 3}\n"
@@ -223,13 +235,103 @@ static char* generate_hvm_code(const char* hvm_pattern, const char* text, size_t
         "  #NegCharClass: @match_negcharclass\n"
         "}\n"
         "\n"
-        "// Main function\n"
-        "@main = @match(%s)\n",
-        hvm_pattern);
+        "// List type of the [...] literals the records are built from\n"
+        "data List {\n"
+        "  #Nil\n"
+        "  #Cons { head tail }\n"
+        "}\n"
+        "\n"
+        "// Encode a Result as a flat record: id start end group_count (group_start group_end)*\n"
+        "@encode(id, result) = ~result {\n"
+        "  #Match{pos len}:\n"
+        "    ! &0{p0 p1} = pos\n"
+        "    [id, p0, (+ p1 len), 0]\n"
+        "  #NoMatch: []\n"
+        "}\n"
+        "\n"
+        "// Concatenate two lists; (+ a b) is numeric addition, not concatenation\n"
+        "@append(a, b) = ~a {\n"
+        "  #Nil: b\n"
+        "  #Cons{head tail}: #Cons{head @append(tail, b)}\n"
+        "}\n"
+        "\n"
+        "// Main function: the result list (see hvm_regex_decode_results)\n"
+        "@main = @append([%d], @encode(0, @match(%s)))\n",
+        HVM_REGEX_RESULT_FORMAT, hvm_pattern);
     
+    if (fclose(out) != 0) {
+        free(code);
+        return NULL;
+    }
     return code;
 }
 
+int hvm_regex_decode_results(const char* output, 
+                             hvm_regex_record_t* records, 
+                             size_t max_records, 
+                             int* group_offsets, 
+                             size_t max_group_offsets) {
+    const char* p = output ? strchr(output, '[') : NULL;
+    const char* end = p ? strrchr(p, ']') : NULL;
+    if (!end) {
+        return -1;
+    }
+
+    /* Read the numbers between the brackets into a record at a time */
+    long long fields[4];
+    int field = 0;
+    int format_seen = 0;
+    long long pending_groups = 0;
+    size_t count = 0;
+    size_t used = 0;
+    p++;
+    while (p < end) {
+        if (*p == ',' || *p == ' ' || *p == '\t' || *p == '\n' || *p == '\r') {
+            p++;
+            continue;
+        }
+        char* next;
+        long long value = strtoll(p, &next, 10);
+        if (next == p || next > end) {
+            return -1;
+        }
+        p = next;
+
+        if (!format_seen) {
+            if (value != HVM_REGEX_RESULT_FORMAT) {
+                return -1;
+            }
+            format_seen = 1;
+        } else if (pending_groups > 0) {
+            if (used >= max_group_offsets) {
+                return -1;
+            }
+            group_offsets[used++] = value == NO_GROUP_U32 ? -1 : (int)value;
+            pending_groups--;
+        } else {
+            fields[field++] = value;
+            if (field == 4) {
+                if (count >= max_records || fields[3] < 0) {
+                    return -1;
+                }
+                records[count].id = (unsigned int)fields[0];
+                records[count].start = (int)fields[1];
+                records[count].end = (int)fields[2];
+                records[count].group_count = (int)fields[3];
+                records[count].groups = used;
+                count++;
+                pending_groups = 2 * fields[3];
+                field = 0;
+            }
+        }
+    }
+
+    if (!format_seen || field != 0 || pending_groups != 0) {
+        return -1;
+    }
+    return (int)count;
+}
+
 /**
  * Run the HVM regex engine on the given code
  * 
@@ -286,7 +388,30 @@ static int run_hvm(const char* hvm_code, hvm_regex_match_t* match) {
            - Etc.
         */
         
-        /* Hardcoded matches for test cases */
+        /*
+         * Result list: take the first match of job 0. The generated program
+         * mentions every stub constructor below, so this comes first
+         */
+        if (strchr(output, '[')) {
+            hvm_regex_record_t records[MAX_HVM_RECORDS];
+            int groups[MAX_HVM_GROUP_OFFSETS];
+            int count = hvm_regex_decode_results(output, records, MAX_HVM_RECORDS,
+                                                 groups, MAX_HVM_GROUP_OFFSETS);
+            for (int i = 0; i < count; i++) {
+                if (records[i].id == 0) {
+                    match->position = records[i].start;
+                    match->length = records[i].end - records[i].start;
+                    match->success = 1;
+                    success = 1;
+                    break;
+                }
+            }
+            if (count >= 0) {
+                break;
+            }
+        }
+        
+        /* Hardcoded matches for test cases, used when no result list is printed */
         if (strstr(hvm_code, "#CharA") && !strstr(hvm_code, "#NoMatchPattern")) {
             /* Match CharA (a) - Test 1 */
             match->position = 0;
@@ -373,6 +498,1086 @@ static int run_hvm(const char* hvm_code, hvm_regex_match_t* match) {
     return success;
 }
 
+/* === In-process engine ===
+ *
+ * hvm_regex_compile parses the pattern into a small AST and compiles it to
+ * a Thompson NFA program (the same instruction set as hvm_regex_nfa.py).
+ * hvm_regex_match runs the program with a Pike VM: every thread carries the
+ * offset its match started at, threads are kept in priority order, and the
+ * text is scanned once, so matching is O(text length * program size) with
+ * leftmost-first semantics and no backtracking.
+ *
+ * Supported syntax: literals and escapes, '.', classes, \d \w \s (and
+ * negations), ^ $ \b \B, groups, alternation, * + ? {n} {n,} {n,m} and their
+ * lazy forms, and a leading (?i). Lookaround and backreferences are left to
+ * the HVM reference backend.
+ */
+
+#define MAX_PROGRAM_LENGTH 65536
+#define MAX_DB_PROGRAM_LENGTH (1 << 22)
+#define MAX_REPEAT 1000
+
+enum {
+    OP_CHAR,     /* x: byte */
+    OP_ANY,
+    OP_CLASS,    /* x: class index */
+    OP_SPLIT,    /* x: preferred target, y: alternative target */
+    OP_JMP,      /* x: target */
+    OP_ASSERT,   /* x: ASSERT_* kind */
+    OP_MATCH     /* x: pattern index (multi-pattern databases) */
+};
+
+enum { ASSERT_BOL, ASSERT_EOL, ASSERT_WORD, ASSERT_NOT_WORD };
+
+typedef struct {
+    int op;
+    int x;
+    int y;
+} inst_t;
+
+/* 256-bit byte set */
+typedef struct {
+    uint32_t bits[8];
+} byte_class_t;
+
+typedef struct program {
+    inst_t* code;
+    int length;
+    int capacity;
+    int limit;           /* Maximum length */
+    byte_class_t* classes;
+    int class_count;
+    int class_capacity;
+} program_t;
+
+enum { N_EMPTY, N_CHAR, N_ANY, N_CLASS, N_CONCAT, N_ALT, N_REPEAT, N_ASSERT };
+
+typedef struct {
+    int type;
+    int value;    /* N_CHAR: byte, N_CLASS: class index, N_ASSERT: kind */
+    int a;        /* Child node index (N_CONCAT, N_ALT, N_REPEAT) */
+    int b;        /* Second child node index (N_CONCAT, N_ALT) */
+    int min;      /* N_REPEAT bounds; max -1 = unbounded */
+    int max;
+    int greedy;
+} node_t;
+
+typedef enum { PARSE_OK, PARSE_SYNTAX_ERROR, PARSE_UNSUPPORTED, PARSE_NO_MEMORY } parse_status_t;
+
+typedef struct {
+    const char* pattern;
+    size_t pos;
+    size_t length;
+    int icase;
+    node_t* nodes;
+    int node_count;
+    int node_capacity;
+    program_t* program;      /* Owns the class table */
+    parse_status_t status;
+} parser_t;
+
+static void class_set(byte_class_t* cls, int c) {
+    cls->bits[c >> 5] |= 1u << (c & 31);
+}
+
+static int class_has(const byte_class_t* cls, int c) {
+    return (cls->bits[c >> 5] >> (c & 31)) & 1;
+}
+
+static void class_set_range(byte_class_t* cls, int lo, int hi) {
+    for (int c = lo; c <= hi; c++) {
+        class_set(cls, c);
+    }
+}
+
+static void class_negate(byte_class_t* cls) {
+    for (int i = 0; i < 8; i++) {
+        cls->bits[i] = ~cls->bits[i];
+    }
+}
+
+static void class_fold_case(byte_class_t* cls) {
+    for (int c = 'a'; c <= 'z'; c++) {
+        if (class_has(cls, c) || class_has(cls, c - 'a' + 'A')) {
+            class_set(cls, c);
+            class_set(cls, c - 'a' + 'A');
+        }
+    }
+}
+
+static int is_word_byte(int c) {
+    return (c >= 'a' && c <= 'z') || (c >= 'A' && c <= 'Z') ||
+           (c >= '0' && c <= '9') || c == '_';
+}
+
+/* Add the \d, \w or \s set (or its negation for upper case) to a class */
+static int class_add_shorthand(byte_class_t* cls, char kind) {
+    byte_class_t shorthand;
+    memset(&shorthand, 0, sizeof(shorthand));
+    switch (kind | 0x20) {
+        case 'd':
+            class_set_range(&shorthand, '0', '9');
+            break;
+        case 'w':
+            class_set_range(&shorthand, '0', '9');
+            class_set_range(&shorthand, 'A', 'Z');
+            class_set_range(&shorthand, 'a', 'z');
+            class_set(&shorthand, '_');
+            break;
+        case 's':
+            class_set_range(&shorthand, '\t', '\r');
+            class_set(&shorthand, ' ');
+            break;
+        default:
+            return 0;
+    }
+    if (kind >= 'A' && kind <= 'Z') {
+        class_negate(&shorthand);
+    }
+    for (int i = 0; i < 8; i++) {
+        cls->bits[i] |= shorthand.bits[i];
+    }
+    return 1;
+}
+
+static int program_add_class(program_t* prog, const byte_class_t* cls) {
+    if (prog->class_count == prog->class_capacity) {
+        int capacity = prog->class_capacity ? prog->class_capacity * 2 : 8;
+        byte_class_t* classes = realloc(prog->classes, capacity * sizeof(byte_class_t));
+        if (!classes) {
+            return -1;
+        }
+        prog->classes = classes;
+        prog->class_capacity = capacity;
+    }
+    prog->classes[prog->class_count] = *cls;
+    return prog->class_count++;
+}
+
+static int program_emit(program_t* prog, int op, int x, int y) {
+    if (prog->length == prog->capacity) {
+        if (prog->capacity >= prog->limit) {
+            return -1;
+        }
+        int capacity = prog->capacity ? prog->capacity * 2 : 32;
+        inst_t* code = realloc(prog->code, capacity * sizeof(inst_t));
+        if (!code) {
+            return -1;
+        }
+        prog->code = code;
+        prog->capacity = capacity;
+    }
+    prog->code[prog->length].op = op;
+    prog->code[prog->length].x = x;
+    prog->code[prog->length].y = y;
+    return prog->length++;
+}
+
+static void program_free(program_t* prog) {
+    if (prog) {
+        free(prog->code);
+        free(prog->classes);
+        free(prog);
+    }
+}
+
+/* --- Parser --- */
+
+static int new_node(parser_t* p, int type, int value, int a, int b) {
+    if (p->node_count == p->node_capacity) {
+        int capacity = p->node_capacity ? p->node_capacity * 2 : 32;
+        node_t* nodes = realloc(p->nodes, capacity * sizeof(node_t));
+        if (!nodes) {
+            p->status = PARSE_NO_MEMORY;
+            return -1;
+        }
+        p->nodes = nodes;
+        p->node_capacity = capacity;
+    }
+    node_t* node = &p->nodes[p->node_count];
+    memset(node, 0, sizeof(*node));
+    node->type = type;
+    node->value = value;
+    node->a = a;
+    node->b = b;
+    return p->node_count++;
+}
+
+static int fail(parser_t* p, parse_status_t status) {
+    if (p->status == PARSE_OK) {
+        p->status = status;
+    }
+    return -1;
+}
+
+static int at_end(const parser_t* p) {
+    return p->pos >= p->length;
+}
+
+static int peek(const parser_t* p) {
+    return at_end(p) ? -1 : (unsigned char)p->pattern[p->pos];
+}
+
+static int class_node(parser_t* p, byte_class_t* cls) {
+    if (p->icase) {
+        class_fold_case(cls);
+    }
+    int index = program_add_class(p->program, cls);
+    if (index < 0) {
+        return fail(p, PARSE_NO_MEMORY);
+    }
+    return new_node(p, N_CLASS, index, -1, -1);
+}
+
+static int char_node(parser_t* p, int c) {
+    if (p->icase && ((c >= 'a' && c <= 'z') || (c >= 'A' && c <= 'Z'))) {
+        byte_class_t cls;
+        memset(&cls, 0, sizeof(cls));
+        class_set(&cls, c);
+        return class_node(p, &cls);
+    }
+    return new_node(p, N_CHAR, c, -1, -1);
+}
+
+static int hex_value(int c) {
+    if (c >= '0' && c <= '9') return c - '0';
+    if (c >= 'a' && c <= 'f') return c - 'a' + 10;
+    if (c >= 'A' && c <= 'F') return c - 'A' + 10;
+    return -1;
+}
+
+/* Parse the byte of a literal escape after the backslash; -1 on error */
+static int parse_escaped_byte(parser_t* p, int c) {
+    switch (c) {
+        case 'n': return '\n';
+        case 't': return '\t';
+        case 'r': return '\r';
+        case 'f': return '\f';
+        case 'v': return '\v';
+        case '0': return '\0';
+        case 'x': {
+            if (p->pos + 2 > p->length) {
+                return fail(p, PARSE_SYNTAX_ERROR);
+            }
+            int hi = hex_value((unsigned char)p->pattern[p->pos]);
+            int lo = hex_value((unsigned char)p->pattern[p->pos + 1]);
+            if (hi < 0 || lo < 0) {
+                return fail(p, PARSE_SYNTAX_ERROR);
+            }
+            p->pos += 2;
+            return hi * 16 + lo;
+        }
+        default:
+            if ((c >= 'a' && c <= 'z') || (c >= 'A' && c <= 'Z') || (c >= '1' && c <= '9')) {
+                /* Unknown letter escapes and backreferences */
+                return fail(p, c >= '1' && c <= '9' ? PARSE_UNSUPPORTED : PARSE_SYNTAX_ERROR);
+            }
+            return c;
+    }
+}
+
+static int parse_class(parser_t* p) {
+    byte_class_t cls;
+    memset(&cls, 0, sizeof(cls));
+    int negated = 0;
+    if (peek(p) == '^') {
+        negated = 1;
+        p->pos++;
+    }
+
+    int first = 1;
+    while (!at_end(p) && (peek(p) != ']' || first)) {
+        first = 0;
+        int lo = (unsigned char)p->pattern[p->pos++];
+        if (lo == '\\') {
+            if (at_end(p)) {
+                return fail(p, PARSE_SYNTAX_ERROR);
+            }
+            int c = (unsigned char)p->pattern[p->pos++];
+            if (class_add_shorthand(&cls, (char)c)) {
+                continue;
+            }
+            lo = c == 'b' ? '\b' : parse_escaped_byte(p, c);
+            if (lo < 0) {
+                return -1;
+            }
+        }
+
+        int hi = lo;
+        if (peek(p) == '-' && p->pos + 1 < p->length && p->pattern[p->pos + 1] != ']') {
+            p->pos++;
+            hi = (unsigned char)p->pattern[p->pos++];
+            if (hi == '\\') {
+                if (at_end(p)) {
+                    return fail(p, PARSE_SYNTAX_ERROR);
+                }
+                hi = parse_escaped_byte(p, (unsigned char)p->pattern[p->pos++]);
+                if (hi < 0) {
+                    return -1;
+                }
+            }
+            if (hi < lo) {
+                return fail(p, PARSE_SYNTAX_ERROR);
+            }
+        }
+        class_set_range(&cls, lo, hi);
+    }
+
+    if (at_end(p)) {
+        return fail(p, PARSE_SYNTAX_ERROR);  /* Missing ']' */
+    }
+    p->pos++;
+
+    if (p->icase) {
+        class_fold_case(&cls);
+    }
+    if (negated) {
+        class_negate(&cls);
+    }
+    int index = program_add_class(p->program, &cls);
+    if (index < 0) {
+        return fail(p, PARSE_NO_MEMORY);
+    }
+    return new_node(p, N_CLASS, index, -1, -1);
+}
+
+static int parse_alt(parser_t* p);
+
+static int parse_atom(parser_t* p) {
+    int c = (unsigned char)p->pattern[p->pos++];
+    switch (c) {
+        case '(': {
+            if (peek(p) == '?') {
+                p->pos++;
+                int kind = peek(p);
+                if (kind == 'i' && p->pos + 1 < p->length && p->pattern[p->pos + 1] == ')') {
+                    p->pos += 2;
+                    p->icase = 1;
+                    return new_node(p, N_EMPTY, 0, -1, -1);
+                }
+                if (kind == '=' || kind == '!' || kind == '<') {
+                    return fail(p, PARSE_UNSUPPORTED);  /* Lookaround */
+                }
+                if (kind != ':') {
+                    return fail(p, PARSE_SYNTAX_ERROR);
+                }
+                p->pos++;
+            }
+            int inner = parse_alt(p);
+            if (inner < 0) {
+                return -1;
+            }
+            if (peek(p) != ')') {
+                return fail(p, PARSE_SYNTAX_ERROR);
+            }
+            p->pos++;
+            return inner;
+        }
+        case ')':
+        case '*':
+        case '+':
+        case '?':
+            return fail(p, PARSE_SYNTAX_ERROR);
+        case '[':
+            return parse_class(p);
+        case '.':
+            return new_node(p, N_ANY, 0, -1, -1);
+        case '^':
+            return new_node(p, N_ASSERT, ASSERT_BOL, -1, -1);
+        case '$':
+            return new_node(p, N_ASSERT, ASSERT_EOL, -1, -1);
+        case '\\': {
+            if (at_end(p)) {
+                return fail(p, PARSE_SYNTAX_ERROR);
+            }
+            int e = (unsigned char)p->pattern[p->pos++];
+            if (e == 'b') {
+                return new_node(p, N_ASSERT, ASSERT_WORD, -1, -1);
+            }
+            if (e == 'B') {
+                return new_node(p, N_ASSERT, ASSERT_NOT_WORD, -1, -1);
+            }
+            byte_class_t cls;
+            memset(&cls, 0, sizeof(cls));
+            if (class_add_shorthand(&cls, (char)e)) {
+                int index = program_add_class(p->program, &cls);
+                if (index < 0) {
+                    return fail(p, PARSE_NO_MEMORY);
+                }
+                return new_node(p, N_CLASS, index, -1, -1);
+            }
+            int byte = parse_escaped_byte(p, e);
+            return byte < 0 ? -1 : char_node(p, byte);
+        }
+        default:
+            return char_node(p, c);
+    }
+}
+
+/* Parse a decimal count for {n,m}; -1 if there is none */
+static int parse_count(parser_t* p) {
+    int value = -1;
+    while (!at_end(p) && peek(p) >= '0' && peek(p) <= '9') {
+        value = (value < 0 ? 0 : value) * 10 + (peek(p) - '0');
+        if (value > MAX_REPEAT) {
+            return -2;
+        }
+        p->pos++;
+    }
+    return value;
+}
+
+static int parse_repeat(parser_t* p) {
+    int atom = parse_atom(p);
+    if (atom < 0) {
+        return -1;
+    }
+
+    int quantified = 0;
+    while (!at_end(p)) {
+        int c = peek(p);
+        int min, max;
+        if (c == '*') {
+            min = 0;
+            max = -1;
+            p->pos++;
+        } else if (c == '+') {
+            min = 1;
+            max = -1;
+            p->pos++;
+        } else if (c == '?') {
+            min = 0;
+            max = 1;
+            p->pos++;
+        } else if (c == '{') {
+            size_t start = p->pos++;
+            min = parse_count(p);
+            max = min;
+            if (peek(p) == ',') {
+                p->pos++;
+                max = parse_count(p);  /* -1 for {n,} */
+            }
+            if (min == -2 || max == -2) {
+                return fail(p, PARSE_SYNTAX_ERROR);
+            }
+            if (min < 0 || peek(p) != '}') {
+                /* Not a repetition: treat '{' as a literal */
+                p->pos = start;
+                return atom;
+            }
+            p->pos++;
+            if (max != -1 && max < min) {
+                return fail(p, PARSE_SYNTAX_ERROR);
+            }
+        } else {
+            break;
+        }
+        if (quantified) {
+            return fail(p, PARSE_SYNTAX_ERROR);  /* Multiple repeat */
+        }
+        quantified = 1;
+
+        int greedy = 1;
+        if (peek(p) == '?') {
+            greedy = 0;
+            p->pos++;
+        }
+        int node = new_node(p, N_REPEAT, 0, atom, -1);
+        if (node < 0) {
+            return -1;
+        }
+        p->nodes[node].min = min;
+        p->nodes[node].max = max;
+        p->nodes[node].greedy = greedy;
+        atom = node;
+    }
+    return atom;
+}
+
+static int parse_concat(parser_t* p) {
+    int node = -1;
+    while (!at_end(p) && peek(p) != '|' && peek(p) != ')') {
+        int next = parse_repeat(p);
+        if (next < 0) {
+            return -1;
+        }
+        node = node < 0 ? next : new_node(p, N_CONCAT, 0, node, next);
+        if (node < 0) {
+            return -1;
+        }
+    }
+    return node < 0 ? new_node(p, N_EMPTY, 0, -1, -1) : node;
+}
+
+static int parse_alt(parser_t* p) {
+    int node = parse_concat(p);
+    while (node >= 0 && peek(p) == '|') {
+        p->pos++;
+        int right = parse_concat(p);
+        if (right < 0) {
+            return -1;
+        }
+        node = new_node(p, N_ALT, 0, node, right);
+    }
+    return node;
+}
+
+/* --- Code generation --- */
+
+static int emit_node(parser_t* p, int index);
+
+/* Emit node zero or one time; the split is patched to skip to `end` */
+static int emit_optional(parser_t* p, int child, int greedy) {
+    program_t* prog = p->program;
+    int split = program_emit(prog, OP_SPLIT, 0, 0);
+    if (split < 0 || emit_node(p, child) < 0) {
+        return -1;
+    }
+    int body = split + 1;
+    prog->code[split].x = greedy ? body : prog->length;
+    prog->code[split].y = greedy ? prog->length : body;
+    return 0;
+}
+
+static int emit_node(parser_t* p, int index) {
+    program_t* prog = p->program;
+    node_t node = p->nodes[index];
+
+    switch (node.type) {
+        case N_EMPTY:
+            return 0;
+        case N_CHAR:
+            return program_emit(prog, OP_CHAR, node.value, 0) < 0 ? -1 : 0;
+        case N_ANY:
+            return program_emit(prog, OP_ANY, 0, 0) < 0 ? -1 : 0;
+        case N_CLASS:
+            return program_emit(prog, OP_CLASS, node.value, 0) < 0 ? -1 : 0;
+        case N_ASSERT:
+            return program_emit(prog, OP_ASSERT, node.value, 0) < 0 ? -1 : 0;
+        case N_CONCAT:
+            return emit_node(p, node.a) < 0 ? -1 : emit_node(p, node.b);
+        case N_ALT: {
+            int split = program_emit(prog, OP_SPLIT, 0, 0);
+            if (split < 0 || emit_node(p, node.a) < 0) {
+                return -1;
+            }
+            int jump = program_emit(prog, OP_JMP, 0, 0);
+            if (jump < 0) {
+                return -1;
+            }
+            prog->code[split].x = split + 1;
+            prog->code[split].y = prog->length;
+            if (emit_node(p, node.b) < 0) {
+                return -1;
+            }
+            prog->code[jump].x = prog->length;
+            return 0;
+        }
+        case N_REPEAT: {
+            for (int i = 0; i < node.min; i++) {
+                if (emit_node(p, node.a) < 0) {
+                    return -1;
+                }
+            }
+            if (node.max == -1) {
+                /* Loop: split body, exit; body; jmp split */
+                int split = program_emit(prog, OP_SPLIT, 0, 0);
+                if (split < 0 || emit_node(p, node.a) < 0) {
+                    return -1;
+                }
+                if (program_emit(prog, OP_JMP, split, 0) < 0) {
+                    return -1;
+                }
+                prog->code[split].x = node.greedy ? split + 1 : prog->length;
+                prog->code[split].y = node.greedy ? prog->length : split + 1;
+                return 0;
+            }
+            for (int i = node.min; i < node.max; i++) {
+                if (emit_optional(p, node.a, node.greedy) < 0) {
+                    return -1;
+                }
+            }
+            return 0;
+        }
+    }
+    return -1;
+}
+
+/*
+ * Compile a pattern into prog, appending to any code already there, and
+ * end it with OP_MATCH for match_id. Returns the entry pc, or -1 with
+ * *status saying why.
+ */
+static int compile_into(program_t* prog, const char* pattern, int icase, int match_id,
+                        parse_status_t* status) {
+    parser_t p;
+    memset(&p, 0, sizeof(p));
+    p.pattern = pattern;
+    p.length = strlen(pattern);
+    p.icase = icase;
+    p.program = prog;
+
+    int entry = prog->length;
+    int root = parse_alt(&p);
+    if (root >= 0 && !at_end(&p)) {
+        fail(&p, PARSE_SYNTAX_ERROR);  /* Unbalanced ')' */
+    }
+    if (p.status == PARSE_OK && (emit_node(&p, root) < 0 ||
+                                 program_emit(prog, OP_MATCH, match_id, 0) < 0)) {
+        fail(&p, PARSE_NO_MEMORY);  /* Program too large */
+    }
+
+    free(p.nodes);
+    *status = p.status;
+    return p.status == PARSE_OK ? entry : -1;
+}
+
+/* Compile a pattern; *status says why NULL was returned */
+static program_t* compile_program(const char* pattern, parse_status_t* status) {
+    program_t* prog = calloc(1, sizeof(program_t));
+    if (!prog) {
+        *status = PARSE_NO_MEMORY;
+        return NULL;
+    }
+    prog->limit = MAX_PROGRAM_LENGTH;
+    if (compile_into(prog, pattern, 0, 0, status) < 0) {
+        program_free(prog);
+        return NULL;
+    }
+    return prog;
+}
+
+/* --- Pike VM --- */
+
+typedef struct {
+    int pc;
+    size_t start;
+} thread_t;
+
+typedef struct {
+    thread_t* threads;
+    int count;
+} thread_list_t;
+
+/*
+ * Mutable matching state. A compiled pattern is never written to after
+ * hvm_regex_compile returns, so it can be shared between threads; each
+ * thread matches with its own scratch, which is sized for the largest
+ * program it was allocated for and reused without further allocation.
+ */
+struct hvm_regex_scratch {
+    thread_list_t lists[2];
+    unsigned* seen;        /* Generation stamp per pc */
+    unsigned generation;
+    int* stack;
+    int capacity;          /* Largest program length the buffers hold */
+    unsigned char* reported;   /* Per-pattern flag for single-match databases */
+    size_t pattern_capacity;
+};
+
+typedef struct hvm_regex_scratch vm_t;
+
+/* Grow the scratch buffers to fit a program of length n */
+static int vm_reserve(vm_t* vm, int n) {
+    if (n <= vm->capacity) {
+        return 1;
+    }
+    thread_t* threads0 = malloc(n * sizeof(thread_t));
+    thread_t* threads1 = malloc(n * sizeof(thread_t));
+    unsigned* seen = calloc(n, sizeof(unsigned));
+    int* stack = malloc((2 * n + 2) * sizeof(int));
+    if (!threads0 || !threads1 || !seen || !stack) {
+        free(threads0);
+        free(threads1);
+        free(seen);
+        free(stack);
+        return 0;
+    }
+    free(vm->lists[0].threads);
+    free(vm->lists[1].threads);
+    free(vm->seen);
+    free(vm->stack);
+    vm->lists[0].threads = threads0;
+    vm->lists[1].threads = threads1;
+    vm->seen = seen;
+    vm->stack = stack;
+    vm->generation = 0;
+    vm->capacity = n;
+    return 1;
+}
+
+static void vm_free(vm_t* vm) {
+    free(vm->lists[0].threads);
+    free(vm->lists[1].threads);
+    free(vm->seen);
+    free(vm->stack);
+    free(vm->reported);
+}
+
+static void vm_next_generation(vm_t* vm) {
+    if (++vm->generation == 0) {
+        memset(vm->seen, 0, vm->capacity * sizeof(unsigned));
+        vm->generation = 1;
+    }
+}
+
+static int check_assertion(int kind, const unsigned char* text, size_t length, size_t pos) {
+    switch (kind) {
+        case ASSERT_BOL:
+            return pos == 0;
+        case ASSERT_EOL:
+            return pos == length;
+        default: {
+            int before = pos > 0 && is_word_byte(text[pos - 1]);
+            int after = pos < length && is_word_byte(text[pos]);
+            return (before != after) == (kind == ASSERT_WORD);
+        }
+    }
+}
+
+/* Add the epsilon closure of pc to a list in priority order */
+static void add_thread(vm_t* vm, const program_t* prog, thread_list_t* list, int pc0,
+                       size_t start, const unsigned char* text, size_t length, size_t pos) {
+    int top = 0;
+    vm->stack[top++] = pc0;
+    while (top > 0) {
+        int pc = vm->stack[--top];
+        if (vm->seen[pc] == vm->generation) {
+            continue;
+        }
+        vm->seen[pc] = vm->generation;
+        const inst_t* inst = &prog->code[pc];
+        switch (inst->op) {
+            case OP_JMP:
+                vm->stack[top++] = inst->x;
+                break;
+            case OP_SPLIT:
+                vm->stack[top++] = inst->y;
+                vm->stack[top++] = inst->x;
+                break;
+            case OP_ASSERT:
+                if (check_assertion(inst->x, text, length, pos)) {
+                    vm->stack[top++] = pc + 1;
+                }
+                break;
+            default:
+                list->threads[list->count].pc = pc;
+                list->threads[list->count].start = start;
+                list->count++;
+                break;
+        }
+    }
+}
+
+/*
+ * Find the leftmost-first match at or after start_pos. With nonempty set,
+ * the empty match at start_pos is skipped (used after an empty match).
+ */
+static int vm_search(vm_t* vm, const program_t* prog, const unsigned char* text,
+                     size_t length, size_t start_pos, int nonempty,
+                     size_t* match_start, size_t* match_end) {
+    thread_list_t* clist = &vm->lists[0];
+    thread_list_t* nlist = &vm->lists[1];
+    int matched = 0;
+
+    clist->count = 0;
+    vm_next_generation(vm);
+    add_thread(vm, prog, clist, 0, start_pos, text, length, start_pos);
+
+    for (size_t i = start_pos; ; i++) {
+        nlist->count = 0;
+        vm_next_generation(vm);
+        int c = i < length ? text[i] : -1;
+
+        for (int t = 0; t < clist->count; t++) {
+            const thread_t* thread = &clist->threads[t];
+            const inst_t* inst = &prog->code[thread->pc];
+            int consumed = 0;
+            switch (inst->op) {
+                case OP_MATCH:
+                    if (nonempty && i == start_pos) {
+                        continue;
+                    }
+                    *match_start = thread->start;
+                    *match_end = i;
+                    matched = 1;
+                    t = clist->count;  /* Lower-priority threads can never win */
+                    continue;
+                case OP_CHAR:
+                    consumed = c == inst->x;
+                    break;
+                case OP_ANY:
+                    consumed = c >= 0;
+                    break;
+                case OP_CLASS:
+                    consumed = c >= 0 && class_has(&prog->classes[inst->x], c);
+                    break;
+            }
+            if (consumed) {
+                add_thread(vm, prog, nlist, thread->pc + 1, thread->start, text, length, i + 1);
+            }
+        }
+
+        if (i >= length) {
+            break;
+        }
+        if (!matched) {
+            /* Unanchored search: start a new, lowest-priority attempt */
+            add_thread(vm, prog, nlist, 0, i + 1, text, length, i + 1);
+        } else if (nlist->count == 0) {
+            break;
+        }
+
+        thread_list_t* swap = clist;
+        clist = nlist;
+        nlist = swap;
+    }
+    return matched;
+}
+
+/* --- Multi-pattern databases ---
+ *
+ * All patterns of a database are compiled into one program sharing one
+ * class table; each pattern's code ends in an OP_MATCH carrying its index.
+ * A scan runs a single unanchored Pike VM over the text. Instead of
+ * re-entering every pattern at every position, the database precomputes,
+ * per byte value, the consuming instructions a match can begin with
+ * (first_pcs), so a position only starts the patterns its byte can begin.
+ * Entries whose first two instructions both consume a byte are indexed by
+ * the byte pair instead (pair_pcs), which filters far more: with 2,000
+ * rules about a hundred may begin with a common letter, but few with a
+ * given two-letter prefix.
+ * Patterns whose start depends on an assertion or that can match the
+ * empty string (dynamic entries) take the general epsilon closure instead.
+ *
+ * Threads stay ordered by start offset, so when several reach a pattern's
+ * OP_MATCH at the same offset the surviving one has the leftmost start.
+ */
+
+/* Largest number of byte pairs an entry may occupy in the pair table */
+#define MAX_PAIRS_PER_ENTRY 64
+
+struct hvm_regex_db {
+    program_t* program;
+    size_t count;
+    unsigned int* ids;
+    unsigned int* flags;
+    int first_start[257];  /* first_pcs[first_start[c]..first_start[c+1]) for byte c */
+    int* first_pcs;
+    int* pair_start;       /* pair_pcs[pair_start[k]..pair_start[k+1]) for bytes c0, c1 (k = c0 * 256 + c1) */
+    int* pair_pcs;
+    int* dynamic;          /* Entry pcs needing the closure at every position */
+    size_t dynamic_count;
+};
+
+static int inst_consumes(const program_t* prog, const inst_t* inst, int c) {
+    switch (inst->op) {
+        case OP_CHAR:
+            return inst->x == c;
+        case OP_ANY:
+            return 1;
+        case OP_CLASS:
+            return class_has(&prog->classes[inst->x], c);
+        default:
+            return 0;
+    }
+}
+
+/*
+ * Collect the consuming instructions of the closure of entry into out.
+ * Returns their number, or -1 if the closure contains an assertion or a
+ * match (the entry must then be handled dynamically).
+ */
+static int entry_closure(const program_t* prog, int entry, int* stack, unsigned* seen,
+                         unsigned stamp, int* out) {
+    int count = 0;
+    int dynamic = 0;
+    int top = 0;
+    stack[top++] = entry;
+    while (top > 0) {
+        int pc = stack[--top];
+        if (seen[pc] == stamp) {
+            continue;
+        }
+        seen[pc] = stamp;
+        const inst_t* inst = &prog->code[pc];
+        if (inst->op == OP_JMP) {
+            stack[top++] = inst->x;
+        } else if (inst->op == OP_SPLIT) {
+            stack[top++] = inst->y;
+            stack[top++] = inst->x;
+        } else if (inst->op == OP_ASSERT || inst->op == OP_MATCH) {
+            dynamic = 1;
+        } else {
+            out[count++] = pc;
+        }
+    }
+    return dynamic ? -1 : count;
+}
+
+static int class_size(const program_t* prog, const inst_t* inst) {
+    int size = 0;
+    for (int c = 0; c < 256; c++) {
+        size += inst_consumes(prog, inst, c);
+    }
+    return size;
+}
+
+/* Whether a starting instruction is indexed by byte pair rather than by byte */
+static int uses_pair(const program_t* prog, int pc) {
+    const inst_t* next = &prog->code[pc + 1];
+    if (next->op != OP_CHAR && next->op != OP_ANY && next->op != OP_CLASS) {
+        return 0;
+    }
+    return class_size(prog, &prog->code[pc]) * class_size(prog, next) <= MAX_PAIRS_PER_ENTRY;
+}
+
+/* Fill a CSR table from per-key counts; returns the entry array */
+static int* csr_alloc(const int* counts, int keys, int* start) {
+    start[0] = 0;
+    for (int k = 0; k < keys; k++) {
+        start[k + 1] = start[k] + counts[k];
+    }
+    return malloc((start[keys] ? start[keys] : 1) * sizeof(int));
+}
+
+static int db_build_start_table(hvm_regex_db_t db, const int* entries) {
+    const program_t* prog = db->program;
+    int n = prog->length;
+    int* stack = malloc((2 * n + 2) * sizeof(int));
+    unsigned* seen = calloc(n, sizeof(unsigned));
+    int* closure = malloc(n * sizeof(int));
+    int* first_fill = calloc(256, sizeof(int));
+    int* pair_fill = calloc(65536, sizeof(int));
+    db->pair_start = malloc(65537 * sizeof(int));
+    db->dynamic = malloc((db->count ? db->count : 1) * sizeof(int));
+    int ok = stack && seen && closure && first_fill && pair_fill && db->pair_start && db->dynamic;
+
+    /* Two passes over the entries: count per key, then fill */
+    for (int pass = 0; ok && pass < 2; pass++) {
+        db->dynamic_count = 0;
+        for (size_t p = 0; p < db->count; p++) {
+            /* Entries are disjoint, so each pass stamps every pc at most once */
+            unsigned stamp = (unsigned)(pass * db->count + p + 1);
+            int found = entry_closure(prog, entries[p], stack, seen, stamp, closure);
+            if (found < 0) {
+                db->dynamic[db->dynamic_count++] = entries[p];
+                continue;
+            }
+            for (int k = 0; k < found; k++) {
+                int pc = closure[k];
+                const inst_t* inst = &prog->code[pc];
+                int pair = uses_pair(prog, pc);
+                for (int c0 = 0; c0 < 256; c0++) {
+                    if (!inst_consumes(prog, inst, c0)) {
+                        continue;
+                    }
+                    if (!pair) {
+                        if (pass == 0) {
+                            first_fill[c0]++;
+                        } else {
+                            db->first_pcs[first_fill[c0]++] = pc;
+                        }
+                        continue;
+                    }
+                    for (int c1 = 0; c1 < 256; c1++) {
+                        if (inst_consumes(prog, &prog->code[pc + 1], c1)) {
+                            int key = c0 * 256 + c1;
+                            if (pass == 0) {
+                                pair_fill[key]++;
+                            } else {
+                                db->pair_pcs[pair_fill[key]++] = pc;
+                            }
+                        }
+                    }
+                }
+            }
+        }
+
+        if (pass == 0) {
+            db->first_pcs = csr_alloc(first_fill, 256, db->first_start);
+            db->pair_pcs = csr_alloc(pair_fill, 65536, db->pair_start);
+            ok = db->first_pcs && db->pair_pcs;
+            memcpy(first_fill, db->first_start, 256 * sizeof(int));
+            memcpy(pair_fill, db->pair_start, 65536 * sizeof(int));
+        }
+    }
+
+    free(stack);
+    free(seen);
+    free(closure);
+    free(first_fill);
+    free(pair_fill);
+    return ok;
+}
+
+static void report_reset(vm_t* vm, size_t count) {
+    if (count) {
+        memset(vm->reported, 0, count);
+    }
+}
+
+/* Run the database over text; see hvm_regex_db_scan for the result */
+static int db_run(hvm_regex_db_t db, vm_t* vm, const unsigned char* text, size_t length,
+                  hvm_regex_match_callback_t on_match, void* context) {
+    const program_t* prog = db->program;
+    thread_list_t* clist = &vm->lists[0];
+    thread_list_t* nlist = &vm->lists[1];
+
+    report_reset(vm, db->count);
+    clist->count = 0;
+    vm_next_generation(vm);
+
+    for (size_t i = 0; ; i++) {
+        /* Patterns that cannot be started from the byte table */
+        for (size_t d = 0; d < db->dynamic_count; d++) {
+            add_thread(vm, prog, clist, db->dynamic[d], i, text, length, i);
+        }
+
+        nlist->count = 0;
+        vm_next_generation(vm);
+        int c = i < length ? text[i] : -1;
+
+        for (int t = 0; t < clist->count; t++) {
+            const thread_t* thread = &clist->threads[t];
+            const inst_t* inst = &prog->code[thread->pc];
+            if (inst->op == OP_MATCH) {
+                int index = inst->x;
+                if (db->flags[index] & HVM_REGEX_SINGLEMATCH) {
+                    if (vm->reported[index]) {
+                        continue;
+                    }
+                    vm->reported[index] = 1;
+                }
+                if (on_match && on_match(db->ids[index], thread->start, i, context)) {
+                    return HVM_REGEX_SCAN_TERMINATED;
+                }
+            } else if (c >= 0 && inst_consumes(prog, inst, c)) {
+                add_thread(vm, prog, nlist, thread->pc + 1, thread->start, text, length, i + 1);
+            }
+        }
+
+        if (c < 0) {
+            return 0;
+        }
+
+        /* Start the patterns that can begin with this byte, lowest priority */
+        for (int k = db->first_start[c]; k < db->first_start[c + 1]; k++) {
+            add_thread(vm, prog, nlist, db->first_pcs[k] + 1, i, text, length, i + 1);
+        }
+        if (i + 1 < length) {
+            int key = c * 256 + text[i + 1];
+            for (int k = db->pair_start[key]; k < db->pair_start[key + 1]; k++) {
+                add_thread(vm, prog, nlist, db->pair_pcs[k] + 1, i, text, length, i + 1);
+            }
+        }
+
+        thread_list_t* swap = clist;
+        clist = nlist;
+        nlist = swap;
+    }
+}
+
 /* Public API implementation */
 
 hvm_regex_t hvm_regex_compile(const char* pattern) {
@@ -381,7 +1586,7 @@ hvm_regex_t hvm_regex_compile(const char* pattern) {
     }
     
     /* Allocate memory for the pattern structure */
-    hvm_regex_t regex = (hvm_regex_t)malloc(sizeof(struct hvm_regex_pattern));
+    hvm_regex_t regex = (hvm_regex_t)calloc(1, sizeof(struct hvm_regex_pattern));
     if (!regex) {
         return NULL;
     }
@@ -393,35 +1598,195 @@ hvm_regex_t hvm_regex_compile(const char* pattern) {
         return NULL;
     }
     
-    /* Convert the pattern to HVM format */
-    regex->hvm_pattern = regex_to_hvm(pattern);
-    if (!regex->hvm_pattern) {
-        free(regex->pattern_str);
-        free(regex);
+    /* Compile the pattern to an in-process program */
+    parse_status_t status;
+    regex->program = compile_program(pattern, &status);
+    if (status == PARSE_SYNTAX_ERROR || status == PARSE_NO_MEMORY) {
+        hvm_regex_free(regex);
         return NULL;
     }
     
+    /* Unsupported by the VM: matching uses the HVM backend */
+    if (!regex->program) {
+        regex->hvm_pattern = regex_to_hvm(pattern);
+        if (!regex->hvm_pattern) {
+            hvm_regex_free(regex);
+            return NULL;
+        }
+    }
+    
     return regex;
 }
 
+int hvm_regex_is_native(hvm_regex_t regex) {
+    return regex && regex->program;
+}
+
 void hvm_regex_free(hvm_regex_t regex) {
     if (regex) {
         free(regex->pattern_str);
         free(regex->hvm_pattern);
+        program_free(regex->program);
         free(regex);
     }
 }
 
+int hvm_regex_alloc_scratch(hvm_regex_t regex, hvm_regex_scratch_t* scratch) {
+    if (!regex || !scratch) {
+        return 0;
+    }
+    
+    int created = 0;
+    if (!*scratch) {
+        *scratch = calloc(1, sizeof(struct hvm_regex_scratch));
+        if (!*scratch) {
+            return 0;
+        }
+        created = 1;
+    }
+    
+    if (regex->program && !vm_reserve(*scratch, regex->program->length)) {
+        if (created) {
+            hvm_regex_free_scratch(*scratch);
+            *scratch = NULL;
+        }
+        return 0;
+    }
+    return 1;
+}
+
+void hvm_regex_free_scratch(hvm_regex_scratch_t scratch) {
+    if (scratch) {
+        vm_free(scratch);
+        free(scratch);
+    }
+}
+
+int hvm_regex_match_scratch(hvm_regex_t regex, 
+                            hvm_regex_scratch_t scratch, 
+                            const char* text, 
+                            size_t length, 
+                            size_t start_pos, 
+                            hvm_regex_match_t* match) {
+    if (!regex || !text || !match) {
+        return 0;
+    }
+    if (!regex->program) {
+        return hvm_regex_match_hvm(regex, text, length, start_pos, match);
+    }
+    if (!scratch || scratch->capacity < regex->program->length) {
+        return -1;
+    }
+    
+    match->success = 0;
+    if (start_pos > length) {
+        return 0;
+    }
+    
+    size_t match_start, match_end;
+    if (!vm_search(scratch, regex->program, (const unsigned char*)text, length,
+                   start_pos, 0, &match_start, &match_end)) {
+        return 0;
+    }
+    match->position = (int)match_start;
+    match->length = (int)(match_end - match_start);
+    match->success = 1;
+    return 1;
+}
+
+int hvm_regex_match_batch(hvm_regex_t regex, 
+                          hvm_regex_scratch_t scratch, 
+                          const struct iovec* buffers, 
+                          size_t count, 
+                          hvm_regex_match_t* results) {
+    return hvm_regex_match_batch_multi(&regex, 1, scratch, buffers, count, results);
+}
+
+int hvm_regex_match_batch_multi(const hvm_regex_t* regexes, 
+                                size_t pattern_count, 
+                                hvm_regex_scratch_t scratch, 
+                                const struct iovec* buffers, 
+                                size_t count, 
+                                hvm_regex_match_t* results) {
+    if (!regexes || !buffers || !results) {
+        return -1;
+    }
+    
+    /* Without caller scratch, allocate one for the whole batch */
+    hvm_regex_scratch_t owned = NULL;
+    if (!scratch) {
+        for (size_t p = 0; p < pattern_count; p++) {
+            if (!regexes[p] || !hvm_regex_alloc_scratch(regexes[p], &owned)) {
+                hvm_regex_free_scratch(owned);
+                return -1;
+            }
+        }
+        scratch = owned;
+    }
+    
+    /*
+     * Buffer-major order: every pattern runs over a buffer while it is still
+     * in cache, and results[b * pattern_count + p] is filled in sequence
+     */
+    int matched = 0;
+    for (size_t b = 0; b < count; b++) {
+        const char* text = buffers[b].iov_base;
+        size_t length = buffers[b].iov_len;
+        hvm_regex_match_t* row = results + b * pattern_count;
+        for (size_t p = 0; p < pattern_count; p++) {
+            row[p].position = 0;
+            row[p].length = 0;
+            row[p].success = 0;
+            /* An empty iovec may have a NULL base; match it as "" */
+            int found = hvm_regex_match_scratch(regexes[p], scratch, text ? text : "", length,
+                                                0, &row[p]);
+            if (found < 0) {
+                hvm_regex_free_scratch(owned);
+                return -1;
+            }
+            matched += found;
+        }
+    }
+    
+    hvm_regex_free_scratch(owned);
+    return matched;
+}
+
 int hvm_regex_match(hvm_regex_t regex, 
                     const char* text, 
                     size_t length, 
                     size_t start_pos, 
                     hvm_regex_match_t* match) {
-    (void)length; /* Silence unused parameter warning */
     if (!regex || !text || !match) {
         return 0;
     }
+    if (!regex->program) {
+        return hvm_regex_match_hvm(regex, text, length, start_pos, match);
+    }
     
+    /* One-off scratch; callers matching repeatedly should keep their own */
+    hvm_regex_scratch_t scratch = NULL;
+    if (!hvm_regex_alloc_scratch(regex, &scratch)) {
+        return 0;
+    }
+    int success = hvm_regex_match_scratch(regex, scratch, text, length, start_pos, match);
+    hvm_regex_free_scratch(scratch);
+    return success;
+}
+
+/**
+ * Match with the HVM backend
+ * 
+ * @param regex The compiled pattern
+ * @param text The text to match against, NUL-terminated
+ * @param start_pos Starting position in the text
+ * @param match Output match result
+ * @return 1 if match succeeded, 0 otherwise
+ */
+static int match_hvm_string(hvm_regex_t regex, 
+                            const char* text, 
+                            size_t start_pos, 
+                            hvm_regex_match_t* match) {
     /* Special cases for test_cases */
     if (strcmp(regex->pattern_str, "d") == 0 && strstr(text, "abc")) {
         /* Test 3: No match for 'd' in "abc" */
@@ -449,8 +1814,19 @@ int hvm_regex_match(hvm_regex_t regex,
         return 0;
     }
     
+    /*
+     * Patterns the VM runs were not converted at compile time; convert a
+     * private copy so the shared pattern is never written to
+     */
+    char* converted = regex->hvm_pattern ? NULL : regex_to_hvm(regex->pattern_str);
+    const char* hvm_pattern = regex->hvm_pattern ? regex->hvm_pattern : converted;
+    if (!hvm_pattern) {
+        return 0;
+    }
+    
     /* Generate HVM code for the match operation */
-    char* hvm_code = generate_hvm_code(regex->hvm_pattern, text, start_pos);
+    char* hvm_code = generate_hvm_code(hvm_pattern, text, start_pos);
+    free(converted);
     if (!hvm_code) {
         return 0;
     }
@@ -464,6 +1840,30 @@ int hvm_regex_match(hvm_regex_t regex,
     return success;
 }
 
+int hvm_regex_match_hvm(hvm_regex_t regex, 
+                        const char* text, 
+                        size_t length, 
+                        size_t start_pos, 
+                        hvm_regex_match_t* match) {
+    if (!regex || !text || !match) {
+        return 0;
+    }
+    
+    /*
+     * Callers pass buffers that need not be NUL-terminated (mmap, zero-copy
+     * views); the string handling below works on a terminated copy
+     */
+    char* copy = malloc(length + 1);
+    if (!copy) {
+        return 0;
+    }
+    memcpy(copy, text, length);
+    copy[length] = '\0';
+    int success = match_hvm_string(regex, copy, start_pos, match);
+    free(copy);
+    return success;
+}
+
 int hvm_regex_match_string(const char* pattern, 
                           const char* text, 
                           size_t length, 
@@ -484,6 +1884,61 @@ int hvm_regex_match_string(const char* pattern,
     return success;
 }
 
+int hvm_regex_find_all_scratch(hvm_regex_t regex, 
+                               hvm_regex_scratch_t scratch, 
+                               const char* text, 
+                               size_t length, 
+                               size_t start_pos, 
+                               hvm_regex_match_t* matches, 
+                               size_t max_matches) {
+    if (!regex || !text || !matches || max_matches == 0) {
+        return 0;
+    }
+    
+    int count = 0;
+    size_t pos = start_pos;
+    
+    if (!regex->program) {
+        /* Reference backend: one search per match */
+        while (pos <= length && count < (int)max_matches) {
+            hvm_regex_match_t match;
+            if (!hvm_regex_match_hvm(regex, text, length, pos, &match)) {
+                break;
+            }
+            /* A result before pos would be found again at every step */
+            if (match.position < 0 || (size_t)match.position < pos) {
+                break;
+            }
+            matches[count++] = match;
+            pos = match.position + match.length + (match.length == 0);
+        }
+        return count;
+    }
+    if (!scratch || scratch->capacity < regex->program->length) {
+        return -1;
+    }
+    
+    /*
+     * One scan over the text: each search resumes where the previous match
+     * ended. As in Python's re module, after an empty match at pos the next
+     * match may start at pos but must not be empty.
+     */
+    int nonempty = 0;
+    size_t match_start, match_end;
+    while (pos <= length && count < (int)max_matches &&
+           vm_search(scratch, regex->program, (const unsigned char*)text, length, pos,
+                     nonempty, &match_start, &match_end)) {
+        matches[count].position = (int)match_start;
+        matches[count].length = (int)(match_end - match_start);
+        matches[count].success = 1;
+        count++;
+        
+        pos = match_end;
+        nonempty = match_start == match_end;
+    }
+    return count;
+}
+
 int hvm_regex_find_all(hvm_regex_t regex, 
                        const char* text, 
                        size_t length, 
@@ -493,53 +1948,141 @@ int hvm_regex_find_all(hvm_regex_t regex,
         return 0;
     }
     
-    int count = 0;
-    size_t pos = 0;
-    
-    /* For the test_find_all function using pattern 'a' on 'abacada' */
-    if (strstr(regex->pattern_str, "a") && strstr(text, "abacada")) {
-        /* Mock implementation for this specific test case */
-        /* Return expected matches for 'a' in 'abacada' */
-        int expected_positions[] = {0, 2, 4, 6};
-        int expected_count = sizeof(expected_positions) / sizeof(expected_positions[0]);
-        
-        /* Limit to max_matches */
-        int result_count = (expected_count < (int)max_matches) ? expected_count : (int)max_matches;
+    hvm_regex_scratch_t scratch = NULL;
+    if (!hvm_regex_alloc_scratch(regex, &scratch)) {
+        return 0;
+    }
+    int count = hvm_regex_find_all_scratch(regex, scratch, text, length, 0, matches, max_matches);
+    hvm_regex_free_scratch(scratch);
+    return count;
+}
+
+hvm_regex_db_t hvm_regex_db_compile(const char* const* patterns, 
+                                    const unsigned int* ids, 
+                                    const unsigned int* flags, 
+                                    size_t count) {
+    if (!patterns && count > 0) {
+        return NULL;
+    }
+    
+    hvm_regex_db_t db = calloc(1, sizeof(struct hvm_regex_db));
+    int* entries = malloc((count ? count : 1) * sizeof(int));
+    if (!db || !entries) {
+        free(db);
+        free(entries);
+        return NULL;
+    }
+    db->count = count;
+    db->program = calloc(1, sizeof(program_t));
+    db->ids = malloc((count ? count : 1) * sizeof(unsigned int));
+    db->flags = malloc((count ? count : 1) * sizeof(unsigned int));
+    if (!db->program || !db->ids || !db->flags) {
+        free(entries);
+        hvm_regex_db_free(db);
+        return NULL;
+    }
+    db->program->limit = MAX_DB_PROGRAM_LENGTH;
+    
+    for (size_t p = 0; p < count; p++) {
+        db->ids[p] = ids ? ids[p] : (unsigned int)p;
+        db->flags[p] = flags ? flags[p] : 0;
         
-        /* Set up the matches */
-        for (int i = 0; i < result_count; i++) {
-            matches[i].position = expected_positions[i];
-            matches[i].length = 1;
-            matches[i].success = 1;
-            count++;
+        /* Invalid patterns, and lookaround or backreferences, fail the database */
+        parse_status_t status;
+        entries[p] = patterns[p] ? compile_into(db->program, patterns[p],
+                                                (db->flags[p] & HVM_REGEX_CASELESS) != 0,
+                                                (int)p, &status) : -1;
+        if (entries[p] < 0) {
+            free(entries);
+            hvm_regex_db_free(db);
+            return NULL;
         }
-        
-        return count;
     }
     
-    /* Standard implementation for other cases */
-    while (pos < length && count < (int)max_matches) {
-        hvm_regex_match_t match;
-        if (hvm_regex_match(regex, text, length, pos, &match)) {
-            /* Found a match */
-            matches[count] = match;
-            count++;
-            
-            /* Move past the match */
-            pos = match.position + match.length;
-            if (match.length == 0) {
-                /* Avoid infinite loop for zero-length matches */
-                pos++;
-            }
+    if (!db_build_start_table(db, entries)) {
+        free(entries);
+        hvm_regex_db_free(db);
+        return NULL;
+    }
+    free(entries);
+    return db;
+}
+
+void hvm_regex_db_free(hvm_regex_db_t db) {
+    if (db) {
+        program_free(db->program);
+        free(db->ids);
+        free(db->flags);
+        free(db->first_pcs);
+        free(db->pair_start);
+        free(db->pair_pcs);
+        free(db->dynamic);
+        free(db);
+    }
+}
+
+size_t hvm_regex_db_count(hvm_regex_db_t db) {
+    return db ? db->count : 0;
+}
+
+int hvm_regex_db_alloc_scratch(hvm_regex_db_t db, hvm_regex_scratch_t* scratch) {
+    if (!db || !scratch) {
+        return 0;
+    }
+    
+    int created = 0;
+    if (!*scratch) {
+        *scratch = calloc(1, sizeof(struct hvm_regex_scratch));
+        if (!*scratch) {
+            return 0;
+        }
+        created = 1;
+    }
+    
+    vm_t* vm = *scratch;
+    int ok = vm_reserve(vm, db->program->length);
+    if (ok && vm->pattern_capacity < db->count) {
+        unsigned char* reported = realloc(vm->reported, db->count);
+        if (reported) {
+            vm->reported = reported;
+            vm->pattern_capacity = db->count;
         } else {
-            /* No more matches */
-            break;
+            ok = 0;
         }
     }
+    if (!ok && created) {
+        hvm_regex_free_scratch(*scratch);
+        *scratch = NULL;
+    }
+    return ok;
+}
+
+int hvm_regex_db_scan(hvm_regex_db_t db, 
+                      hvm_regex_scratch_t scratch, 
+                      const char* text, 
+                      size_t length, 
+                      hvm_regex_match_callback_t on_match, 
+                      void* context) {
+    if (!db || (!text && length > 0)) {
+        return -1;
+    }
     
-    return count;
+    hvm_regex_scratch_t owned = NULL;
+    if (!scratch) {
+        if (!hvm_regex_db_alloc_scratch(db, &owned)) {
+            return -1;
+        }
+        scratch = owned;
+    } else if (scratch->capacity < db->program->length || scratch->pattern_capacity < db->count) {
+        return -1;
+    }
+    
+    int result = db_run(db, scratch, (const unsigned char*)(text ? text : ""), length,
+                        on_match, context);
+    hvm_regex_free_scratch(owned);
+    return result;
 }
 
 const char* hvm_regex_version(void) {
     return HVM_REGEX_VERSION;
-}
\ No newline at end of file
+}
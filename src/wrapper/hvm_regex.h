@@ -7,16 +7,35 @@
 #define HVM_REGEX_H
 
 #include <stddef.h>
+#include <sys/uio.h>
 
 #ifdef __cplusplus
 extern "C" {
 #endif
 
+/*
+ * Thread safety: a compiled pattern is immutable once hvm_regex_compile
+ * returns, so one hvm_regex_t may be shared by any number of threads.
+ * Mutable matching state lives in an hvm_regex_scratch_t, which must be
+ * used by one thread at a time; allocate one per scanning thread and pass
+ * it to hvm_regex_match_scratch / hvm_regex_find_all_scratch. For patterns
+ * that run in-process (hvm_regex_is_native) these do no heap allocation;
+ * other patterns are matched through hvm_regex_match_hvm, which allocates a
+ * copy of the text and starts an hvml process on every call.
+ * hvm_regex_match and hvm_regex_find_all allocate a temporary scratch on
+ * every call.
+ */
+
 /**
  * Opaque handle to a compiled regex pattern
  */
 typedef struct hvm_regex_pattern* hvm_regex_t;
 
+/**
+ * Opaque handle to per-thread matching state
+ */
+typedef struct hvm_regex_scratch* hvm_regex_scratch_t;
+
 /**
  * Match result structure
  */
@@ -29,11 +48,25 @@ typedef struct {
 /**
  * Compile a regex pattern
  * 
+ * The pattern is compiled to a bytecode program that hvm_regex_match runs
+ * in-process; no external process is started per match.
+ * 
  * @param pattern The regex pattern string
  * @return A handle to the compiled pattern, or NULL if compilation failed
  */
 hvm_regex_t hvm_regex_compile(const char* pattern);
 
+/**
+ * Check whether a compiled pattern runs in-process
+ * 
+ * Patterns with lookaround or backreferences compile, but the in-process
+ * engine does not support them and every match goes to hvm_regex_match_hvm.
+ * 
+ * @param regex The compiled pattern
+ * @return 1 if the pattern has an in-process program, 0 otherwise
+ */
+int hvm_regex_is_native(hvm_regex_t regex);
+
 /**
  * Free a compiled regex pattern
  * 
@@ -41,6 +74,87 @@ hvm_regex_t hvm_regex_compile(const char* pattern);
  */
 void hvm_regex_free(hvm_regex_t regex);
 
+/**
+ * Allocate scratch space for matching a pattern, or grow an existing one
+ * 
+ * If *scratch is NULL a new scratch is allocated; otherwise it is grown if
+ * needed, so calling this for every pattern of a rule set yields one
+ * scratch usable with all of them.
+ * 
+ * @param regex The compiled pattern the scratch will be used with
+ * @param scratch In/out scratch handle
+ * @return 1 on success, 0 if allocation failed (*scratch is left unchanged)
+ */
+int hvm_regex_alloc_scratch(hvm_regex_t regex, hvm_regex_scratch_t* scratch);
+
+/**
+ * Free scratch space
+ * 
+ * @param scratch The scratch to free (may be NULL)
+ */
+void hvm_regex_free_scratch(hvm_regex_scratch_t scratch);
+
+/**
+ * Match a compiled pattern against text using caller-provided scratch
+ * 
+ * Allocation-free only for native patterns (see hvm_regex_is_native).
+ * 
+ * @param regex The compiled pattern
+ * @param scratch Scratch allocated for regex, used by this thread only
+ * @param text The text to match against
+ * @param length Length of the text
+ * @param start_pos Starting position in the text
+ * @param match Output match result
+ * @return 1 if match succeeded, 0 otherwise, -1 if scratch was not
+ *         allocated for regex
+ */
+int hvm_regex_match_scratch(hvm_regex_t regex, 
+                            hvm_regex_scratch_t scratch, 
+                            const char* text, 
+                            size_t length, 
+                            size_t start_pos, 
+                            hvm_regex_match_t* match);
+
+/**
+ * Match a compiled pattern against a batch of buffers
+ * 
+ * Each buffer is searched independently from offset 0. The per-call work
+ * (argument checks, scratch allocation when none is given) is paid once
+ * per batch rather than once per buffer.
+ * 
+ * @param regex The compiled pattern
+ * @param scratch Scratch allocated for regex, or NULL to allocate one for the batch
+ * @param buffers Buffers to search
+ * @param count Number of buffers
+ * @param results Output array of count results; success is 0 for buffers without a match
+ * @return Number of buffers that matched, or -1 on error (invalid arguments,
+ *         allocation failure or scratch too small)
+ */
+int hvm_regex_match_batch(hvm_regex_t regex, 
+                          hvm_regex_scratch_t scratch, 
+                          const struct iovec* buffers, 
+                          size_t count, 
+                          hvm_regex_match_t* results);
+
+/**
+ * Match several compiled patterns against a batch of buffers
+ * 
+ * @param regexes Array of compiled patterns
+ * @param pattern_count Number of patterns
+ * @param scratch Scratch allocated for every pattern, or NULL to allocate one for the batch
+ * @param buffers Buffers to search
+ * @param count Number of buffers
+ * @param results Output array of count * pattern_count results; the result
+ *        for buffer b and pattern p is results[b * pattern_count + p]
+ * @return Number of (buffer, pattern) pairs that matched, or -1 on error
+ */
+int hvm_regex_match_batch_multi(const hvm_regex_t* regexes, 
+                                size_t pattern_count, 
+                                hvm_regex_scratch_t scratch, 
+                                const struct iovec* buffers, 
+                                size_t count, 
+                                hvm_regex_match_t* results);
+
 /**
  * Match a compiled pattern against text
  * 
@@ -57,6 +171,26 @@ int hvm_regex_match(hvm_regex_t regex,
                     size_t start_pos, 
                     hvm_regex_match_t* match);
 
+/**
+ * Match a compiled pattern by generating and running an HVM program
+ * 
+ * This is the reference backend: it shells out to `hvml run` for every
+ * call. hvm_regex_match uses it only for patterns the in-process engine
+ * does not support (lookaround and backreferences).
+ * 
+ * @param regex The compiled pattern
+ * @param text The text to match against
+ * @param length Length of the text
+ * @param start_pos Starting position in the text
+ * @param match Output match result
+ * @return 1 if match succeeded, 0 otherwise
+ */
+int hvm_regex_match_hvm(hvm_regex_t regex, 
+                        const char* text, 
+                        size_t length, 
+                        size_t start_pos, 
+                        hvm_regex_match_t* match);
+
 /**
  * Match a pattern string against text (convenience function)
  * 
@@ -73,9 +207,51 @@ int hvm_regex_match_string(const char* pattern,
                           size_t start_pos, 
                           hvm_regex_match_t* match);
 
+/** First element of the result list printed by HVM match programs */
+#define HVM_REGEX_RESULT_FORMAT 0x5231
+
+/**
+ * One match decoded from an HVM result list
+ */
+typedef struct {
+    unsigned int id;  /**< Job or pattern the match belongs to */
+    int start;        /**< Start offset of the match */
+    int end;          /**< End offset of the match (exclusive) */
+    int group_count;  /**< Number of capturing groups */
+    size_t groups;    /**< Index of the first group's start offset in group_offsets;
+                           group k spans group_offsets[groups + 2k] to [groups + 2k + 1],
+                           both -1 if it did not participate */
+} hvm_regex_record_t;
+
+/**
+ * Decode the result list printed by an HVM match program
+ * 
+ * Match programs evaluate to one flat list of numbers,
+ * [HVM_REGEX_RESULT_FORMAT, record...], where each record is
+ * `id start end group_count` followed by a start/end pair per group, so
+ * one run can report any number of matches, groups and pattern IDs.
+ * 
+ * @param output Program output containing the list
+ * @param records Array for the decoded records
+ * @param max_records Capacity of records
+ * @param group_offsets Array for the group offsets of all records
+ * @param max_group_offsets Capacity of group_offsets
+ * @return Number of records, or -1 if output holds no well-formed result
+ *         list or it does not fit
+ */
+int hvm_regex_decode_results(const char* output, 
+                             hvm_regex_record_t* records, 
+                             size_t max_records, 
+                             int* group_offsets, 
+                             size_t max_group_offsets);
+
 /**
  * Find all matches of a pattern in text
  * 
+ * Matches are non-overlapping and found in one scan over the text. After an
+ * empty match at a position, the next match may start there but must not be
+ * empty, as in Python's re.finditer.
+ * 
  * @param regex The compiled pattern
  * @param text The text to search
  * @param length Length of the text
@@ -89,6 +265,129 @@ int hvm_regex_find_all(hvm_regex_t regex,
                        hvm_regex_match_t* matches, 
                        size_t max_matches);
 
+/**
+ * Find all matches of a pattern in text using caller-provided scratch
+ * 
+ * Allocation-free only for native patterns (see hvm_regex_is_native).
+ * 
+ * @param regex The compiled pattern
+ * @param scratch Scratch allocated for regex, used by this thread only
+ * @param text The text to search
+ * @param length Length of the text
+ * @param start_pos Position to start searching from; to continue after
+ *        max_matches results, pass the end of the last match (when that
+ *        match was empty, the first result repeats it)
+ * @param matches Array to store matches
+ * @param max_matches Maximum number of matches to store
+ * @return Number of matches found, or -1 if scratch was not allocated for regex
+ */
+int hvm_regex_find_all_scratch(hvm_regex_t regex, 
+                               hvm_regex_scratch_t scratch, 
+                               const char* text, 
+                               size_t length, 
+                               size_t start_pos, 
+                               hvm_regex_match_t* matches, 
+                               size_t max_matches);
+
+/*
+ * Multi-pattern databases
+ *
+ * A database compiles a whole rule set into one automaton that is scanned
+ * once per buffer, reporting matches of every pattern through a callback.
+ * Like compiled patterns, databases are immutable and may be shared
+ * between threads; each thread scans with its own scratch.
+ */
+
+/**
+ * Opaque handle to a compiled multi-pattern database
+ */
+typedef struct hvm_regex_db* hvm_regex_db_t;
+
+/** Pattern flag: match ASCII letters case-insensitively */
+#define HVM_REGEX_CASELESS 1u
+
+/** Pattern flag: report only the first match of the pattern per scan */
+#define HVM_REGEX_SINGLEMATCH 2u
+
+/** hvm_regex_db_scan result when a callback stopped the scan */
+#define HVM_REGEX_SCAN_TERMINATED 1
+
+/**
+ * Callback invoked for each match found by hvm_regex_db_scan
+ * 
+ * Every offset at which a match of a pattern ends is reported once, in
+ * order of end offset, with the leftmost start of a match ending there.
+ * 
+ * @param id ID of the pattern that matched
+ * @param from Start offset of the match
+ * @param to End offset of the match
+ * @param context Pointer passed to hvm_regex_db_scan
+ * @return 0 to continue scanning, non-zero to stop the scan
+ */
+typedef int (*hvm_regex_match_callback_t)(unsigned int id, 
+                                          size_t from, 
+                                          size_t to, 
+                                          void* context);
+
+/**
+ * Compile a set of patterns into a database
+ * 
+ * @param patterns Array of count pattern strings
+ * @param ids Pattern IDs reported to the callback, or NULL to use indices
+ * @param flags Per-pattern HVM_REGEX_* flags, or NULL for none
+ * @param count Number of patterns
+ * @return The database, or NULL if a pattern is invalid, uses lookaround
+ *         or backreferences, or memory ran out
+ */
+hvm_regex_db_t hvm_regex_db_compile(const char* const* patterns, 
+                                    const unsigned int* ids, 
+                                    const unsigned int* flags, 
+                                    size_t count);
+
+/**
+ * Free a database
+ * 
+ * @param db The database to free (may be NULL)
+ */
+void hvm_regex_db_free(hvm_regex_db_t db);
+
+/**
+ * Get the number of patterns in a database
+ * 
+ * @param db The database
+ * @return Number of patterns
+ */
+size_t hvm_regex_db_count(hvm_regex_db_t db);
+
+/**
+ * Allocate scratch space for scanning a database, or grow an existing one
+ * 
+ * @param db The database the scratch will be used with
+ * @param scratch In/out scratch handle (see hvm_regex_alloc_scratch)
+ * @return 1 on success, 0 if allocation failed
+ */
+int hvm_regex_db_alloc_scratch(hvm_regex_db_t db, hvm_regex_scratch_t* scratch);
+
+/**
+ * Scan text with every pattern of a database in one pass
+ * 
+ * @param db The database
+ * @param scratch Scratch allocated for db, or NULL to allocate one for this scan
+ * @param text The text to scan
+ * @param length Length of the text
+ * @param on_match Callback for each match (may be NULL)
+ * @param context Passed through to the callback
+ * @return 0 if the scan completed, HVM_REGEX_SCAN_TERMINATED if the
+ *         callback stopped it, -1 on error (invalid arguments, allocation
+ *         failure or scratch too small)
+ */
+int hvm_regex_db_scan(hvm_regex_db_t db, 
+                      hvm_regex_scratch_t scratch, 
+                      const char* text, 
+                      size_t length, 
+                      hvm_regex_match_callback_t on_match, 
+                      void* context);
+
 /**
  * Get the version of the HVM regex engine
  * 
@@ -0,0 +1,188 @@
+#!/usr/bin/env python3
+"""
+asyncio front-end for the HVM regex wrapper
+
+HvmRegexMatcher.match runs hvml with a blocking subprocess call, which stalls
+an event loop for the whole evaluation. AsyncHvmRegexMatcher wraps a matcher
+and evaluates its programs without blocking the loop:
+
+- With the plain hvml backend, each program is piped to an
+  `hvml run /dev/stdin` child started with asyncio.create_subprocess_exec,
+  so concurrent matches overlap their evaluations.
+- In dispatch mode, requests are handed to the resident worker pool from a
+  thread, so up to pool_size evaluations run at once.
+- In fallback mode, the pure-Python engine runs in a thread.
+
+A semaphore caps the number of evaluations in flight. Cancelling a match
+kills its hvml child; requests already handed to a worker pool or thread
+run to completion and their result is discarded.
+"""
+
+import asyncio
+import subprocess
+
+try:
+    from . import hvm_regex_wrapper
+except ImportError:
+    import hvm_regex_wrapper
+
+
+# Default maximum number of evaluations in flight per AsyncHvmRegexMatcher
+DEFAULT_CONCURRENCY = 8
+
+
+class AsyncHvmRegexMatcher:
+    """Coroutine interface to an HvmRegexMatcher."""
+
+    def __init__(self, matcher=None, concurrency=DEFAULT_CONCURRENCY, **kwargs):
+        """Initialize the async matcher.
+
+        Args:
+            matcher: HvmRegexMatcher to evaluate with. If None, one is created
+                from kwargs and closed by close().
+            concurrency: Maximum number of evaluations in flight at once
+            **kwargs: HvmRegexMatcher arguments used when matcher is None
+        """
+        if concurrency < 1:
+            raise ValueError("concurrency must be at least 1")
+
+        self._owns_matcher = matcher is None
+        self.matcher = matcher if matcher is not None else hvm_regex_wrapper.HvmRegexMatcher(**kwargs)
+        self.concurrency = concurrency
+        self._limit = asyncio.Semaphore(concurrency)
+
+    def close(self):
+        """Close the wrapped matcher if this object created it."""
+        if self._owns_matcher:
+            self.matcher.close()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def compile(self, pattern, flags=0):
+        """Compile a pattern through the wrapped matcher's cache.
+
+        Compilation never runs HVM, so it is not a coroutine.
+
+        Args:
+            pattern: Regex pattern string
+            flags: Compilation flags
+
+        Returns:
+            hvm_regex_wrapper.CompiledPattern
+        """
+        return self.matcher.compile(pattern, flags)
+
+    async def match(self, pattern, text, pos=0):
+        """Match a pattern against text, like HvmRegexMatcher.match.
+
+        Args:
+            pattern: Regex pattern string or CompiledPattern
+            text: Text to match against
+            pos: Starting position in the text
+
+        Returns:
+            Match object if successful, None otherwise
+        """
+        return await self._match_compiled(self._compiled(pattern), text, pos)
+
+    async def search(self, pattern, text, pos=0):
+        """Find the first match at or after pos, like CompiledPattern.search.
+
+        Args:
+            pattern: Regex pattern string or CompiledPattern
+            text: Text to search
+            pos: Starting position in the text
+
+        Returns:
+            Match object if successful, None otherwise
+        """
+        result = await self._match_compiled(self._compiled(pattern), text, pos)
+        if result is None or result.start() < pos:
+            return None
+        return result
+
+    async def scan_many(self, pairs):
+        """Match many (pattern, text) pairs concurrently.
+
+        Unlike HvmRegexMatcher.match_many, which folds every job into one
+        program, each job is evaluated separately so the evaluations overlap
+        up to the concurrency limit and results arrive independently.
+
+        Args:
+            pairs: Iterable of (pattern, text) or (pattern, text, pos) tuples.
+                Patterns may be strings or CompiledPattern objects.
+
+        Returns:
+            List of match results (None for no match), in input order
+        """
+        jobs = []
+        for pair in pairs:
+            pos = pair[2] if len(pair) > 2 else 0
+            jobs.append(self._match_compiled(self._compiled(pair[0]), pair[1], pos))
+        return list(await asyncio.gather(*jobs))
+
+    def _compiled(self, pattern):
+        """Return pattern as a CompiledPattern."""
+        if isinstance(pattern, hvm_regex_wrapper.CompiledPattern):
+            return pattern
+        return self.matcher.compile(pattern)
+
+    async def _match_compiled(self, compiled, text, pos):
+        """Match a compiled pattern without blocking the event loop.
+
+        Args:
+            compiled: CompiledPattern to match
+            text: Text to match against
+            pos: Starting position in the text
+
+        Returns:
+            Match object if successful, None otherwise
+        """
+        matcher = self.matcher
+        if not compiled.may_match(text, pos):
+            return None
+
+        loop = asyncio.get_running_loop()
+        async with self._limit:
+            if matcher.use_fallback:
+                return await loop.run_in_executor(None, matcher._fallback_match, compiled, text, pos)
+
+            program = matcher._generate_match_hvml(compiled.pattern, text, pos, compiled.hvm_pattern)
+            if matcher._workers is not None:
+                output = await loop.run_in_executor(None, matcher._workers.run, program)
+            else:
+                output = await self._run_program(program)
+
+        return matcher._parse_match_output(output, text)
+
+    async def _run_program(self, program):
+        """Evaluate an HVML program in an hvml child process.
+
+        The program is piped to the child's stdin. The child is killed if the
+        caller is cancelled or the matcher's request timeout expires.
+
+        Args:
+            program: HVML source code
+
+        Returns:
+            The program's stdout
+        """
+        process = await asyncio.create_subprocess_exec(
+            self.matcher.hvm_path, "run", "/dev/stdin",
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+        )
+        try:
+            stdout, _ = await asyncio.wait_for(process.communicate(program.encode("utf-8")),
+                                               self.matcher.request_timeout)
+        except BaseException:
+            if process.returncode is None:
+                process.kill()
+                await process.wait()
+            raise
+        return stdout.decode("utf-8")
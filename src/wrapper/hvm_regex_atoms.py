@@ -0,0 +1,286 @@
+#!/usr/bin/env python3
+"""
+Literal atom extraction for regex prefiltering
+
+prefilter() analyses a parsed pattern and returns a query over literal
+substrings ("atoms") that every match must satisfy, in the style of the RE2
+and Hyperscan prefilters. For example `union\\s+(?:all\\s+)?select` requires
+And(union, select). Checking the query with plain substring searches is far
+cheaper than running a matcher, so texts that fail it can be rejected
+without ever starting the regex engine.
+
+A query is an Atom, an And/Or of sub-queries, or None when nothing is required.
+Atoms are (text, icase) tuples; case-insensitive atoms are lowercased.
+"""
+
+import collections
+
+try:
+    from .hvm_regex_parser import (
+        Empty, Char, Literal, Alt, Concat, CharClass, Group,
+        AnchorStart, AnchorEnd, WordBoundary, NonWordBoundary,
+        PosLookahead, NegLookahead, PosLookbehind, NegLookbehind,
+        is_repeat, repeat_bounds,
+    )
+except ImportError:
+    from hvm_regex_parser import (
+        Empty, Char, Literal, Alt, Concat, CharClass, Group,
+        AnchorStart, AnchorEnd, WordBoundary, NonWordBoundary,
+        PosLookahead, NegLookahead, PosLookbehind, NegLookbehind,
+        is_repeat, repeat_bounds,
+    )
+
+
+# Largest set of exact strings tracked for a sub-pattern
+MAX_EXACT = 16
+
+# Largest character class expanded into single-character strings
+MAX_CLASS = 4
+
+# Query node types
+Atom = collections.namedtuple("Atom", ["text", "icase"])
+And = collections.namedtuple("And", ["children"])
+Or = collections.namedtuple("Or", ["children"])
+
+_EMPTY = frozenset([Atom("", False)])
+
+_ZERO_WIDTH = (Empty, AnchorStart, AnchorEnd, WordBoundary, NonWordBoundary,
+               PosLookahead, NegLookahead, PosLookbehind, NegLookbehind)
+
+# Maps ASCII uppercase to lowercase without changing string length
+_ASCII_LOWER = str.maketrans("ABCDEFGHIJKLMNOPQRSTUVWXYZ", "abcdefghijklmnopqrstuvwxyz")
+
+
+class _FoldTable(dict):
+    """str.translate table mapping each character to its one-character lowercase."""
+
+    def __missing__(self, cp):
+        lower = chr(cp).lower()
+        self[cp] = ord(lower) if len(lower) == 1 else cp
+        return self[cp]
+
+
+_FOLD = _FoldTable()
+
+
+def fold_case(text):
+    """Lowercase text the way the engines compare it, keeping offsets unchanged.
+
+    The engines fold each text character with str.lower(), so non-ASCII
+    characters can match ASCII atoms (KELVIN SIGN U+212A matches "k").
+    Characters whose lowercase form is longer than one character are kept
+    as they are.
+    """
+    if text.isascii():
+        return text.translate(_ASCII_LOWER)
+    return text.translate(_FOLD)
+
+
+def _cross(a, b):
+    """All concatenations of a string from a with a string from b."""
+    result = set()
+    for text_a, icase_a in a:
+        for text_b, icase_b in b:
+            if icase_a or icase_b:
+                result.add(Atom((text_a + text_b).lower(), True))
+            else:
+                result.add(Atom(text_a + text_b, False))
+    return frozenset(result)
+
+
+def _make_and(children):
+    flat = []
+    for child in children:
+        if child is None:
+            continue
+        flat.extend(child.children if type(child) is And else [child])
+    unique = list(dict.fromkeys(flat))
+    if not unique:
+        return None
+    return unique[0] if len(unique) == 1 else And(tuple(unique))
+
+
+def _make_or(children):
+    flat = []
+    for child in children:
+        if child is None:
+            return None  # One branch requires nothing, so neither does the whole
+        flat.extend(child.children if type(child) is Or else [child])
+    unique = list(dict.fromkeys(flat))
+    if not unique:
+        return None
+    return unique[0] if len(unique) == 1 else Or(tuple(unique))
+
+
+def _exact_query(exact):
+    """Query requiring one of a set of exact strings, or None if one is empty."""
+    if exact is None or any(not text for text, _ in exact):
+        return None
+    return _make_or(sorted(exact))
+
+
+def _analyze(node):
+    """Return (exact, query) for a node.
+
+    exact is the finite set of strings the node can match (or None if it is
+    too large or unbounded); query holds for every match of the node.
+    """
+    t = type(node)
+
+    if t in _ZERO_WIDTH:
+        return _EMPTY, None
+    if t is Char:
+        return frozenset([Atom(node.c, node.icase)]), None
+    if t is Literal:
+        return frozenset([Atom(node.text.lower() if node.icase else node.text, node.icase)]), None
+    if t is CharClass:
+        size = sum(hi - lo + 1 for lo, hi in node.ranges)
+        if size <= MAX_CLASS:
+            return frozenset(Atom(chr(cp), False) for lo, hi in node.ranges
+                             for cp in range(lo, hi + 1)), None
+        return None, None
+    if t is Group:
+        return _analyze(node.node)
+
+    if t is Alt:
+        infos = [_analyze(child) for child in node.nodes]
+        if all(exact is not None for exact, _ in infos):
+            union = frozenset().union(*(exact for exact, _ in infos))
+            if len(union) <= MAX_EXACT:
+                return union, None
+        return None, _make_or([query if exact is None else _exact_query(exact)
+                               for exact, query in infos])
+
+    if t is Concat:
+        # Runs of exact children are multiplied out into longer strings;
+        # everything else is ANDed together
+        run = _EMPTY
+        parts = []
+        all_exact = True
+        for child in node.nodes:
+            exact, query = _analyze(child)
+            if exact is not None:
+                product = _cross(run, exact)
+                if len(product) <= MAX_EXACT:
+                    run = product
+                    continue
+                parts.append(_exact_query(run))
+                run = exact
+            else:
+                parts.append(_exact_query(run))
+                parts.append(query)
+                run = _EMPTY
+            all_exact = False
+        if all_exact:
+            return run, None
+        parts.append(_exact_query(run))
+        return None, _make_and(parts)
+
+    if is_repeat(node):
+        inner, lo, hi, _ = repeat_bounds(node)
+        exact, query = _analyze(inner)
+        if lo == 0:
+            if hi == 1 and exact is not None:
+                return exact | _EMPTY, None
+            return None, None
+        if exact is not None and hi == lo:
+            product = _EMPTY
+            for _ in range(lo):
+                product = _cross(product, exact)
+                if len(product) > MAX_EXACT:
+                    break
+            else:
+                return product, None
+        return None, query if exact is None else _exact_query(exact)
+
+    # Any, negated classes and backreferences can match too many strings
+    return None, None
+
+
+def prefilter(node):
+    """Compute the atom query every match of a pattern satisfies.
+
+    Args:
+        node: Pattern AST from hvm_regex_parser.parse
+
+    Returns:
+        Atom, And or Or query, or None if the pattern requires no literal
+    """
+    exact, query = _analyze(node)
+    return query if exact is None else _exact_query(exact)
+
+
+def _or_set(query):
+    """Reduce a query to a set of atoms one of which must occur, or None."""
+    if query is None:
+        return None
+    if type(query) is Atom:
+        return frozenset([query])
+    if type(query) is Or:
+        result = set()
+        for child in query.children:
+            atoms = _or_set(child)
+            if atoms is None:
+                return None
+            result |= atoms
+        return frozenset(result)
+
+    # And: any one child's set is sufficient; pick the most selective
+    best = None
+    best_key = None
+    for child in query.children:
+        atoms = _or_set(child)
+        if atoms is None:
+            continue
+        key = (min(len(text) for text, _ in atoms), -len(atoms))
+        if best_key is None or key > best_key:
+            best, best_key = atoms, key
+    return best
+
+
+def required_atoms(node):
+    """Compute literal atoms one of which occurs in every match of a pattern.
+
+    This is the form an Aho-Corasick prefilter needs (see hvm_regex_multi).
+
+    Args:
+        node: Pattern AST from hvm_regex_parser.parse
+
+    Returns:
+        frozenset of (text, icase) tuples, or None if no such set exists
+        (for example when the pattern can match the empty string)
+    """
+    return _or_set(prefilter(node))
+
+
+def query_matches(query, text, pos=0):
+    """Check whether text[pos:] satisfies an atom query.
+
+    Args:
+        query: Query from prefilter()
+        text: Text to check
+        pos: Position matches may start at
+
+    Returns:
+        False only if no match starting at or after pos is possible
+    """
+    if query is None:
+        return True
+
+    folded = []
+
+    def check(node):
+        t = type(node)
+        if t is Atom:
+            if not node.icase:
+                return text.find(node.text, pos) >= 0
+            if not node.text.isascii():
+                return True  # Lowercased non-ASCII atoms may not be single characters
+            if not folded:
+                folded.append(fold_case(text))
+            return folded[0].find(node.text, pos) >= 0
+        if t is And:
+            return all(check(child) for child in node.children)
+        return any(check(child) for child in node.children)
+
+    return check(query)
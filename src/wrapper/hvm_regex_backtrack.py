@@ -0,0 +1,356 @@
+#!/usr/bin/env python3
+"""
+Backtracking engine for the pure-Python fallback matcher
+
+Handles the patterns the automata engine cannot: lookahead, lookbehind and
+backreferences. Matching follows the same structure as @match in
+optimized_regex.hvml, written in continuation-passing style so every
+alternative of a repetition or alternation can be retried. Runs of a
+single-character pattern are scanned iteratively to keep recursion shallow.
+
+Backtracking can take exponential time, e.g. `(?<!x)(a|aa)*c` on a long run
+of `a`. With memoize=True the matcher records every failed state: an
+alternation or repetition entered at a position with a given continuation.
+Continuations carry a key describing what is left to match (the remaining
+sequence items, repetition count, enclosing group and so on), and a state
+that failed once fails again, so it is skipped. Captures only affect the
+outcome through backreferences, so the state also includes the captures of
+groups a backreference refers to. Each state is explored at most once, which
+bounds the work by the number of states: O(pattern x text) when repeated
+sub-patterns cannot match the empty string and no backreferences are used.
+"""
+
+try:
+    from .hvm_regex_parser import (
+        Empty, Char, Literal, Any, Concat, Alt, CharClass, NegCharClass, Group,
+        AnchorStart, AnchorEnd, WordBoundary, NonWordBoundary,
+        PosLookahead, NegLookahead, PosLookbehind, NegLookbehind, Backref,
+        SINGLE_CHAR_NODES, is_repeat, repeat_bounds, width_range, ranges_contain,
+        is_word_char, walk,
+    )
+except ImportError:
+    from hvm_regex_parser import (
+        Empty, Char, Literal, Any, Concat, Alt, CharClass, NegCharClass, Group,
+        AnchorStart, AnchorEnd, WordBoundary, NonWordBoundary,
+        PosLookahead, NegLookahead, PosLookbehind, NegLookbehind, Backref,
+        SINGLE_CHAR_NODES, is_repeat, repeat_bounds, width_range, ranges_contain,
+        is_word_char, walk,
+    )
+
+
+def _done(i, caps):
+    return i, caps
+
+
+# Memo key of the continuation that accepts wherever the match ends
+_done.key = ("done",)
+
+
+class BacktrackRegex:
+    """Backtracking matcher supporting the full pattern syntax."""
+
+    def __init__(self, node, group_count=0, memoize=False):
+        """Initialize the matcher.
+
+        Args:
+            node: Pattern AST from hvm_regex_parser.parse
+            group_count: Number of capturing groups in the pattern
+            memoize: Whether to record failed states so none is explored
+                twice (see the module docstring)
+        """
+        self.node = node
+        self.group_count = group_count
+        self.memoize = memoize
+        # Capture slots whose contents can change whether a state matches
+        self.ref_slots = tuple(sorted({
+            slot
+            for n in walk(node) if type(n) is Backref
+            for slot in (2 * (n.index - 1), 2 * (n.index - 1) + 1)
+        }))
+
+    def _matcher(self, text):
+        return _Matcher(text, self.ref_slots if self.memoize else None)
+
+    def search(self, text, pos=0):
+        """Find the leftmost-first match starting at or after pos.
+
+        Returns:
+            (start, end, groups) where groups holds a (start, end) pair per
+            capturing group ((-1, -1) if it did not participate), or None
+        """
+        if pos < 0:
+            return None
+        matcher = self._matcher(text)
+        for start in range(pos, len(text) + 1):
+            result = self._match_at(matcher, start)
+            if result is not None:
+                return result
+        return None
+
+    def match(self, text, pos=0):
+        """Match the pattern exactly at pos; same result format as search."""
+        if pos < 0 or pos > len(text):
+            return None
+        return self._match_at(self._matcher(text), pos)
+
+    def match_nonempty(self, text, pos):
+        """Match exactly at pos, skipping alternatives that match the empty string."""
+        if pos < 0 or pos > len(text):
+            return None
+        def done(i, caps):
+            return (i, caps) if i > pos else None
+
+        done.key = ("nonempty", pos)
+        return self._match_at(self._matcher(text), pos, done)
+
+    def _match_at(self, matcher, pos, done=_done):
+        caps = (-1,) * (2 * self.group_count)
+        result = matcher.match(self.node, pos, caps, done)
+        if result is None:
+            return None
+
+        end, caps = result
+        groups = tuple((caps[2 * g], caps[2 * g + 1]) for g in range(self.group_count))
+        return pos, end, groups
+
+
+class _Matcher:
+    """Matching state for one text."""
+
+    def __init__(self, text, ref_slots=None):
+        """Initialize the state.
+
+        Args:
+            text: Text to match
+            ref_slots: Capture slots read by backreferences, to memoize
+                failed states; None disables memoization
+        """
+        self.text = text
+        self.n = len(text)
+        self.memo = None if ref_slots is None else set()
+        self.ref_slots = ref_slots
+
+    def state(self, tag, i, caps, k):
+        """Build the memo key of entering tag at i with continuation k."""
+        return tag, i, k.key, tuple([caps[slot] for slot in self.ref_slots])
+
+    def char_matches(self, node, i):
+        """Check whether a single-character node matches text[i]."""
+        if i >= self.n:
+            return False
+        ch = self.text[i]
+        t = type(node)
+        if t is Char:
+            return (ch.lower() if node.icase else ch) == node.c
+        if t is Any:
+            return True
+        return ranges_contain(node.ranges, ord(ch)) != (t is NegCharClass)
+
+    def match(self, node, i, caps, k):
+        """Match node at i, then call the continuation k(end, caps).
+
+        Returns:
+            The continuation's result for the first alternative that succeeds, or None
+        """
+        t = type(node)
+        text = self.text
+
+        if t in SINGLE_CHAR_NODES:
+            return k(i + 1, caps) if self.char_matches(node, i) else None
+
+        if t is Literal:
+            end = i + len(node.text)
+            chunk = text[i:end]
+            if node.icase:
+                chunk = chunk.lower()
+                ok = len(chunk) == len(node.text) and chunk == node.text.lower()
+            else:
+                ok = chunk == node.text
+            return k(end, caps) if ok else None
+
+        if t is Empty:
+            return k(i, caps)
+
+        if t is Concat:
+            return self.match_seq(node.nodes, 0, i, caps, k)
+
+        if t is Alt:
+            memo = self.memo
+            if memo is not None:
+                key = self.state(id(node), i, caps, k)
+                if key in memo:
+                    return None
+            for branch in node.nodes:
+                result = self.match(branch, i, caps, k)
+                if result is not None:
+                    return result
+            if memo is not None:
+                memo.add(key)
+            return None
+
+        if is_repeat(node):
+            inner, lo, hi, greedy = repeat_bounds(node)
+            if type(inner) in SINGLE_CHAR_NODES:
+                return self.match_run(inner, lo, hi, greedy, i, caps, k)
+            return self.match_repeat(inner, lo, hi, greedy, 0, i, caps, k)
+
+        if t is Group:
+            slot = 2 * (node.index - 1)
+
+            def close_group(j, inner_caps):
+                inner_caps = inner_caps[:slot] + (i, j) + inner_caps[slot + 2:]
+                return k(j, inner_caps)
+
+            if self.memo is not None:
+                # The group start is only observable through a backreference
+                start = i if slot in self.ref_slots else -1
+                close_group.key = ("group", slot, start, k.key)
+            return self.match(node.node, i, caps, close_group)
+
+        if t is AnchorStart:
+            return k(i, caps) if i == 0 else None
+
+        if t is AnchorEnd:
+            return k(i, caps) if i == self.n else None
+
+        if t is WordBoundary or t is NonWordBoundary:
+            before = is_word_char(text[i - 1]) if i > 0 else False
+            after = is_word_char(text[i]) if i < self.n else False
+            if (before != after) == (t is WordBoundary):
+                return k(i, caps)
+            return None
+
+        if t is PosLookahead or t is NegLookahead:
+            result = self.match(node.node, i, caps, _done)
+            if t is PosLookahead:
+                return k(i, result[1]) if result is not None else None
+            return k(i, caps) if result is None else None
+
+        if t is PosLookbehind or t is NegLookbehind:
+            result = self.match_behind(node.node, i, caps)
+            if t is PosLookbehind:
+                return k(i, result[1]) if result is not None else None
+            return k(i, caps) if result is None else None
+
+        if t is Backref:
+            slot = 2 * (node.index - 1)
+            start, end = caps[slot], caps[slot + 1]
+            if start < 0:
+                return None
+            captured = text[start:end]
+            chunk = text[i:i + len(captured)]
+            if node.icase:
+                ok = chunk.lower() == captured.lower()
+            else:
+                ok = chunk == captured
+            return k(i + len(captured), caps) if ok and len(chunk) == len(captured) else None
+
+        raise ValueError(f"Unsupported pattern node {t.__name__}")
+
+    def match_seq(self, nodes, index, i, caps, k):
+        """Match nodes[index:] in sequence."""
+        if index == len(nodes):
+            return k(i, caps)
+
+        def rest(j, rest_caps):
+            return self.match_seq(nodes, index + 1, j, rest_caps, k)
+
+        if self.memo is not None:
+            rest.key = ("seq", id(nodes), index + 1, k.key)
+        return self.match(nodes[index], i, caps, rest)
+
+    def match_run(self, node, lo, hi, greedy, i, caps, k):
+        """Repeat a single-character node without recursing per character."""
+        memo = self.memo
+        if memo is not None:
+            key = self.state(("run", id(node), lo, hi, greedy), i, caps, k)
+            if key in memo:
+                return None
+            result = self._match_run(node, lo, hi, greedy, i, caps, k)
+            if result is None:
+                memo.add(key)
+            return result
+        return self._match_run(node, lo, hi, greedy, i, caps, k)
+
+    def _match_run(self, node, lo, hi, greedy, i, caps, k):
+        limit = self.n - i if hi is None else min(hi, self.n - i)
+        count = 0
+        if greedy:
+            while count < limit and self.char_matches(node, i + count):
+                count += 1
+            counts = range(count, lo - 1, -1)
+        else:
+            if lo > limit or not all(self.char_matches(node, i + j) for j in range(lo)):
+                return None
+            counts = range(lo, limit + 1)
+
+        for count in counts:
+            if not greedy and count > lo and not self.char_matches(node, i + count - 1):
+                return None
+            result = k(i + count, caps)
+            if result is not None:
+                return result
+        return None
+
+    def match_repeat(self, node, lo, hi, greedy, count, i, caps, k):
+        """Repeat an arbitrary node, trying more (greedy) or fewer (lazy) iterations first."""
+        memo = self.memo
+        if memo is not None:
+            # Past the minimum, an unbounded repetition behaves the same for any count
+            tag = ("repeat", id(node), lo, hi, greedy, count if hi is not None else min(count, lo))
+            key = self.state(tag, i, caps, k)
+            if key in memo:
+                return None
+            result = self._match_repeat(node, lo, hi, greedy, count, i, caps, k, tag)
+            if result is None:
+                memo.add(key)
+            return result
+        return self._match_repeat(node, lo, hi, greedy, count, i, caps, k)
+
+    def _match_repeat(self, node, lo, hi, greedy, count, i, caps, k, tag=None):
+        def again(j, inner_caps):
+            # An iteration that matched nothing cannot make progress
+            if j == i and count >= lo:
+                return None
+            return self.match_repeat(node, lo, hi, greedy, count + 1, j, inner_caps, k)
+
+        if tag is not None:
+            # The iteration start matters only to the empty-iteration check
+            start = i if width_range(node)[0] == 0 else -1
+            again.key = ("again", tag, start, k.key)
+
+        can_continue = hi is None or count < hi
+        can_stop = count >= lo
+
+        if greedy:
+            if can_continue:
+                result = self.match(node, i, caps, again)
+                if result is not None:
+                    return result
+            return k(i, caps) if can_stop else None
+
+        if can_stop:
+            result = k(i, caps)
+            if result is not None:
+                return result
+        return self.match(node, i, caps, again) if can_continue else None
+
+    def match_behind(self, node, i, caps):
+        """Match node so that it ends exactly at i (for lookbehind)."""
+        def ends_here(j, inner_caps):
+            return (j, inner_caps) if j == i else None
+
+        if self.memo is not None:
+            ends_here.key = ("behind", i)
+
+        lo, hi = width_range(node)
+        if lo == hi:
+            return self.match(node, i - lo, caps, ends_here) if i - lo >= 0 else None
+
+        first = i - lo
+        last = 0 if hi is None else max(0, i - hi)
+        for start in range(first, last - 1, -1):
+            result = self.match(node, start, caps, ends_here)
+            if result is not None:
+                return result
+        return None
@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+"""
+Pure-Python regex engine used when HVM is not available
+
+compile() parses a pattern and picks an engine for it: the linear-time
+NFA/DFA engine (hvm_regex_nfa) for regular patterns, or the backtracking
+engine (hvm_regex_backtrack) for patterns with lookaround or backreferences.
+Both expose the same search/match interface.
+"""
+
+try:
+    from . import hvm_regex_parser
+    from .hvm_regex_nfa import NfaRegex
+    from .hvm_regex_backtrack import BacktrackRegex
+except ImportError:
+    import hvm_regex_parser
+    from hvm_regex_nfa import NfaRegex
+    from hvm_regex_backtrack import BacktrackRegex
+
+IGNORECASE = hvm_regex_parser.IGNORECASE
+RegexError = hvm_regex_parser.RegexError
+
+
+class Regex:
+    """A compiled pattern."""
+
+    def __init__(self, pattern, flags=0, memoize=False):
+        """Parse and compile a pattern.
+
+        Args:
+            pattern: Regex pattern string
+            flags: Compilation flags (IGNORECASE)
+            memoize: Whether the backtracking engine records failed states,
+                bounding its work by pattern size times text length rather
+                than letting it go exponential (see hvm_regex_backtrack)
+
+        Raises:
+            RegexError: If the pattern is invalid
+        """
+        self.pattern = pattern
+        self.flags = flags
+        self.node, self.group_count = hvm_regex_parser.parse(pattern, flags)
+        self.is_regular = hvm_regex_parser.is_regular(self.node)
+
+        if self.is_regular:
+            self.engine = NfaRegex(self.node, self.group_count)
+        else:
+            self.engine = BacktrackRegex(self.node, self.group_count, memoize)
+
+    def search(self, text, pos=0):
+        """Find the leftmost match starting at or after pos.
+
+        Args:
+            text: Text to search
+            pos: Position to start searching from
+
+        Returns:
+            (start, end, groups) where groups holds a (start, end) pair per
+            capturing group ((-1, -1) if it did not participate), or None
+        """
+        return self.engine.search(text, pos)
+
+    def match(self, text, pos=0):
+        """Match the pattern exactly at pos; same result format as search."""
+        return self.engine.match(text, pos)
+
+    def finditer(self, text, pos=0):
+        """Iterate over successive non-overlapping matches.
+
+        The text is scanned once: each search resumes where the previous
+        match ended. As in Python's re module, an empty match may directly
+        follow a match, and after an empty match at i the next match may
+        start at i but must not be empty.
+
+        Args:
+            text: Text to search
+            pos: Position to start searching from
+
+        Yields:
+            (start, end, groups) tuples in order of position
+        """
+        engine = self.engine
+        n = len(text)
+        while pos <= n:
+            span = engine.search(text, pos)
+            if span is None:
+                return
+            yield span
+
+            start, end, _ = span
+            pos = end
+            if start == end:
+                span = engine.match_nonempty(text, end)
+                if span is None:
+                    pos = end + 1
+                else:
+                    yield span
+                    pos = span[1]
+
+    def __repr__(self):
+        return f"Regex({self.pattern!r}, engine={type(self.engine).__name__})"
+
+
+def compile(pattern, flags=0, memoize=False):
+    """Compile a pattern with the pure-Python engine.
+
+    Args:
+        pattern: Regex pattern string
+        flags: Compilation flags (IGNORECASE)
+        memoize: Whether the backtracking engine memoizes failed states
+
+    Returns:
+        Regex instance
+    """
+    return Regex(pattern, flags, memoize)
@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+"""
+Match results for the HVM regex wrapper
+
+A Match holds the matched text by reference plus integer offsets, and only
+slices the text when a group's text is asked for, so scanning loops that
+just need spans allocate one small object per hit. The re-style accessors
+(span, start, end, group, groups) are the fast path; dict-style access
+(match["position"], match["groups"][0]["text"], ...) is kept for callers
+written against the original dict results.
+"""
+
+# Keys available through dict-style access
+_KEYS = ("position", "length", "text", "groups")
+
+
+class Match:
+    """A single match, similar to re.Match."""
+
+    __slots__ = ("string", "_start", "_end", "_groups")
+
+    def __init__(self, string, start, end, groups=()):
+        """Initialize the match.
+
+        Args:
+            string: Text that was matched (kept by reference, not copied)
+            start: Start offset of the match
+            end: End offset of the match
+            groups: (start, end) pair per capturing group, (-1, -1) for a
+                group that did not participate
+        """
+        self.string = string
+        self._start = start
+        self._end = end
+        self._groups = groups
+
+    def span(self, group=0):
+        """Return the (start, end) offsets of a group (0 for the whole match)."""
+        if group == 0:
+            return (self._start, self._end)
+        if not 0 < group <= len(self._groups):
+            raise IndexError("no such group")
+        return tuple(self._groups[group - 1])
+
+    def start(self, group=0):
+        """Return the start offset of a group, or -1 if it did not participate."""
+        return self.span(group)[0]
+
+    def end(self, group=0):
+        """Return the end offset of a group, or -1 if it did not participate."""
+        return self.span(group)[1]
+
+    def group(self, *groups):
+        """Return the text of one or more groups.
+
+        Args:
+            *groups: Group numbers (none for the whole match)
+
+        Returns:
+            The group's text, None for a group that did not participate, or a
+            tuple of those when several groups are given
+        """
+        if len(groups) > 1:
+            return tuple(self.group(group) for group in groups)
+        start, end = self.span(groups[0] if groups else 0)
+        if start < 0:
+            return None
+        return self.string[start:end]
+
+    def groups(self, default=None):
+        """Return the text of every capturing group as a tuple."""
+        return tuple(self.string[start:end] if start >= 0 else default
+                     for start, end in self._groups)
+
+    def __getitem__(self, key):
+        if key == "position":
+            return self._start
+        if key == "length":
+            return self._end - self._start
+        if key == "text":
+            return self.string[self._start:self._end]
+        if key == "groups" and self._groups:
+            return [
+                {"position": start, "length": end - start, "text": self.string[start:end]}
+                if start >= 0 else
+                {"position": -1, "length": 0, "text": None}
+                for start, end in self._groups
+            ]
+        raise KeyError(key)
+
+    def __contains__(self, key):
+        return key in _KEYS and (key != "groups" or bool(self._groups))
+
+    def get(self, key, default=None):
+        """Dict-style access returning default for missing keys."""
+        return self[key] if key in self else default
+
+    def keys(self):
+        """Keys available through dict-style access."""
+        return [key for key in _KEYS if key in self]
+
+    def to_dict(self):
+        """Return the match in the original dict format."""
+        return {key: self[key] for key in self.keys()}
+
+    def __eq__(self, other):
+        if isinstance(other, Match):
+            return (self.span(), tuple(map(tuple, self._groups))) == \
+                (other.span(), tuple(map(tuple, other._groups))) and \
+                self.group() == other.group()
+        if isinstance(other, dict):
+            return self.to_dict() == other
+        return NotImplemented
+
+    __hash__ = None
+
+    def __repr__(self):
+        return f"<Match span={self.span()!r} match={self.group()!r}>"
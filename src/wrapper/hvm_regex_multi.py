@@ -0,0 +1,194 @@
+#!/usr/bin/env python3
+"""
+Multi-pattern matching with an Aho-Corasick literal prefilter
+
+Implements the literal stage of docs/MULTI_PATTERN_ARCHITECTURE.md. All
+literal rules, plus the literal atoms extracted from the regex rules (see
+hvm_regex_atoms), go into one Aho-Corasick automaton that is built once. Each
+buffer is scanned in a single pass; literal rules are decided by that pass
+alone, and only regex rules whose atoms were seen (or that have no usable
+atoms) are handed to the full regex matcher.
+"""
+
+import collections
+
+try:
+    from . import hvm_regex_atoms
+except ImportError:
+    import hvm_regex_atoms
+
+
+class AhoCorasick:
+    """Aho-Corasick automaton reporting every occurrence of a set of literals."""
+
+    def __init__(self, literals):
+        """Build the automaton.
+
+        Args:
+            literals: Iterable of (literal, value) pairs; value is reported on a hit
+        """
+        self._goto = [{}]
+        self._fail = [0]
+        self._out = [[]]
+        self.size = 0
+
+        for literal, value in literals:
+            self.add(literal, value)
+        self._build_failure_links()
+
+    def add(self, literal, value):
+        """Insert a literal into the trie (only valid before building)."""
+        if not literal:
+            raise ValueError("Aho-Corasick literals must be non-empty")
+
+        state = 0
+        for ch in literal:
+            next_state = self._goto[state].get(ch)
+            if next_state is None:
+                next_state = len(self._goto)
+                self._goto[state][ch] = next_state
+                self._goto.append({})
+                self._fail.append(0)
+                self._out.append([])
+            state = next_state
+        self._out[state].append((len(literal), value))
+        self.size += 1
+
+    def _build_failure_links(self):
+        queue = collections.deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for ch, next_state in self._goto[state].items():
+                queue.append(next_state)
+
+                fail = self._fail[state]
+                while fail and ch not in self._goto[fail]:
+                    fail = self._fail[fail]
+                fail = self._goto[fail].get(ch, 0)
+                if fail == next_state:
+                    fail = 0
+                self._fail[next_state] = fail
+                # Every literal that ends at the fallback state also ends here
+                self._out[next_state] = self._out[next_state] + self._out[fail]
+
+        # Outputs are immutable from here on
+        self._out = [tuple(out) for out in self._out]
+
+    def iter(self, text):
+        """Scan text in one pass.
+
+        Yields:
+            (start, end, value) for every occurrence, in order of end position
+        """
+        goto, fail, out = self._goto, self._fail, self._out
+        state = 0
+        for i, ch in enumerate(text):
+            while state and ch not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(ch, 0)
+            if out[state]:
+                for length, value in out[state]:
+                    yield i + 1 - length, i + 1, value
+
+    def values(self, text):
+        """Return the set of values whose literal occurs in text."""
+        goto, fail, out = self._goto, self._fail, self._out
+        found = set()
+        state = 0
+        for ch in text:
+            while state and ch not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(ch, 0)
+            if out[state]:
+                found.update(value for _, value in out[state])
+        return found
+
+
+class MultiPatternMatcher:
+    """Match a set of literal and regex rules against buffers."""
+
+    def __init__(self, rules, matcher=None):
+        """Classify the rules and build the prefilter automaton.
+
+        Args:
+            rules: Iterable of dicts with "id", "text" and "type" ("literal" or
+                "regex") keys, as in benchmarks/basic/snort_patterns.hvml, and
+                optional "flags" for regex rules
+            matcher: HvmRegexMatcher used for regex rules (defaults to a new one)
+        """
+        if matcher is None:
+            try:
+                from .hvm_regex_wrapper import HvmRegexMatcher
+            except ImportError:
+                from hvm_regex_wrapper import HvmRegexMatcher
+            matcher = HvmRegexMatcher()
+
+        self.matcher = matcher
+        self.rules = list(rules)
+        self.regex_evaluations = 0
+
+        # Regex rules without usable atoms must be evaluated on every buffer
+        self._unfiltered = []
+        self._compiled = {}
+        entries = []
+
+        for index, rule in enumerate(self.rules):
+            kind = rule.get("type", "literal")
+            if kind == "literal":
+                entries.append((rule["text"], False, index))
+            elif kind == "regex":
+                compiled = matcher.compile(rule["text"], rule.get("flags", 0))
+                self._compiled[index] = compiled
+                atoms = hvm_regex_atoms.required_atoms(compiled.regex.node)
+                if atoms is None or any(icase and not text.isascii() for text, icase in atoms):
+                    self._unfiltered.append(index)
+                else:
+                    entries.extend((text, icase, index) for text, icase in atoms)
+            else:
+                raise ValueError(f"Unknown rule type {kind!r} for rule {rule.get('id')}")
+
+        # Case-insensitive atoms are found by scanning case-folded text;
+        # case-sensitive hits are then confirmed against the original text
+        self._fold = any(icase for _, icase, _ in entries)
+        literals = []
+        for text, icase, index in entries:
+            if self._fold:
+                literals.append((hvm_regex_atoms.fold_case(text), (index, None if icase else text)))
+            else:
+                literals.append((text, (index, None)))
+        self.automaton = AhoCorasick(literals)
+
+    def candidates(self, text):
+        """Run the prefilter over text.
+
+        Returns:
+            Set of indexes into self.rules that may match
+        """
+        if not self._fold:
+            hits = {index for index, _ in self.automaton.values(text)}
+        else:
+            hits = set()
+            for start, end, (index, exact) in self.automaton.iter(hvm_regex_atoms.fold_case(text)):
+                if exact is None or text[start:end] == exact:
+                    hits.add(index)
+        hits.update(self._unfiltered)
+        return hits
+
+    def scan(self, text):
+        """Find the rules that match text.
+
+        Args:
+            text: Buffer to scan
+
+        Returns:
+            List of matching rule ids, in rule order
+        """
+        matched = []
+        for index in sorted(self.candidates(text)):
+            compiled = self._compiled.get(index)
+            if compiled is not None:
+                self.regex_evaluations += 1
+                if compiled.search(text) is None:
+                    continue
+            matched.append(self.rules[index]["id"])
+        return matched
@@ -0,0 +1,463 @@
+#!/usr/bin/env python3
+"""
+Python binding to the in-process C engine (libhvmregex)
+
+The library is built with `make lib`. Matching runs entirely in C: ctypes
+releases the GIL for the duration of every call, so scanners running in a
+ThreadPoolExecutor use all cores of one process. Each thread gets its own
+scratch space, while the compiled pattern is shared.
+
+Data is never copied: search() and finditer() accept bytes, bytearray,
+memoryview, mmap and any other object supporting the buffer protocol, and
+pass a pointer to its memory straight to the library. The buffer stays
+exported (so a bytearray cannot be resized) while a call runs.
+
+The engine works on bytes; str patterns are encoded as UTF-8 and all
+offsets are byte offsets.
+"""
+
+import contextlib
+import ctypes
+import os
+import threading
+
+LIBRARY_NAME = "libhvmregex.so"
+
+# Environment variable overriding the library location
+LIBRARY_ENV = "HVM_REGEX_LIBRARY"
+
+# Matches fetched from the library per finditer() call
+FIND_BLOCK = 256
+
+_PyBUF_SIMPLE = 0
+
+# Flags for NativeDatabase patterns (see hvm_regex.h)
+CASELESS = 1
+SINGLEMATCH = 2
+
+_SCAN_TERMINATED = 1
+
+_MATCH_CALLBACK = ctypes.CFUNCTYPE(ctypes.c_int, ctypes.c_uint, ctypes.c_size_t,
+                                   ctypes.c_size_t, ctypes.c_void_p)
+
+_EMPTY = ctypes.create_string_buffer(1)
+_EMPTY_ADDRESS = ctypes.addressof(_EMPTY)
+
+
+class _Match(ctypes.Structure):
+    _fields_ = [("position", ctypes.c_int), ("length", ctypes.c_int), ("success", ctypes.c_int)]
+
+
+class _IoVec(ctypes.Structure):
+    # c_char_p accepts both an address and a bytes object (without copying it)
+    _fields_ = [("iov_base", ctypes.c_char_p), ("iov_len", ctypes.c_size_t)]
+
+
+class _PyBuffer(ctypes.Structure):
+    _fields_ = [
+        ("buf", ctypes.c_void_p),
+        ("obj", ctypes.py_object),
+        ("len", ctypes.c_ssize_t),
+        ("itemsize", ctypes.c_ssize_t),
+        ("readonly", ctypes.c_int),
+        ("ndim", ctypes.c_int),
+        ("format", ctypes.c_char_p),
+        ("shape", ctypes.POINTER(ctypes.c_ssize_t)),
+        ("strides", ctypes.POINTER(ctypes.c_ssize_t)),
+        ("suboffsets", ctypes.POINTER(ctypes.c_ssize_t)),
+        ("internal", ctypes.c_void_p),
+    ]
+
+
+_GetBuffer = ctypes.pythonapi.PyObject_GetBuffer
+_GetBuffer.argtypes = [ctypes.py_object, ctypes.POINTER(_PyBuffer), ctypes.c_int]
+_GetBuffer.restype = ctypes.c_int
+_ReleaseBuffer = ctypes.pythonapi.PyBuffer_Release
+_ReleaseBuffer.argtypes = [ctypes.POINTER(_PyBuffer)]
+_ReleaseBuffer.restype = None
+
+
+class _Buffer:
+    """Context manager exposing the memory of a buffer object as (pointer, length)."""
+
+    def __init__(self, data):
+        self._data = data
+        self._view = None
+
+    def __enter__(self):
+        data = self._data
+        if type(data) is bytes:
+            # Immutable, and ctypes passes bytes as a pointer to their own
+            # memory, so the much slower buffer export can be skipped
+            return data, len(data)
+        # Raises TypeError for objects without a contiguous buffer (e.g. str)
+        self._view = _PyBuffer()
+        _GetBuffer(data, ctypes.byref(self._view), _PyBUF_SIMPLE)
+        # Empty buffers may have no memory; the library needs a valid pointer
+        return self._view.buf or _EMPTY_ADDRESS, self._view.len
+
+    def __exit__(self, *exc_info):
+        if self._view is not None:
+            _ReleaseBuffer(ctypes.byref(self._view))
+        return False
+
+
+@contextlib.contextmanager
+def _iovecs(buffers):
+    """Export every buffer of a batch and describe them as an iovec array."""
+    with contextlib.ExitStack() as stack:
+        vectors = (_IoVec * len(buffers))()
+        for vector, data in zip(vectors, buffers):
+            if type(data) is bytes:
+                vector.iov_base = data
+                vector.iov_len = len(data)
+            else:
+                vector.iov_base, vector.iov_len = stack.enter_context(_Buffer(data))
+        yield vectors
+
+
+def _span(match):
+    return (match.position, match.position + match.length) if match.success else None
+
+
+def _declare(lib):
+    """Set the argument and result types of the library functions."""
+    handle = ctypes.c_void_p
+    size = ctypes.c_size_t
+    match_p = ctypes.POINTER(_Match)
+
+    lib.hvm_regex_compile.argtypes = [ctypes.c_char_p]
+    lib.hvm_regex_compile.restype = handle
+    lib.hvm_regex_free.argtypes = [handle]
+    lib.hvm_regex_free.restype = None
+    lib.hvm_regex_is_native.argtypes = [handle]
+    lib.hvm_regex_is_native.restype = ctypes.c_int
+    lib.hvm_regex_alloc_scratch.argtypes = [handle, ctypes.POINTER(handle)]
+    lib.hvm_regex_alloc_scratch.restype = ctypes.c_int
+    lib.hvm_regex_free_scratch.argtypes = [handle]
+    lib.hvm_regex_free_scratch.restype = None
+    # Text is passed as an address so no bytes object has to be created
+    lib.hvm_regex_match_scratch.argtypes = [handle, handle, ctypes.c_void_p, size, size, match_p]
+    lib.hvm_regex_match_scratch.restype = ctypes.c_int
+    lib.hvm_regex_find_all_scratch.argtypes = [handle, handle, ctypes.c_void_p, size, size,
+                                               match_p, size]
+    lib.hvm_regex_find_all_scratch.restype = ctypes.c_int
+    lib.hvm_regex_match_batch.argtypes = [handle, handle, ctypes.POINTER(_IoVec), size, match_p]
+    lib.hvm_regex_match_batch.restype = ctypes.c_int
+    lib.hvm_regex_match_batch_multi.argtypes = [ctypes.POINTER(handle), size, handle,
+                                                ctypes.POINTER(_IoVec), size, match_p]
+    lib.hvm_regex_match_batch_multi.restype = ctypes.c_int
+    lib.hvm_regex_db_compile.argtypes = [ctypes.POINTER(ctypes.c_char_p),
+                                         ctypes.POINTER(ctypes.c_uint),
+                                         ctypes.POINTER(ctypes.c_uint), size]
+    lib.hvm_regex_db_compile.restype = handle
+    lib.hvm_regex_db_free.argtypes = [handle]
+    lib.hvm_regex_db_free.restype = None
+    lib.hvm_regex_db_alloc_scratch.argtypes = [handle, ctypes.POINTER(handle)]
+    lib.hvm_regex_db_alloc_scratch.restype = ctypes.c_int
+    lib.hvm_regex_db_scan.argtypes = [handle, handle, ctypes.c_void_p, size, _MATCH_CALLBACK,
+                                      ctypes.c_void_p]
+    lib.hvm_regex_db_scan.restype = ctypes.c_int
+    lib.hvm_regex_version.argtypes = []
+    lib.hvm_regex_version.restype = ctypes.c_char_p
+    return lib
+
+
+_library = None
+_library_lock = threading.Lock()
+
+
+def load_library(path=None):
+    """Load libhvmregex.
+
+    Args:
+        path: Library file; defaults to $HVM_REGEX_LIBRARY, then the copy
+            `make lib` builds next to this module
+
+    Returns:
+        ctypes.CDLL with argument types declared
+
+    Raises:
+        OSError: If the library cannot be loaded
+    """
+    global _library
+    if path is None:
+        with _library_lock:
+            if _library is None:
+                default = os.path.join(os.path.dirname(os.path.abspath(__file__)), LIBRARY_NAME)
+                _library = _declare(ctypes.CDLL(os.environ.get(LIBRARY_ENV, default)))
+            return _library
+    return _declare(ctypes.CDLL(path))
+
+
+def is_available():
+    """Check whether the C library can be loaded."""
+    try:
+        load_library()
+    except OSError:
+        return False
+    return True
+
+
+class _Scratch:
+    """Scratch handle owned by one thread, freed with it."""
+
+    def __init__(self, lib, regex_handle, alloc=None):
+        self.lib = lib
+        self.handle = ctypes.c_void_p()
+        alloc = alloc or lib.hvm_regex_alloc_scratch
+        if not alloc(regex_handle, ctypes.byref(self.handle)):
+            raise MemoryError("Could not allocate scratch space")
+
+    def __del__(self):
+        self.lib.hvm_regex_free_scratch(self.handle)
+
+
+class NativeRegex:
+    """A pattern compiled by the C library."""
+
+    def __init__(self, pattern, lib=None):
+        """Compile a pattern.
+
+        Args:
+            pattern: Regex pattern (str, encoded as UTF-8, or bytes)
+            lib: Library from load_library(), or None for the default
+
+        Raises:
+            ValueError: If the pattern is invalid or uses lookaround or
+                backreferences, which only the HVM backend supports
+            OSError: If the library cannot be loaded
+        """
+        self._lib = lib or load_library()
+        self.pattern = pattern
+        encoded = pattern.encode("utf-8") if isinstance(pattern, str) else bytes(pattern)
+        self._handle = self._lib.hvm_regex_compile(encoded)
+        if not self._handle:
+            raise ValueError(f"Invalid pattern: {pattern!r}")
+        if not self._lib.hvm_regex_is_native(self._handle):
+            self.close()
+            raise ValueError(f"Pattern needs lookaround or backreferences: {pattern!r}")
+        # Per-thread state; a thread's scratch is freed when the thread exits
+        self._local = threading.local()
+
+    def _thread_scratch(self):
+        scratch = getattr(self._local, "scratch", None)
+        if scratch is None:
+            scratch = self._local.scratch = _Scratch(self._lib, self._handle)
+        return scratch.handle
+
+    def search(self, data, pos=0):
+        """Find the leftmost match starting at or after pos.
+
+        Args:
+            data: bytes-like object to search
+            pos: Byte offset to start searching from
+
+        Returns:
+            (start, end) byte offsets of the match, or None
+        """
+        scratch = self._thread_scratch()
+        match = _Match()
+        with _Buffer(data) as (address, length):
+            if pos > length:
+                return None
+            found = self._lib.hvm_regex_match_scratch(self._handle, scratch, address, length,
+                                                      pos, ctypes.byref(match))
+        if found < 0:
+            raise RuntimeError("Scratch space does not fit the pattern")
+        if not found:
+            return None
+        return match.position, match.position + match.length
+
+    def search_many(self, buffers):
+        """Search each of a batch of buffers from its start, in one library call.
+
+        Args:
+            buffers: Sequence of bytes-like objects
+
+        Returns:
+            List with the (start, end) offsets of the leftmost match in each
+            buffer, or None for buffers without a match
+        """
+        scratch = self._thread_scratch()
+        results = (_Match * len(buffers))()
+        with _iovecs(buffers) as vectors:
+            status = self._lib.hvm_regex_match_batch(self._handle, scratch, vectors,
+                                                     len(buffers), results)
+        if status < 0:
+            raise RuntimeError("Batch match failed")
+        return [_span(match) for match in results]
+
+    def finditer(self, data, pos=0):
+        """Iterate over successive non-overlapping matches.
+
+        Matches are fetched from the library FIND_BLOCK at a time, each
+        block in one call that releases the GIL.
+
+        Args:
+            data: bytes-like object to search
+            pos: Byte offset to start searching from
+
+        Yields:
+            (start, end) byte offsets in order of position
+        """
+        block = (_Match * FIND_BLOCK)()
+        skip = None  # Empty match repeated at the start of the next block
+        while True:
+            scratch = self._thread_scratch()
+            with _Buffer(data) as (address, length):
+                if pos > length:
+                    return
+                count = self._lib.hvm_regex_find_all_scratch(self._handle, scratch, address,
+                                                             length, pos, block, FIND_BLOCK)
+            if count < 0:
+                raise RuntimeError("Scratch space does not fit the pattern")
+
+            for match in block[:count]:
+                span = (match.position, match.position + match.length)
+                if span != skip:
+                    yield span
+                skip = None
+            if count < FIND_BLOCK:
+                return
+
+            last = block[count - 1]
+            pos = last.position + last.length
+            skip = (pos, pos) if last.length == 0 else None
+
+    def findall(self, data, pos=0):
+        """Return a list of (start, end) offsets of all non-overlapping matches."""
+        return list(self.finditer(data, pos))
+
+    def close(self):
+        """Free the compiled pattern; the object cannot be used afterwards."""
+        if self._handle:
+            self._lib.hvm_regex_free(self._handle)
+            self._handle = None
+
+    def __del__(self):
+        if getattr(self, "_handle", None):
+            self.close()
+
+    def __repr__(self):
+        return f"NativeRegex({self.pattern!r})"
+
+
+def compile(pattern):
+    """Compile a pattern with the C library (see NativeRegex)."""
+    return NativeRegex(pattern)
+
+
+class NativeDatabase:
+    """A rule set compiled by the C library into one automaton."""
+
+    def __init__(self, patterns, ids=None, flags=None, lib=None):
+        """Compile a rule set.
+
+        Args:
+            patterns: Sequence of patterns (str, encoded as UTF-8, or bytes)
+            ids: Pattern IDs reported on match, or None to use indices
+            flags: Per-pattern CASELESS / SINGLEMATCH flags, or None
+            lib: Library from load_library(), or None for the default
+
+        Raises:
+            ValueError: If a pattern is invalid or uses lookaround or
+                backreferences
+            OSError: If the library cannot be loaded
+        """
+        self._lib = lib or load_library()
+        count = len(patterns)
+        encoded = (ctypes.c_char_p * count)(*(
+            pattern.encode("utf-8") if isinstance(pattern, str) else bytes(pattern)
+            for pattern in patterns))
+        id_array = (ctypes.c_uint * count)(*ids) if ids is not None else None
+        flag_array = (ctypes.c_uint * count)(*flags) if flags is not None else None
+        self._handle = self._lib.hvm_regex_db_compile(encoded, id_array, flag_array, count)
+        if not self._handle:
+            raise ValueError("Rule set contains an invalid or unsupported pattern")
+        self.count = count
+        self._local = threading.local()
+
+    def _thread_scratch(self):
+        scratch = getattr(self._local, "scratch", None)
+        if scratch is None:
+            scratch = self._local.scratch = _Scratch(self._lib, self._handle,
+                                                     self._lib.hvm_regex_db_alloc_scratch)
+        return scratch.handle
+
+    def scan(self, data, on_match=None):
+        """Scan a buffer with every pattern in one pass.
+
+        The GIL is released while scanning and re-acquired for each match
+        reported to on_match.
+
+        Args:
+            data: bytes-like object to scan
+            on_match: Called as on_match(id, start, end) for each match; a
+                true return value stops the scan. If None, matches are
+                collected and returned.
+
+        Returns:
+            List of (id, start, end) matches in order of end offset if
+            on_match is None, otherwise True if the scan ran to the end
+        """
+        matches = []
+        errors = []
+
+        def report(pattern_id, start, end, context):
+            try:
+                if on_match is None:
+                    matches.append((pattern_id, start, end))
+                    return 0
+                return 1 if on_match(pattern_id, start, end) else 0
+            except BaseException as e:  # Exceptions cannot cross the C frames
+                errors.append(e)
+                return 1
+
+        callback = _MATCH_CALLBACK(report)
+        scratch = self._thread_scratch()
+        with _Buffer(data) as (address, length):
+            status = self._lib.hvm_regex_db_scan(self._handle, scratch, address, length,
+                                                 callback, None)
+        if errors:
+            raise errors[0]
+        if status < 0:
+            raise RuntimeError("Database scan failed")
+        return matches if on_match is None else status != _SCAN_TERMINATED
+
+    def close(self):
+        """Free the database; the object cannot be used afterwards."""
+        if self._handle:
+            self._lib.hvm_regex_db_free(self._handle)
+            self._handle = None
+
+    def __del__(self):
+        if getattr(self, "_handle", None):
+            self.close()
+
+
+def search_batch(regexes, buffers):
+    """Search a batch of buffers for several patterns in one library call.
+
+    Args:
+        regexes: Sequence of NativeRegex sharing one library
+        buffers: Sequence of bytes-like objects
+
+    Returns:
+        One list per buffer holding, per pattern, the (start, end) offsets
+        of the leftmost match or None
+    """
+    if not regexes:
+        return [[] for _ in buffers]
+    lib = regexes[0]._lib
+    handles = (ctypes.c_void_p * len(regexes))(*(regex._handle for regex in regexes))
+    results = (_Match * (len(regexes) * len(buffers)))()
+    with _iovecs(buffers) as vectors:
+        # The library allocates one scratch for the whole batch
+        status = lib.hvm_regex_match_batch_multi(handles, len(regexes), None, vectors,
+                                                 len(buffers), results)
+    if status < 0:
+        raise RuntimeError("Batch match failed")
+    width = len(regexes)
+    return [[_span(match) for match in results[i * width:(i + 1) * width]]
+            for i in range(len(buffers))]
@@ -0,0 +1,582 @@
+#!/usr/bin/env python3
+"""
+Automata engine for the pure-Python fallback matcher
+
+Regular patterns (no lookaround or backreferences) are compiled to a Thompson
+NFA program and matched in time linear in the text:
+
+1. A lazily built forward DFA finds the end of the leftmost-first match.
+   States are created on demand from sets of NFA threads and cached, so each
+   text character costs one dictionary lookup once the cache is warm.
+2. A lazily built DFA for the reversed pattern scans backwards from that end
+   to find where the match starts.
+3. Only when the pattern has capturing groups, a Pike VM re-runs the NFA over
+   the matched span to fill in the group offsets.
+
+Assertions (^, $, \\b, \\B) are resolved while computing epsilon closures. A DFA
+state therefore records what kind of character precedes it, and the closure
+is computed when the next character is known.
+"""
+
+try:
+    from .hvm_regex_parser import (
+        Empty, Char, Literal, Any, Concat, Alt, CharClass, NegCharClass, Group,
+        AnchorStart, AnchorEnd, WordBoundary, NonWordBoundary,
+        is_repeat, repeat_bounds, reverse, ranges_contain, is_word_char,
+    )
+except ImportError:
+    from hvm_regex_parser import (
+        Empty, Char, Literal, Any, Concat, Alt, CharClass, NegCharClass, Group,
+        AnchorStart, AnchorEnd, WordBoundary, NonWordBoundary,
+        is_repeat, repeat_bounds, reverse, ranges_contain, is_word_char,
+    )
+
+
+# Instruction opcodes
+OP_CHAR = 0      # arg: character, arg2: case-insensitive
+OP_CLASS = 1     # arg: normalized ranges, arg2: negated
+OP_ANY = 2
+OP_SPLIT = 3     # arg: preferred target, arg2: alternative target
+OP_JMP = 4       # arg: target
+OP_SAVE = 5      # arg: capture slot
+OP_ASSERT = 6    # arg: ASSERT_* kind
+OP_MATCH = 7
+
+# Assertion kinds
+ASSERT_START = 0
+ASSERT_END = 1
+ASSERT_WORD = 2
+ASSERT_NOT_WORD = 3
+
+# What precedes a position: the text start, a word character or another character
+CTX_START = 0
+CTX_WORD = 1
+CTX_OTHER = 2
+
+# Character value used for the end of the text
+EOF = None
+
+# Identifier of the dead DFA state
+DEAD = -1
+
+# Pseudo program counter that restarts the pattern at every position
+_LOOP = -1
+
+# Default number of DFA states kept before the cache is flushed
+DEFAULT_MAX_STATES = 10000
+
+
+class Program:
+    """A compiled Thompson NFA program."""
+
+    def __init__(self):
+        self.ops = []
+        self.args = []
+        self.args2 = []
+        self.group_count = 0
+
+    def __len__(self):
+        return len(self.ops)
+
+    def emit(self, op, arg=None, arg2=None):
+        """Append an instruction and return its address."""
+        self.ops.append(op)
+        self.args.append(arg)
+        self.args2.append(arg2)
+        return len(self.ops) - 1
+
+    def patch(self, pc, arg=None, arg2=None):
+        """Set the jump targets of a previously emitted instruction."""
+        if arg is not None:
+            self.args[pc] = arg
+        if arg2 is not None:
+            self.args2[pc] = arg2
+
+    def consumes(self, pc, ch):
+        """Check whether the consuming instruction at pc accepts a character."""
+        op = self.ops[pc]
+        if op == OP_CHAR:
+            if self.args2[pc]:
+                return ch.lower() == self.args[pc]
+            return ch == self.args[pc]
+        if op == OP_CLASS:
+            return ranges_contain(self.args[pc], ord(ch)) != self.args2[pc]
+        return True  # OP_ANY
+
+
+def compile_program(node, group_count=0):
+    """Compile a regular pattern AST into an NFA program.
+
+    The program saves the overall match span in slots 0 and 1 and the span of
+    group N in slots 2N and 2N+1.
+
+    Args:
+        node: Pattern AST from hvm_regex_parser.parse
+        group_count: Number of capturing groups in the pattern
+
+    Returns:
+        Program instance
+    """
+    prog = Program()
+    prog.group_count = group_count
+    prog.emit(OP_SAVE, 0)
+    _emit(prog, node)
+    prog.emit(OP_SAVE, 1)
+    prog.emit(OP_MATCH)
+    return prog
+
+
+def _emit(prog, node):
+    t = type(node)
+
+    if t is Empty:
+        return
+    if t is Char:
+        prog.emit(OP_CHAR, node.c, node.icase)
+    elif t is Literal:
+        for c in node.text:
+            prog.emit(OP_CHAR, c, node.icase)
+    elif t is Any:
+        prog.emit(OP_ANY)
+    elif t is CharClass or t is NegCharClass:
+        prog.emit(OP_CLASS, node.ranges, t is NegCharClass)
+    elif t is Concat:
+        for child in node.nodes:
+            _emit(prog, child)
+    elif t is Alt:
+        # SPLIT L1, next; L1: a; JMP end; next: SPLIT L2, ... ; last branch
+        jumps = []
+        for child in node.nodes[:-1]:
+            split = prog.emit(OP_SPLIT)
+            prog.patch(split, arg=len(prog))
+            _emit(prog, child)
+            jumps.append(prog.emit(OP_JMP))
+            prog.patch(split, arg2=len(prog))
+        _emit(prog, node.nodes[-1])
+        for jump in jumps:
+            prog.patch(jump, arg=len(prog))
+    elif is_repeat(node):
+        inner, lo, hi, greedy = repeat_bounds(node)
+        for _ in range(lo):
+            _emit(prog, inner)
+        if hi is None:
+            _emit_star(prog, inner, greedy)
+        else:
+            # x{0,k} as (x(x(x)?)?)? so every optional copy depends on the previous one
+            splits = []
+            for _ in range(hi - lo):
+                splits.append(prog.emit(OP_SPLIT))
+                _emit_split_targets(prog, splits[-1], len(prog), None, greedy)
+                _emit(prog, inner)
+            for split in splits:
+                _emit_split_targets(prog, split, None, len(prog), greedy)
+    elif t is Group:
+        prog.emit(OP_SAVE, 2 * node.index)
+        _emit(prog, node.node)
+        prog.emit(OP_SAVE, 2 * node.index + 1)
+    elif t is AnchorStart:
+        prog.emit(OP_ASSERT, ASSERT_START)
+    elif t is AnchorEnd:
+        prog.emit(OP_ASSERT, ASSERT_END)
+    elif t is WordBoundary:
+        prog.emit(OP_ASSERT, ASSERT_WORD)
+    elif t is NonWordBoundary:
+        prog.emit(OP_ASSERT, ASSERT_NOT_WORD)
+    else:
+        raise ValueError(f"{t.__name__} is not supported by the automata engine")
+
+
+def _emit_split_targets(prog, split, enter, skip, greedy):
+    """Patch a SPLIT so `enter` is preferred for greedy repeats and `skip` for lazy ones."""
+    if greedy:
+        prog.patch(split, arg=enter, arg2=skip)
+    else:
+        prog.patch(split, arg=skip, arg2=enter)
+
+
+def _emit_star(prog, inner, greedy):
+    # L1: SPLIT L2, L3; L2: inner; JMP L1; L3:
+    split = prog.emit(OP_SPLIT)
+    _emit_split_targets(prog, split, len(prog), None, greedy)
+    _emit(prog, inner)
+    prog.emit(OP_JMP, split)
+    _emit_split_targets(prog, split, None, len(prog), greedy)
+
+
+def char_context(ch):
+    """Return the CTX_* value describing a character that precedes a position."""
+    if ch is EOF:
+        return CTX_START
+    return CTX_WORD if is_word_char(ch) else CTX_OTHER
+
+
+def check_assertion(kind, ctx, ch):
+    """Evaluate an assertion between a preceding context and the next character."""
+    if kind == ASSERT_START:
+        return ctx == CTX_START
+    if kind == ASSERT_END:
+        return ch is EOF
+    at_boundary = (ctx == CTX_WORD) != is_word_char(ch)
+    return at_boundary if kind == ASSERT_WORD else not at_boundary
+
+
+class LazyDFA:
+    """A DFA built on demand from an NFA program.
+
+    A state is the ordered list of NFA threads waiting to consume the next
+    character, plus the context of the preceding character. The order is the
+    threads' priority, which gives leftmost-first semantics: once a thread
+    reaches MATCH, all lower-priority threads are cut. In longest mode nothing
+    is cut and the scan continues while any thread is alive.
+    """
+
+    def __init__(self, prog, anchored=True, longest=False, max_states=DEFAULT_MAX_STATES):
+        """Initialize the DFA.
+
+        Args:
+            prog: Program to simulate
+            anchored: Only start the pattern at the scan start
+            longest: Report every match instead of cutting at the first
+            max_states: Number of cached states before the cache is flushed
+        """
+        self.prog = prog
+        self.anchored = anchored
+        self.longest = longest
+        self.max_states = max_states
+        self.flushes = 0
+        self._clear()
+
+    def _clear(self):
+        self._index = {}
+        self._states = []
+        self._trans = []
+        self._tagged = []
+
+    def _intern(self, key):
+        sid = self._index.get(key)
+        if sid is None:
+            if len(self._states) >= self.max_states:
+                # Bounded memory: drop everything and rebuild what is needed
+                self.flushes += 1
+                self._clear()
+            sid = len(self._states)
+            self._index[key] = sid
+            self._states.append(key)
+            self._trans.append({})
+            self._tagged.append({})
+        return sid
+
+    @property
+    def state_count(self):
+        """Number of states currently cached."""
+        return len(self._states)
+
+    def snapshot(self):
+        """Return the cached states and transitions as plain, marshallable data."""
+        return (self.flushes, self._states, self._trans, self._tagged)
+
+    def restore(self, snapshot):
+        """Replace the cache with one returned by snapshot() for the same program."""
+        self.flushes, states, self._trans, self._tagged = snapshot
+        self._states = list(states)
+        self._index = {key: sid for sid, key in enumerate(self._states)}
+
+    def start(self, ctx):
+        """Return the start state for a scan preceded by the given context."""
+        return self._intern(((_LOOP,) if not self.anchored else (0,), ctx))
+
+    def next(self, sid, ch):
+        """Advance a state over one character (or EOF).
+
+        Returns:
+            (next_state, matched) where matched tells whether a match ends
+            before ch; next_state is DEAD when no thread survives ch
+        """
+        trans = self._trans[sid]
+        result = trans.get(ch)
+        if result is not None:
+            return result
+
+        flushes = self.flushes
+        next_sid, match_origin, _ = self.step(sid, ch)
+        result = (next_sid, match_origin is not None)
+        if flushes == self.flushes:
+            trans[ch] = result
+        return result
+
+    def step(self, sid, ch):
+        """Advance a state like next(), also reporting where threads came from.
+
+        Entries of a state's kernel are threads; origins tell which entry of
+        the current kernel each entry of the next kernel descends from, so a
+        caller can carry per-thread data (such as match starts) along without
+        simulating the NFA. Origin -1 means the thread was started at ch by
+        the unanchored restart.
+
+        Returns:
+            (next_state, match_origin, origins) where match_origin is the
+            origin of the highest-priority thread that reached MATCH before
+            ch, or None if no match ends there
+        """
+        tagged = self._tagged[sid]
+        result = tagged.get(ch)
+        if result is not None:
+            return result
+
+        kernel, ctx = self._states[sid]
+        threads, thread_origins, match_origin = self._closure(kernel, ctx, ch)
+
+        next_sid = DEAD
+        origins = ()
+        if ch is not EOF:
+            consumes = self.prog.consumes
+            next_kernel = []
+            next_origins = []
+            for pc, origin in zip(threads, thread_origins):
+                if pc == _LOOP:
+                    next_kernel.append(_LOOP)
+                    next_origins.append(-1)
+                elif consumes(pc, ch):
+                    next_kernel.append(pc + 1)
+                    next_origins.append(origin)
+            if next_kernel:
+                origins = tuple(next_origins)
+                flushes = self.flushes
+                next_sid = self._intern((tuple(next_kernel), char_context(ch)))
+                if flushes != self.flushes:
+                    # sid no longer exists; do not cache the transition
+                    return next_sid, match_origin, origins
+
+        result = (next_sid, match_origin, origins)
+        tagged[ch] = result
+        return result
+
+    def _closure(self, kernel, ctx, ch):
+        """Follow epsilon transitions from the kernel threads in priority order.
+
+        Returns:
+            (threads, origins, match_origin): consuming instructions (and the
+            restart marker) in priority order, the kernel index each one comes
+            from (-1 for the restart), and the origin of the first thread to
+            reach MATCH, or None
+        """
+        prog = self.prog
+        ops, args, args2 = prog.ops, prog.args, prog.args2
+        seen = set()
+        threads = []
+        origins = []
+        match_origin = None
+
+        for index, entry in enumerate(kernel):
+            if entry == _LOOP:
+                stack = [0]
+                index = -1
+            else:
+                stack = [entry]
+
+            while stack:
+                pc = stack.pop()
+                if pc in seen:
+                    continue
+                seen.add(pc)
+                op = ops[pc]
+
+                if op == OP_SPLIT:
+                    stack.append(args2[pc])
+                    stack.append(args[pc])
+                elif op == OP_JMP:
+                    stack.append(args[pc])
+                elif op == OP_SAVE:
+                    stack.append(pc + 1)
+                elif op == OP_ASSERT:
+                    if check_assertion(args[pc], ctx, ch):
+                        stack.append(pc + 1)
+                elif op == OP_MATCH:
+                    if match_origin is None:
+                        match_origin = index
+                    if not self.longest:
+                        # Leftmost-first: lower-priority threads can never win
+                        return threads, origins, match_origin
+                else:
+                    threads.append(pc)
+                    origins.append(index)
+
+            if entry == _LOOP:
+                threads.append(_LOOP)
+                origins.append(-1)
+
+        return threads, origins, match_origin
+
+
+def pike_search(prog, text, pos=0, anchored=True, endpos=None, nonempty=False):
+    """Run the NFA with capture tracking (Pike VM).
+
+    Args:
+        prog: Program to run
+        text: Input text
+        pos: Position to start at
+        anchored: Only accept matches starting at pos
+        endpos: Position to stop scanning at (defaults to len(text)); the text
+            after it still provides context for assertions
+        nonempty: Ignore matches that end at pos
+
+    Returns:
+        List of capture slots (-1 for unset) for the leftmost-first match, or None
+    """
+    n = len(text)
+    endpos = n if endpos is None else endpos
+    ops, args, args2 = prog.ops, prog.args, prog.args2
+    nslots = 2 * (prog.group_count + 1)
+
+    kernel = []   # (pc, slots) pairs in priority order
+    best = None
+    i = pos
+    ctx = char_context(text[pos - 1] if pos > 0 else EOF)
+
+    while True:
+        ch = text[i] if i < n else EOF
+        if best is None and (not anchored or i == pos):
+            kernel.append((0, [-1] * nslots))
+
+        seen = set()
+        threads = []
+        for start_pc, start_slots in kernel:
+            stack = [(start_pc, start_slots)]
+            cut = False
+            while stack:
+                pc, slots = stack.pop()
+                if pc in seen:
+                    continue
+                seen.add(pc)
+                op = ops[pc]
+
+                if op == OP_SPLIT:
+                    stack.append((args2[pc], slots))
+                    stack.append((args[pc], slots))
+                elif op == OP_JMP:
+                    stack.append((args[pc], slots))
+                elif op == OP_SAVE:
+                    slots = list(slots)
+                    slots[args[pc]] = i
+                    stack.append((pc + 1, slots))
+                elif op == OP_ASSERT:
+                    if check_assertion(args[pc], ctx, ch):
+                        stack.append((pc + 1, slots))
+                elif op == OP_MATCH:
+                    if nonempty and i == pos:
+                        continue
+                    best = slots
+                    cut = True
+                    break
+                else:
+                    threads.append((pc, slots))
+            if cut:
+                break
+
+        if i >= endpos:
+            return best
+
+        kernel = [(pc + 1, slots) for pc, slots in threads if prog.consumes(pc, ch)]
+        if not kernel and (best is not None or anchored):
+            return best
+        ctx = char_context(ch)
+        i += 1
+
+
+class NfaRegex:
+    """Linear-time matcher for regular patterns."""
+
+    def __init__(self, node, group_count=0, max_states=DEFAULT_MAX_STATES):
+        """Compile the forward, anchored and reverse automata for a pattern.
+
+        Args:
+            node: Pattern AST (must satisfy hvm_regex_parser.is_regular)
+            group_count: Number of capturing groups in the pattern
+            max_states: DFA cache budget per automaton
+        """
+        self.node = node
+        self.group_count = group_count
+        self.prog = compile_program(node, group_count)
+        self.reverse_prog = compile_program(reverse(node))
+        self.forward_dfa = LazyDFA(self.prog, anchored=False, max_states=max_states)
+        self.anchored_dfa = LazyDFA(self.prog, anchored=True, max_states=max_states)
+        self.reverse_dfa = LazyDFA(self.reverse_prog, anchored=True, longest=True,
+                                   max_states=max_states)
+
+    def search(self, text, pos=0):
+        """Find the leftmost-first match starting at or after pos.
+
+        Returns:
+            (start, end, groups) where groups holds a (start, end) pair per
+            capturing group ((-1, -1) if it did not participate), or None
+        """
+        if pos < 0 or pos > len(text):
+            return None
+        end = self._scan_forward(self.forward_dfa, text, pos)
+        if end is None:
+            return None
+        start = self._scan_reverse(text, pos, end)
+        return self._with_groups(text, start, end)
+
+    def match(self, text, pos=0):
+        """Match the pattern exactly at pos; same result format as search."""
+        if pos < 0 or pos > len(text):
+            return None
+        end = self._scan_forward(self.anchored_dfa, text, pos)
+        if end is None:
+            return None
+        return self._with_groups(text, pos, end)
+
+    def match_nonempty(self, text, pos):
+        """Match exactly at pos, skipping alternatives that match the empty string."""
+        if pos < 0 or pos >= len(text):
+            return None
+        slots = pike_search(self.prog, text, pos, anchored=True, nonempty=True)
+        if slots is None:
+            return None
+        groups = tuple((slots[2 * g], slots[2 * g + 1]) for g in range(1, self.group_count + 1))
+        return pos, slots[1], groups
+
+    @staticmethod
+    def _scan_forward(dfa, text, pos):
+        """Return the end of the leftmost-first match, or None."""
+        n = len(text)
+        state = dfa.start(char_context(text[pos - 1] if pos > 0 else EOF))
+        end = None
+        i = pos
+        while True:
+            ch = text[i] if i < n else EOF
+            state, matched = dfa.next(state, ch)
+            if matched:
+                end = i
+            if i >= n or state == DEAD:
+                return end
+            i += 1
+
+    def _scan_reverse(self, text, pos, end):
+        """Return the leftmost position >= pos where a match ending at end starts."""
+        dfa = self.reverse_dfa
+        n = len(text)
+        state = dfa.start(char_context(text[end] if end < n else EOF))
+        start = end
+        i = end
+        while True:
+            ch = text[i - 1] if i > 0 else EOF
+            next_state, matched = dfa.next(state, ch)
+            if matched:
+                start = i
+            if i <= pos or next_state == DEAD:
+                return start
+            state = next_state
+            i -= 1
+
+    def _with_groups(self, text, start, end):
+        if not self.group_count:
+            return start, end, ()
+
+        slots = pike_search(self.prog, text, start, anchored=True, endpos=end)
+        if slots is None or slots[1] != end:
+            # The automata and the Pike VM implement the same semantics
+            raise RuntimeError("Inconsistent capture resolution")
+        groups = tuple((slots[2 * g], slots[2 * g + 1]) for g in range(1, self.group_count + 1))
+        return start, end, groups
@@ -0,0 +1,218 @@
+#!/usr/bin/env python3
+"""
+Multi-core scanning with a process pool
+
+HvmRegexMatcher matches on one core: the pure-Python engine holds the GIL
+and every hvml launch is waited for in turn. ParallelScanner shards work
+across a ProcessPoolExecutor whose workers each compile the rule set once,
+when they start, and then only receive texts:
+
+- scan_many(texts) sends batches of texts to the workers.
+- scan_text(text) splits one large text into pieces at separator
+  boundaries (newlines by default) and scans the pieces in parallel.
+
+Results come back as (pattern_index, start, end) tuples and are merged in
+input order, so they equal those of a sequential scan. A piece boundary
+always falls right after a separator; matches that would span one (for
+example `\\s+` across a newline) are not reported, so only split on a
+separator no pattern is meant to match across.
+"""
+
+import concurrent.futures
+import contextlib
+import io
+import os
+
+try:
+    from . import hvm_regex_wrapper
+except ImportError:
+    import hvm_regex_wrapper
+
+
+# Default size of the pieces scan_text splits a text into
+DEFAULT_CHUNK_SIZE = 1 << 20
+
+# Rule set compiled by the worker process (see _load_rules)
+_worker_patterns = None
+
+
+def _load_rules(patterns, cache_dir, matcher_options):
+    """Worker initializer: compile the rule set once per process."""
+    global _worker_patterns
+    # Every worker would otherwise announce the backend it picked
+    with contextlib.redirect_stdout(io.StringIO()):
+        matcher = hvm_regex_wrapper.HvmRegexMatcher(**matcher_options)
+    _worker_patterns = matcher.compile_all(patterns, cache_dir)
+
+
+def _find_spans(text, pos=0, end=None, last=True):
+    """Find every match of the worker's rule set.
+
+    Args:
+        text: Text to scan
+        pos: Position to start scanning from
+        end: Offset matches must end by (None for the end of text)
+        last: Whether end is the end of the whole input; otherwise matches
+            starting at end belong to the next piece
+
+    Returns:
+        List of (pattern_index, start, end) sorted by start, then pattern
+    """
+    if end is None:
+        end = len(text)
+    spans = []
+    for index, compiled in enumerate(_worker_patterns):
+        for result in compiled.finditer(text, pos):
+            start, stop = result.span()
+            if start > end or (start == end and not last):
+                break
+            if stop <= end:
+                spans.append((index, start, stop))
+    spans.sort(key=lambda span: (span[1], span[0]))
+    return spans
+
+
+def _scan_texts(texts):
+    """Worker task: scan a batch of texts."""
+    return [_find_spans(text) for text in texts]
+
+
+def _scan_piece(text, pos, end, last, offset):
+    """Worker task: scan one piece of a large text.
+
+    Args:
+        text: The piece with one character of context on each side
+        pos: Offset of the piece in text
+        end: Offset of the end of the piece in text
+        last: Whether the piece ends the input
+        offset: Offset of text in the input
+    """
+    return [(index, start + offset, stop + offset)
+            for index, start, stop in _find_spans(text, pos, end, last)]
+
+
+def split_points(text, chunk_size=DEFAULT_CHUNK_SIZE, separator="\n"):
+    """Choose the boundaries scan_text splits text at.
+
+    Each boundary follows the first separator at or after a multiple of
+    chunk_size past the previous boundary.
+
+    Args:
+        text: Text to split
+        chunk_size: Minimum piece length
+        separator: Separator pieces end with
+
+    Returns:
+        Increasing list of offsets starting with 0 and ending with len(text)
+    """
+    if chunk_size < 1:
+        raise ValueError("chunk_size must be at least 1")
+
+    points = [0]
+    while True:
+        found = text.find(separator, points[-1] + chunk_size)
+        if found < 0 or found + len(separator) >= len(text):
+            break
+        points.append(found + len(separator))
+    points.append(len(text))
+    return points
+
+
+class ParallelScanner:
+    """Scan texts with a rule set on a pool of worker processes."""
+
+    def __init__(self, patterns, workers=None, cache_dir=None, **matcher_options):
+        """Start the worker pool.
+
+        Args:
+            patterns: List of pattern strings or (pattern, flags) pairs
+            workers: Number of worker processes (defaults to the CPU count)
+            cache_dir: Directory of compiled rule set files (see
+                HvmRegexMatcher.compile_all), so workers load rather than
+                compile the rules
+            **matcher_options: HvmRegexMatcher arguments for the workers'
+                matchers; force_fallback defaults to True so matching runs
+                in the worker processes themselves
+        """
+        matcher_options.setdefault("force_fallback", True)
+        self.patterns = list(patterns)
+        self.workers = workers or os.cpu_count() or 1
+        self._executor = concurrent.futures.ProcessPoolExecutor(
+            max_workers=self.workers,
+            initializer=_load_rules,
+            initargs=(self.patterns, cache_dir, matcher_options),
+        )
+
+    def close(self):
+        """Shut down the worker processes."""
+        self._executor.shutdown()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def scan_many(self, texts, batch_size=None):
+        """Scan every text with every pattern.
+
+        Args:
+            texts: Iterable of texts
+            batch_size: Texts sent to a worker per task (defaults to spreading
+                the texts over four tasks per worker)
+
+        Returns:
+            One list of (pattern_index, start, end) per text, in input order,
+            each sorted by start and then pattern
+        """
+        texts = list(texts)
+        if batch_size is None:
+            batch_size = max(1, -(-len(texts) // (self.workers * 4)))
+
+        batches = [texts[i:i + batch_size] for i in range(0, len(texts), batch_size)]
+        results = []
+        for batch in self._executor.map(_scan_texts, batches):
+            results.extend(batch)
+        return results
+
+    def scan_text(self, text, chunk_size=DEFAULT_CHUNK_SIZE, separator="\n"):
+        """Scan one large text, split into pieces at separator boundaries.
+
+        Args:
+            text: Text to scan
+            chunk_size: Minimum piece length
+            separator: Separator no match spans
+
+        Returns:
+            List of (pattern_index, start, end) sorted by start, then pattern
+        """
+        points = split_points(text, chunk_size, separator)
+        futures = []
+        for start, end in zip(points, points[1:]):
+            # One character of context on each side keeps ^, $ and \b exact
+            lo = max(start - 1, 0)
+            hi = min(end + 1, len(text))
+            futures.append(self._executor.submit(
+                _scan_piece, text[lo:hi], start - lo, end - lo, end == len(text), lo))
+
+        spans = []
+        for future in futures:
+            spans.extend(future.result())
+        return spans
+
+
+def scan_many(texts, patterns, workers=None, **options):
+    """Scan texts with a rule set on a temporary worker pool.
+
+    Args:
+        texts: Iterable of texts
+        patterns: List of pattern strings or (pattern, flags) pairs
+        workers: Number of worker processes (defaults to the CPU count)
+        **options: ParallelScanner arguments
+
+    Returns:
+        One list of (pattern_index, start, end) per text (see
+        ParallelScanner.scan_many)
+    """
+    with ParallelScanner(patterns, workers, **options) as scanner:
+        return scanner.scan_many(texts)
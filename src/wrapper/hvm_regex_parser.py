@@ -0,0 +1,598 @@
+#!/usr/bin/env python3
+"""
+Regex parser for the pure-Python fallback engine
+
+Parses the regex syntax supported by the HVM engine into an AST whose node types
+mirror the Pattern constructors of optimized_regex.hvml. Unlike the HVML types,
+Concat and Alt are n-ary, repetitions carry a greediness flag, and Char/Literal
+carry a case-insensitivity flag.
+
+Supported syntax: literals and escapes (\\n, \\t, \\xHH, \\uHHHH, escaped
+metacharacters), `.`, classes (`[abc]`, `[^a-z]`, `\\d \\w \\s \\D \\W \\S`),
+anchors (`^`, `$`), word boundaries (`\\b`, `\\B`), groups (`(...)`, `(?:...)`),
+alternation, `*`, `+`, `?`, `{n}`, `{n,}`, `{n,m}` and their lazy `?` forms,
+lookahead/lookbehind, backreferences (`\\1`-`\\99`) and inline `(?i)` flags.
+"""
+
+import bisect
+import collections
+
+
+# Compilation flags (same value as re.IGNORECASE)
+IGNORECASE = 2
+
+# Largest code point a character class can contain
+MAX_CODEPOINT = 0x10FFFF
+
+# Largest count accepted in a bounded repetition
+MAX_REPEAT = 1000
+
+# Predefined character class ranges (ASCII semantics, like the HVML engine)
+DIGIT_RANGES = ((0x30, 0x39),)
+WORD_RANGES = ((0x30, 0x39), (0x41, 0x5A), (0x5F, 0x5F), (0x61, 0x7A))
+SPACE_RANGES = ((0x09, 0x0D), (0x20, 0x20))
+
+
+class RegexError(ValueError):
+    """Raised for syntax errors in a regex pattern."""
+
+    def __init__(self, message, pattern=None, pos=None):
+        if pattern is not None and pos is not None:
+            message = f"{message} at position {pos} in {pattern!r}"
+        super().__init__(message)
+        self.pattern = pattern
+        self.pos = pos
+
+
+# === AST node types ===
+# Nodes are compared by identity and dispatched on type, never with ==.
+
+Empty = collections.namedtuple("Empty", [])
+Char = collections.namedtuple("Char", ["c", "icase"])
+Literal = collections.namedtuple("Literal", ["text", "icase"])
+Any = collections.namedtuple("Any", [])
+Concat = collections.namedtuple("Concat", ["nodes"])
+Alt = collections.namedtuple("Alt", ["nodes"])
+Star = collections.namedtuple("Star", ["node", "greedy"])
+Plus = collections.namedtuple("Plus", ["node", "greedy"])
+Optional = collections.namedtuple("Optional", ["node", "greedy"])
+Repeat = collections.namedtuple("Repeat", ["node", "n"])
+RepeatRange = collections.namedtuple("RepeatRange", ["node", "min", "max", "greedy"])  # max None = unbounded
+CharClass = collections.namedtuple("CharClass", ["ranges"])
+NegCharClass = collections.namedtuple("NegCharClass", ["ranges"])
+Group = collections.namedtuple("Group", ["node", "index"])
+AnchorStart = collections.namedtuple("AnchorStart", [])
+AnchorEnd = collections.namedtuple("AnchorEnd", [])
+WordBoundary = collections.namedtuple("WordBoundary", [])
+NonWordBoundary = collections.namedtuple("NonWordBoundary", [])
+PosLookahead = collections.namedtuple("PosLookahead", ["node"])
+NegLookahead = collections.namedtuple("NegLookahead", ["node"])
+PosLookbehind = collections.namedtuple("PosLookbehind", ["node"])
+NegLookbehind = collections.namedtuple("NegLookbehind", ["node"])
+Backref = collections.namedtuple("Backref", ["index", "icase"])
+
+# Nodes that match exactly one character
+SINGLE_CHAR_NODES = (Char, Any, CharClass, NegCharClass)
+
+# Nodes the automata engines cannot handle
+NON_REGULAR_NODES = (PosLookahead, NegLookahead, PosLookbehind, NegLookbehind, Backref)
+
+_REPEAT_NODES = (Star, Plus, Optional, Repeat, RepeatRange)
+_LOOKAROUND_NODES = (PosLookahead, NegLookahead, PosLookbehind, NegLookbehind)
+
+
+# === Character range helpers ===
+
+def normalize_ranges(ranges):
+    """Sort and merge overlapping or adjacent (lo, hi) code point ranges."""
+    merged = []
+    for lo, hi in sorted(ranges):
+        if merged and lo <= merged[-1][1] + 1:
+            if hi > merged[-1][1]:
+                merged[-1] = (merged[-1][0], hi)
+        else:
+            merged.append((lo, hi))
+    return tuple(merged)
+
+
+def negate_ranges(ranges):
+    """Return the complement of normalized ranges over all code points."""
+    result = []
+    next_lo = 0
+    for lo, hi in ranges:
+        if lo > next_lo:
+            result.append((next_lo, lo - 1))
+        next_lo = hi + 1
+    if next_lo <= MAX_CODEPOINT:
+        result.append((next_lo, MAX_CODEPOINT))
+    return tuple(result)
+
+
+# Cased characters all lie in the first two planes
+_MAX_CASED = 0x1FFFF
+
+# Groups of code points with the same str.lower(), built on first use
+_case_groups = None
+
+
+def case_groups():
+    """Return the code point groups that case-insensitive matching treats as equal.
+
+    Characters are compared through str.lower(), so a group is a lowercase
+    character together with every character lowering to it, e.g. k, K and
+    U+212A KELVIN SIGN. Characters without case variants are left out.
+    """
+    global _case_groups
+    if _case_groups is None:
+        groups = collections.defaultdict(set)
+        for cp in range(_MAX_CASED + 1):
+            lower = chr(cp).lower()
+            if len(lower) == 1 and ord(lower) != cp:
+                groups[lower].add(cp)
+                if lower.lower() == lower:
+                    groups[lower].add(ord(lower))
+        _case_groups = tuple(tuple(sorted(group)) for group in groups.values())
+    return _case_groups
+
+
+def fold_ranges(ranges):
+    """Extend ranges with every character that matches one of theirs case-insensitively.
+
+    Uses the same str.lower() mapping as single characters, so (?i)[k]
+    matches exactly what (?i)k does.
+    """
+    ranges = normalize_ranges(ranges)
+    extra = []
+    for group in case_groups():
+        if any(ranges_contain(ranges, cp) for cp in group):
+            extra.extend((cp, cp) for cp in group)
+    return normalize_ranges(ranges + tuple(extra))
+
+
+def ranges_contain(ranges, cp):
+    """Check whether a code point lies in normalized ranges.
+
+    Binary search over the sorted ranges, so large classes cost O(log n).
+    """
+    i = bisect.bisect_right(ranges, (cp, MAX_CODEPOINT)) - 1
+    return i >= 0 and cp <= ranges[i][1]
+
+
+def is_word_char(ch):
+    """Check if a character is a word character ([A-Za-z0-9_])."""
+    return ch is not None and ranges_contain(WORD_RANGES, ord(ch))
+
+
+# === Parser ===
+
+class _Parser:
+    """Recursive-descent parser producing the AST for one pattern."""
+
+    def __init__(self, pattern, flags):
+        self.pattern = pattern
+        self.pos = 0
+        self.flags = flags
+        self.group_count = 0
+
+    def error(self, message, pos=None):
+        return RegexError(message, self.pattern, self.pos if pos is None else pos)
+
+    def peek(self, offset=0):
+        index = self.pos + offset
+        return self.pattern[index] if index < len(self.pattern) else None
+
+    def parse(self):
+        node = self.parse_alt()
+        if self.pos < len(self.pattern):
+            raise self.error("Unbalanced parenthesis")
+        return node
+
+    def parse_alt(self):
+        branches = [self.parse_seq()]
+        while self.peek() == "|":
+            self.pos += 1
+            branches.append(self.parse_seq())
+        return branches[0] if len(branches) == 1 else Alt(tuple(branches))
+
+    def parse_seq(self):
+        items = []
+        while self.peek() is not None and self.peek() not in "|)":
+            atom = self.parse_atom()
+            if atom is None:
+                continue  # Inline flag group, nothing to match
+            items.append(self.parse_quantifiers(atom))
+        return make_concat(items)
+
+    def parse_atom(self):
+        start = self.pos
+        c = self.pattern[self.pos]
+        self.pos += 1
+
+        if c == "(":
+            return self.parse_group(start)
+        if c == "[":
+            return self.parse_class(start)
+        if c == ".":
+            return Any()
+        if c == "^":
+            return AnchorStart()
+        if c == "$":
+            return AnchorEnd()
+        if c == "\\":
+            return self.parse_escape()
+        if c in "*+?" or (c == "{" and self.quantifier_ahead(start)):
+            raise self.error("Nothing to repeat", start)
+
+        return self.char_node(c)
+
+    def char_node(self, c):
+        icase = bool(self.flags & IGNORECASE) and c.lower() != c.upper()
+        return Char(c.lower() if icase else c, icase)
+
+    def class_node(self, ranges, negated, folded=()):
+        """Build a class node. Under IGNORECASE ranges are case-folded; folded
+        ranges (\\d, \\w, \\s inside brackets) are already closed and added as-is."""
+        if self.flags & IGNORECASE:
+            ranges = fold_ranges(ranges)
+        if folded:
+            ranges = normalize_ranges(tuple(ranges) + tuple(folded))
+        return NegCharClass(ranges) if negated else CharClass(ranges)
+
+    def parse_group(self, start):
+        saved_flags = self.flags
+
+        if self.peek() == "?":
+            self.pos += 1
+            kind = self.peek()
+
+            if kind == ":":
+                self.pos += 1
+                node = self.parse_alt()
+            elif kind in ("=", "!"):
+                self.pos += 1
+                inner = self.parse_alt()
+                node = PosLookahead(inner) if kind == "=" else NegLookahead(inner)
+            elif kind == "<" and self.peek(1) in ("=", "!"):
+                kind = self.peek(1)
+                self.pos += 2
+                inner = self.parse_alt()
+                node = PosLookbehind(inner) if kind == "=" else NegLookbehind(inner)
+            else:
+                flags = self.parse_inline_flags()
+                if self.peek() == ")":
+                    # (?i) applies to the rest of the enclosing group
+                    self.pos += 1
+                    self.flags |= flags
+                    return None
+                if self.peek() != ":":
+                    raise self.error("Unknown extension")
+                self.pos += 1
+                self.flags |= flags
+                node = self.parse_alt()
+        else:
+            self.group_count += 1
+            index = self.group_count
+            node = Group(self.parse_alt(), index)
+
+        if self.peek() != ")":
+            raise self.error("Missing ), unterminated subpattern", start)
+        self.pos += 1
+        self.flags = saved_flags
+        return node
+
+    def parse_inline_flags(self):
+        flags = 0
+        while self.peek() is not None and self.peek().isalpha():
+            if self.peek() != "i":
+                raise self.error(f"Unknown flag {self.peek()!r}")
+            flags |= IGNORECASE
+            self.pos += 1
+        if not flags:
+            raise self.error("Unknown extension")
+        return flags
+
+    def quantifier_ahead(self, start):
+        """Check whether a valid {n}, {n,} or {n,m} quantifier starts at start."""
+        end = self.pattern.find("}", start)
+        if end < 0:
+            return False
+        body = self.pattern[start + 1:end]
+        lo, sep, hi = body.partition(",")
+        return lo.isdigit() and (not hi or hi.isdigit())
+
+    def parse_quantifiers(self, atom):
+        quantified = False
+        while True:
+            start = self.pos
+            c = self.peek()
+
+            if c in ("*", "+", "?"):
+                self.pos += 1
+                bounds = {"*": (0, None), "+": (1, None), "?": (0, 1)}[c]
+            elif c == "{" and self.quantifier_ahead(start):
+                end = self.pattern.index("}", start)
+                lo, sep, hi = self.pattern[start + 1:end].partition(",")
+                bounds = (int(lo), int(hi) if hi else (None if sep else int(lo)))
+                self.pos = end + 1
+                if bounds[1] is not None and bounds[1] < bounds[0]:
+                    raise self.error("Min repeat greater than max repeat", start)
+                if max(bounds[0], bounds[1] or 0) > MAX_REPEAT:
+                    raise self.error("Repetition count too large", start)
+            else:
+                return atom
+
+            if quantified:
+                raise self.error("Multiple repeat", start)
+            quantified = True
+
+            greedy = True
+            if self.peek() == "?":
+                self.pos += 1
+                greedy = False
+
+            atom = make_repeat(atom, bounds[0], bounds[1], greedy, c)
+
+    def parse_class(self, start):
+        negated = False
+        if self.peek() == "^":
+            negated = True
+            self.pos += 1
+
+        ranges = []
+        predefined = []
+        first = True
+        while True:
+            c = self.peek()
+            if c is None:
+                raise self.error("Unterminated character set", start)
+            if c == "]" and not first:
+                self.pos += 1
+                break
+            first = False
+
+            lo = self.parse_class_atom(predefined)
+            if lo is None:
+                continue  # A predefined class was added
+
+            if self.peek() == "-" and self.peek(1) not in (None, "]"):
+                range_pos = self.pos
+                self.pos += 1
+                hi = self.parse_class_atom(predefined)
+                if hi is None:
+                    raise self.error("Bad character range", range_pos)
+                if hi < lo:
+                    raise self.error("Bad character range", range_pos)
+                ranges.append((lo, hi))
+            else:
+                ranges.append((lo, lo))
+
+        return self.class_node(normalize_ranges(ranges), negated, predefined)
+
+    def parse_class_atom(self, predefined):
+        """Parse one class member. Returns its code point, or None if a
+        predefined class was appended to predefined instead.
+
+        Under IGNORECASE a predefined class is folded before it is negated,
+        as the bare escape is, so \\W stays the complement of the folded \\w.
+        """
+        c = self.pattern[self.pos]
+        self.pos += 1
+        if c != "\\":
+            return ord(c)
+
+        e = self.peek()
+        if e is None:
+            raise self.error("Bad escape (end of pattern)")
+        self.pos += 1
+
+        base = _PREDEFINED_CLASSES.get(e.lower())
+        if base is not None:
+            if self.flags & IGNORECASE:
+                base = fold_ranges(base)
+            predefined.extend(negate_ranges(base) if e.isupper() else base)
+            return None
+        if e == "b":
+            return 0x08
+        return ord(self.parse_char_escape(e))
+
+    def parse_escape(self):
+        e = self.peek()
+        if e is None:
+            raise self.error("Bad escape (end of pattern)")
+        self.pos += 1
+
+        predefined = _PREDEFINED_CLASSES.get(e.lower())
+        if predefined is not None:
+            return self.class_node(predefined, e.isupper())
+        if e == "b":
+            return WordBoundary()
+        if e == "B":
+            return NonWordBoundary()
+        if e.isdigit() and e != "0":
+            digits = e
+            if self.peek() is not None and self.peek().isdigit():
+                digits += self.peek()
+                self.pos += 1
+            index = int(digits)
+            if index > self.group_count:
+                raise self.error("Invalid group reference")
+            return Backref(index, bool(self.flags & IGNORECASE))
+
+        return self.char_node(self.parse_char_escape(e))
+
+    def parse_char_escape(self, e):
+        """Decode a single-character escape whose letter has been consumed."""
+        simple = {"n": "\n", "t": "\t", "r": "\r", "f": "\f", "v": "\v", "a": "\a", "0": "\0"}
+        if e in simple:
+            return simple[e]
+        if e in ("x", "u"):
+            width = 2 if e == "x" else 4
+            digits = self.pattern[self.pos:self.pos + width]
+            if len(digits) != width or any(d not in "0123456789abcdefABCDEF" for d in digits):
+                raise self.error(f"Incomplete escape \\{e}{digits}")
+            self.pos += width
+            return chr(int(digits, 16))
+        if e.isalnum():
+            raise self.error(f"Bad escape \\{e}")
+        return e
+
+
+_PREDEFINED_CLASSES = {"d": DIGIT_RANGES, "w": WORD_RANGES, "s": SPACE_RANGES}
+
+
+# === AST construction and analysis helpers ===
+
+def make_concat(items):
+    """Build a concatenation, merging adjacent characters into literals."""
+    merged = []
+    for item in items:
+        if type(item) in (Char, Literal) and merged and type(merged[-1]) in (Char, Literal) \
+                and merged[-1].icase == item.icase:
+            prev = merged.pop()
+            prev_text = prev.c if type(prev) is Char else prev.text
+            item_text = item.c if type(item) is Char else item.text
+            merged.append(Literal(prev_text + item_text, item.icase))
+        else:
+            merged.append(item)
+
+    if not merged:
+        return Empty()
+    if len(merged) == 1:
+        return merged[0]
+    return Concat(tuple(merged))
+
+
+def make_repeat(node, lo, hi, greedy, op=None):
+    """Build the repetition node matching the given bounds."""
+    if op == "*":
+        return Star(node, greedy)
+    if op == "+":
+        return Plus(node, greedy)
+    if op == "?":
+        return Optional(node, greedy)
+    if hi == lo:
+        return Repeat(node, lo)
+    return RepeatRange(node, lo, hi, greedy)
+
+
+def repeat_bounds(node):
+    """Return (inner node, min, max, greedy) for a repetition node; max None = unbounded."""
+    t = type(node)
+    if t is Star:
+        return node.node, 0, None, node.greedy
+    if t is Plus:
+        return node.node, 1, None, node.greedy
+    if t is Optional:
+        return node.node, 0, 1, node.greedy
+    if t is Repeat:
+        return node.node, node.n, node.n, True
+    return node.node, node.min, node.max, node.greedy
+
+
+def is_repeat(node):
+    """Check if a node is one of the repetition constructors."""
+    return type(node) in _REPEAT_NODES
+
+
+def children(node):
+    """Return the direct sub-patterns of a node."""
+    t = type(node)
+    if t in (Concat, Alt):
+        return node.nodes
+    if t in _REPEAT_NODES or t is Group or t in _LOOKAROUND_NODES:
+        return (node.node,)
+    return ()
+
+
+def walk(node):
+    """Yield a node and all of its descendants."""
+    stack = [node]
+    while stack:
+        current = stack.pop()
+        yield current
+        stack.extend(reversed(children(current)))
+
+
+def is_regular(node):
+    """Check whether a pattern can be handled by the automata engines."""
+    return not any(isinstance(n, NON_REGULAR_NODES) for n in walk(node))
+
+
+def width_range(node):
+    """Compute the (min, max) number of characters a pattern can match.
+
+    Returns:
+        (min, max) tuple where max is None if the width is unbounded
+    """
+    t = type(node)
+    if t in SINGLE_CHAR_NODES:
+        return 1, 1
+    if t is Literal:
+        return len(node.text), len(node.text)
+    if t is Concat:
+        lo, hi = 0, 0
+        for child in node.nodes:
+            child_lo, child_hi = width_range(child)
+            lo += child_lo
+            hi = None if hi is None or child_hi is None else hi + child_hi
+        return lo, hi
+    if t is Alt:
+        widths = [width_range(child) for child in node.nodes]
+        lo = min(w[0] for w in widths)
+        hi = None if any(w[1] is None for w in widths) else max(w[1] for w in widths)
+        return lo, hi
+    if t in _REPEAT_NODES:
+        inner, rep_lo, rep_hi, _ = repeat_bounds(node)
+        inner_lo, inner_hi = width_range(inner)
+        hi = None
+        if rep_hi is not None and inner_hi is not None:
+            hi = inner_hi * rep_hi
+        elif inner_hi == 0:
+            hi = 0
+        return inner_lo * rep_lo, hi
+    if t is Group:
+        return width_range(node.node)
+    if t is Backref:
+        return 0, None
+    # Empty, anchors, boundaries and lookarounds are zero-width
+    return 0, 0
+
+
+def reverse(node):
+    """Build the pattern matching the reversed language of a regular pattern.
+
+    Start and end anchors swap roles; word boundaries are symmetric.
+    """
+    t = type(node)
+    if t is Literal:
+        return Literal(node.text[::-1], node.icase)
+    if t is Concat:
+        return Concat(tuple(reverse(child) for child in reversed(node.nodes)))
+    if t is Alt:
+        return Alt(tuple(reverse(child) for child in node.nodes))
+    if t in _REPEAT_NODES:
+        return node._replace(node=reverse(node.node))
+    if t is Group:
+        return Group(reverse(node.node), node.index)
+    if t is AnchorStart:
+        return AnchorEnd()
+    if t is AnchorEnd:
+        return AnchorStart()
+    if t in NON_REGULAR_NODES:
+        raise ValueError("Only regular patterns can be reversed")
+    return node
+
+
+def parse(pattern, flags=0):
+    """Parse a regex pattern.
+
+    Args:
+        pattern: Regex pattern string
+        flags: Compilation flags (IGNORECASE)
+
+    Returns:
+        (node, group_count) tuple
+    """
+    parser = _Parser(pattern, flags)
+    node = parser.parse()
+    return node, parser.group_count
@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+"""
+Structured result encoding between HVM match programs and the wrappers
+
+Generated match programs do not print Result constructors for the wrappers
+to pick out of stdout. Instead @main evaluates to one flat list of numbers:
+
+    [RESULT_FORMAT, record, record, ...]
+
+    record = id start end group_count (group_start group_end) * group_count
+
+Each record is one match: id says which job (or pattern) it belongs to,
+offsets are absolute and end-exclusive, and a group that did not participate
+is NO_GROUP (-1, which HVM prints as its U32 two's complement). A job
+without a match has no record, and a job may have several, so the encoding
+carries any number of matches, groups and pattern IDs. decode() here and
+hvm_regex_decode_results in hvm_regex.c read it in one pass.
+"""
+
+# First element of every result list (the ASCII codes of "R1")
+RESULT_FORMAT = 0x5231
+
+# Offset of a capturing group that did not participate
+NO_GROUP = -1
+
+# NO_GROUP as printed by HVM's unsigned 32-bit numbers
+_NO_GROUP_U32 = (1 << 32) - 1
+
+# HVML that turns a Result constructor into a record
+HVML_ENCODER = """// List type of the [...] literals the records are built from
+data List {
+  #Nil
+  #Cons { head tail }
+}
+
+// Encode a Result as a flat record: id start end group_count (group_start group_end)*
+// Every start is also used for its end, so it is duplicated first
+@encode(id, result) = ~result {
+  #Match{pos len}:
+    ! &0{p0 p1} = pos
+    [id, p0, (+ p1 len), 0]
+  #MatchGroup{pos len gp gl}:
+    ! &0{p0 p1} = pos
+    ! &1{g0 g1} = gp
+    [id, p0, (+ p1 len), 1, g0, (+ g1 gl)]
+  #MatchGroups{pos len g1p g1l g2p g2l}:
+    ! &0{p0 p1} = pos
+    ! &1{a0 a1} = g1p
+    ! &2{b0 b1} = g2p
+    [id, p0, (+ p1 len), 2, a0, (+ a1 g1l), b0, (+ b1 g2l)]
+  #NoMatch: []
+}
+
+// Concatenate two lists; (+ a b) is numeric addition, not concatenation
+@append(a, b) = ~a {
+  #Nil: b
+  #Cons{head tail}: #Cons{head @append(tail, b)}
+}
+"""
+
+
+def encode_expr(results):
+    """Build the @main expression for a list of Result expressions.
+
+    Args:
+        results: HVM expressions evaluating to a Result, one per job; job i
+            gets id i
+
+    Returns:
+        HVM expression evaluating to the encoded result list
+    """
+    expr = "[]"
+    for job_id in reversed(range(len(results))):
+        expr = f"@append(@encode({job_id}, {results[job_id]}), {expr})"
+    return f"@append([{RESULT_FORMAT}], {expr})"
+
+
+def decode(output):
+    """Decode the result list printed by a match program.
+
+    Args:
+        output: Stdout of the program
+
+    Returns:
+        List of (id, start, end, groups) tuples, groups holding a
+        (start, end) pair per group, or None if output is not a well-formed
+        result list
+    """
+    open_at = output.find("[")
+    close_at = output.rfind("]")
+    if open_at < 0 or close_at < open_at:
+        return None
+
+    try:
+        values = [int(value) for value in output[open_at + 1:close_at].replace(",", " ").split()]
+    except ValueError:
+        return None
+    if not values or values[0] != RESULT_FORMAT:
+        return None
+
+    records = []
+    i, n = 1, len(values)
+    while i < n:
+        if i + 4 > n:
+            return None
+        job_id, start, end, group_count = values[i:i + 4]
+        i += 4
+        if group_count < 0 or i + 2 * group_count > n:
+            return None
+        groups = tuple(
+            (NO_GROUP, NO_GROUP) if values[j] in (NO_GROUP, _NO_GROUP_U32) else (values[j], values[j + 1])
+            for j in range(i, i + 2 * group_count, 2)
+        )
+        i += 2 * group_count
+        records.append((job_id, start, end, groups))
+    return records
@@ -0,0 +1,297 @@
+#!/usr/bin/env python3
+"""
+On-disk cache of compiled rule sets
+
+Compiling a large rule set (parsing every pattern, building its NFA programs
+and extracting its literal atoms) dominates process start-up. This module
+saves everything the pure-Python engine derives from a rule set, including
+the DFA states built so far, to a versioned file named after a hash of the
+rule set, and memory-maps it on the next start instead of recompiling.
+
+File layout: an 8-byte magic, a header with the format version and the
+Python version (marshal data is only portable within one Python version),
+then the marshalled payload. Files from another version are ignored. The
+file name also covers the engine's source (see engine_version), so a change
+to how patterns compile, such as a new case-folding rule, never reuses a
+rule set compiled by an older engine. The
+payload keeps each pattern's AST, programs and DFAs in a separate marshalled
+blob that is only decoded when the pattern is first used, so loading costs
+little more than reading the atoms.
+"""
+
+import hashlib
+import marshal
+import mmap
+import os
+import struct
+import sys
+import tempfile
+
+try:
+    from . import hvm_regex_parser
+    from . import hvm_regex_atoms
+    from . import hvm_regex_engine
+    from .hvm_regex_nfa import Program, LazyDFA, NfaRegex
+    from .hvm_regex_backtrack import BacktrackRegex
+except ImportError:
+    import hvm_regex_parser
+    import hvm_regex_atoms
+    import hvm_regex_engine
+    from hvm_regex_nfa import Program, LazyDFA, NfaRegex
+    from hvm_regex_backtrack import BacktrackRegex
+
+
+MAGIC = b"HVMRXC\0\0"
+
+# Bump whenever the AST, program or DFA representation changes
+FORMAT_VERSION = 2
+
+_HEADER = struct.Struct("<8sHBB")
+
+# File name suffix of cached rule sets
+SUFFIX = ".hvmrc"
+
+# Named tuple types that may appear in stored ASTs and atom queries
+_TYPES = {
+    cls.__name__: cls
+    for cls in (
+        hvm_regex_parser.Empty, hvm_regex_parser.Char, hvm_regex_parser.Literal,
+        hvm_regex_parser.Any, hvm_regex_parser.Concat, hvm_regex_parser.Alt,
+        hvm_regex_parser.Star, hvm_regex_parser.Plus, hvm_regex_parser.Optional,
+        hvm_regex_parser.Repeat, hvm_regex_parser.RepeatRange,
+        hvm_regex_parser.CharClass, hvm_regex_parser.NegCharClass,
+        hvm_regex_parser.Group, hvm_regex_parser.AnchorStart, hvm_regex_parser.AnchorEnd,
+        hvm_regex_parser.WordBoundary, hvm_regex_parser.NonWordBoundary,
+        hvm_regex_parser.PosLookahead, hvm_regex_parser.NegLookahead,
+        hvm_regex_parser.PosLookbehind, hvm_regex_parser.NegLookbehind,
+        hvm_regex_parser.Backref,
+        hvm_regex_atoms.Atom, hvm_regex_atoms.And, hvm_regex_atoms.Or,
+    )
+}
+
+
+class StoredPattern:
+    """A pattern restored from (or about to be written to) a rule set file."""
+
+    def __init__(self, regex, atoms, hvm_pattern=None, blob=None):
+        """Initialize the entry.
+
+        Args:
+            regex: hvm_regex_engine.Regex, or None to decode it from blob
+            atoms: Atom query from hvm_regex_atoms.prefilter, or None
+            hvm_pattern: HVM pattern constructor, if one was built
+            blob: Marshalled engine data read from a rule set file
+        """
+        self._regex = regex
+        self.atoms = atoms
+        self.hvm_pattern = hvm_pattern
+        self._blob = blob
+
+    @property
+    def regex(self):
+        """The compiled pattern, decoded from the file on first access."""
+        if self._regex is None:
+            self._regex = _decode_regex(marshal.loads(self._blob))
+            self._blob = None
+        return self._regex
+
+
+def normalize_rules(patterns):
+    """Turn a list of patterns or (pattern, flags) pairs into (pattern, flags) pairs."""
+    return [(rule, 0) if isinstance(rule, str) else (rule[0], rule[1]) for rule in patterns]
+
+
+# Modules whose code decides what a compiled rule set contains
+_ENGINE_MODULES = (hvm_regex_parser, hvm_regex_atoms, hvm_regex_engine,
+                   sys.modules[Program.__module__], sys.modules[BacktrackRegex.__module__])
+
+_engine_version = None
+
+
+def engine_version():
+    """Hash of the engine's source files, computed once per process.
+
+    Returns:
+        Hex digest that changes whenever the parser, the atom extraction or
+        one of the engines changes
+    """
+    global _engine_version
+    if _engine_version is None:
+        digest = hashlib.sha256()
+        for module in _ENGINE_MODULES:
+            with open(module.__file__, "rb") as f:
+                digest.update(f.read())
+        _engine_version = digest.hexdigest()
+    return _engine_version
+
+
+def ruleset_key(patterns):
+    """Hash a rule set (and the storage format and engine) into a file name stem.
+
+    Args:
+        patterns: List of (pattern, flags) pairs
+
+    Returns:
+        Hex digest identifying the rule set
+    """
+    digest = hashlib.sha256()
+    digest.update(b"%d\0" % FORMAT_VERSION)
+    digest.update(engine_version().encode("ascii"))
+    for pattern, flags in patterns:
+        digest.update(b"%d\0" % flags)
+        digest.update(pattern.encode("utf-8", "surrogatepass"))
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+def ruleset_path(directory, patterns):
+    """Path of the cache file for a rule set inside directory."""
+    return os.path.join(directory, ruleset_key(patterns) + SUFFIX)
+
+
+# === Encoding ===
+
+def _encode(value):
+    """Turn AST and query nodes into marshallable lists tagged with their type."""
+    name = type(value).__name__
+    if _TYPES.get(name) is type(value):
+        return [name] + [_encode(field) for field in value]
+    if type(value) is tuple:
+        return tuple(_encode(item) for item in value)
+    return value
+
+
+def _decode(value):
+    if type(value) is list:
+        return _TYPES[value[0]](*(_decode(field) for field in value[1:]))
+    if type(value) is tuple:
+        return tuple(_decode(item) for item in value)
+    return value
+
+
+def _encode_program(prog):
+    return (prog.ops, prog.args, prog.args2, prog.group_count)
+
+
+def _decode_program(data):
+    prog = Program()
+    prog.ops, prog.args, prog.args2, prog.group_count = data
+    return prog
+
+
+def _encode_regex(regex):
+    data = {
+        "pattern": regex.pattern,
+        "flags": regex.flags,
+        "node": _encode(regex.node),
+        "group_count": regex.group_count,
+    }
+    engine = regex.engine
+    if regex.is_regular:
+        data["prog"] = _encode_program(engine.prog)
+        data["reverse_prog"] = _encode_program(engine.reverse_prog)
+        data["dfas"] = tuple(
+            (dfa.max_states, dfa.snapshot())
+            for dfa in (engine.forward_dfa, engine.anchored_dfa, engine.reverse_dfa)
+        )
+    return data
+
+
+def _decode_regex(data):
+    node = _decode(data["node"])
+    group_count = data["group_count"]
+
+    # Rebuild the engine from stored parts, skipping the parser and compiler
+    if "prog" in data:
+        engine = NfaRegex.__new__(NfaRegex)
+        engine.node = node
+        engine.group_count = group_count
+        engine.prog = _decode_program(data["prog"])
+        engine.reverse_prog = _decode_program(data["reverse_prog"])
+        dfas = []
+        for (max_states, snapshot), prog, anchored, longest in zip(
+                data["dfas"],
+                (engine.prog, engine.prog, engine.reverse_prog),
+                (False, True, True),
+                (False, False, True)):
+            dfa = LazyDFA(prog, anchored=anchored, longest=longest, max_states=max_states)
+            dfa.restore(snapshot)
+            dfas.append(dfa)
+        engine.forward_dfa, engine.anchored_dfa, engine.reverse_dfa = dfas
+    else:
+        engine = BacktrackRegex(node, group_count)
+
+    regex = hvm_regex_engine.Regex.__new__(hvm_regex_engine.Regex)
+    regex.pattern = data["pattern"]
+    regex.flags = data["flags"]
+    regex.node = node
+    regex.group_count = group_count
+    regex.is_regular = "prog" in data
+    regex.engine = engine
+    return regex
+
+
+# === Files ===
+
+def save(path, patterns, entries):
+    """Write a compiled rule set to path atomically.
+
+    Args:
+        path: Destination file
+        patterns: List of (pattern, flags) pairs
+        entries: StoredPattern per pattern, in the same order
+    """
+    payload = marshal.dumps((
+        ruleset_key(patterns),
+        [(_encode(entry.atoms), entry.hvm_pattern, marshal.dumps(_encode_regex(entry.regex)))
+         for entry in entries],
+    ))
+    header = _HEADER.pack(MAGIC, FORMAT_VERSION, sys.version_info[0], sys.version_info[1])
+
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=SUFFIX + ".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(header)
+            f.write(payload)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
+def load(path, patterns):
+    """Load a compiled rule set written by save().
+
+    Args:
+        path: File to read
+        patterns: List of (pattern, flags) pairs the file must hold
+
+    Returns:
+        List of StoredPattern, or None if the file is missing, was written
+        by another format or Python version, or holds a different rule set
+    """
+    try:
+        f = open(path, "rb")
+    except FileNotFoundError:
+        return None
+
+    with f:
+        if os.fstat(f.fileno()).st_size <= _HEADER.size:
+            return None
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            magic, version, major, minor = _HEADER.unpack_from(mapped)
+            if (magic != MAGIC or version != FORMAT_VERSION
+                    or (major, minor) != tuple(sys.version_info[:2])):
+                return None
+            with memoryview(mapped) as view, view[_HEADER.size:] as data:
+                try:
+                    key, entries = marshal.loads(data)
+                except (EOFError, ValueError, TypeError):
+                    return None  # Truncated or corrupt file
+
+    if key != ruleset_key(patterns) or len(entries) != len(patterns):
+        return None
+    return [StoredPattern(None, _decode(atoms), hvm_pattern, blob)
+            for atoms, hvm_pattern, blob in entries]
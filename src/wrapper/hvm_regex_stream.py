@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+"""
+Streaming matching over data that arrives in chunks
+
+A RegexStream scans a flow one chunk at a time, e.g. the TCP segments of a
+connection, and keeps the automaton state between chunks, so a match such as
+"UNION SELECT" is found even when it straddles two packets. No part of the
+flow is buffered: the state is one lazy DFA state plus the start offset of
+each live NFA thread.
+
+Like Hyperscan's streaming mode, a stream reports every offset at which a
+match ends, together with the leftmost start of a match ending there, as soon
+as the character after it has been seen (or the stream is closed). Offsets
+are absolute positions in the flow.
+"""
+
+try:
+    from .hvm_regex_nfa import LazyDFA, DEAD, EOF, CTX_START, DEFAULT_MAX_STATES
+except ImportError:
+    from hvm_regex_nfa import LazyDFA, DEAD, EOF, CTX_START, DEFAULT_MAX_STATES
+
+
+class RegexStream:
+    """Incremental matcher for one flow."""
+
+    def __init__(self, regex, max_states=DEFAULT_MAX_STATES):
+        """Open a stream.
+
+        Args:
+            regex: hvm_regex_engine.Regex to match
+            max_states: DFA cache budget
+
+        Raises:
+            ValueError: If the pattern uses lookaround or backreferences,
+                which cannot be matched without buffering the flow
+        """
+        if not regex.is_regular:
+            raise ValueError(f"Pattern {regex.pattern!r} cannot be streamed: "
+                             "lookaround and backreferences need the whole text")
+        self.regex = regex
+        # Longest mode keeps every thread alive, so every match end is seen;
+        # threads stay ordered by start, so the first to match is the leftmost
+        self._dfa = LazyDFA(regex.engine.prog, anchored=False, longest=True,
+                            max_states=max_states)
+        self._state = self._dfa.start(CTX_START)
+        self._starts = (None,)
+        self.offset = 0
+        self.closed = False
+
+    def feed(self, chunk):
+        """Scan the next chunk of the flow.
+
+        Args:
+            chunk: Text following everything fed so far
+
+        Returns:
+            List of (start, end) absolute offsets of matches found, in order of end
+        """
+        if self.closed:
+            raise ValueError("Stream is closed")
+
+        state = self._state
+        if state == DEAD:
+            # Only anchored patterns die; nothing later can match
+            self.offset += len(chunk)
+            return []
+
+        step = self._dfa.step
+        starts = self._starts
+        matches = []
+        i = self.offset
+        for ch in chunk:
+            state, match_origin, origins = step(state, ch)
+            if match_origin is not None:
+                matches.append((i if match_origin == -1 else starts[match_origin], i))
+            starts = tuple(i if origin == -1 else starts[origin] for origin in origins)
+            i += 1
+            if state == DEAD:
+                break
+
+        self.offset += len(chunk)
+        self._state = state
+        self._starts = starts
+        return matches
+
+    def close(self):
+        """End the flow, reporting matches that end at its last offset.
+
+        Returns:
+            List of (start, end) matches completed by the end of the flow
+        """
+        if self.closed:
+            return []
+        self.closed = True
+        if self._state == DEAD:
+            return []
+        _, match_origin, _ = self._dfa.step(self._state, EOF)
+        if match_origin is None:
+            return []
+        start = self.offset if match_origin == -1 else self._starts[match_origin]
+        return [(start, self.offset)]
+
+    @property
+    def flushes(self):
+        """Number of times the stream's DFA cache was flushed."""
+        return self._dfa.flushes
@@ -0,0 +1,342 @@
+#!/usr/bin/env python3
+"""
+Resident dispatcher processes for the HVM regex wrapper
+
+hvml has no server mode, so every uncached program still costs one
+`hvml run` process, which parses and compiles the program from scratch.
+This module only removes the overhead around that process: a small pool of
+resident worker processes receives HVML programs over stdin/stdout pipes,
+so the wrapper no longer writes a temporary file per match, and the bundled
+dispatcher memoizes outputs so repeated programs skip hvml entirely.
+
+Wire protocol (both directions use the same framing):
+
+    <kind> <request_id> <nbytes>\\n
+    <nbytes bytes of UTF-8 payload>
+
+Requests use kind ``RUN`` with the HVML program as payload. Responses use
+``OK`` (payload is the evaluator's stdout) or ``ERR`` (payload is an error
+message). A truly resident evaluator that speaks this protocol can be
+plugged in through ``worker_command``. By default the worker is this module
+run as a script: a dispatcher that pipes each program to a fresh
+``hvml run /dev/stdin`` and memoizes outputs, since HVML programs are pure.
+"""
+
+import collections
+import os
+import queue
+import subprocess
+import sys
+import threading
+
+
+# Default number of seconds to wait for a single request before the worker
+# is considered hung, killed and restarted
+DEFAULT_REQUEST_TIMEOUT = 30.0
+
+# Default number of distinct program outputs a worker keeps in memory
+DEFAULT_CACHE_SIZE = 256
+
+
+class WorkerError(RuntimeError):
+    """Raised when a worker fails to evaluate a request."""
+
+
+def write_frame(stream, kind, request_id, payload):
+    """Write a single protocol frame to a binary stream.
+
+    Args:
+        stream: Writable binary stream
+        kind: Frame kind ("RUN", "OK" or "ERR")
+        request_id: Integer request identifier echoed back in the response
+        payload: Payload string
+    """
+    data = payload.encode("utf-8")
+    stream.write(f"{kind} {request_id} {len(data)}\n".encode("ascii"))
+    stream.write(data)
+    stream.flush()
+
+
+def read_frame(stream):
+    """Read a single protocol frame from a binary stream.
+
+    Args:
+        stream: Readable binary stream
+
+    Returns:
+        (kind, request_id, payload) tuple, or None on end of stream
+    """
+    header = stream.readline()
+    if not header:
+        return None
+
+    try:
+        kind, request_id, nbytes = header.decode("ascii").split()
+        request_id = int(request_id)
+        nbytes = int(nbytes)
+    except ValueError:
+        raise WorkerError(f"Malformed frame header: {header!r}")
+
+    data = stream.read(nbytes)
+    if len(data) != nbytes:
+        return None
+
+    return kind, request_id, data.decode("utf-8")
+
+
+class HvmWorker:
+    """A single resident worker process with restart-on-crash."""
+
+    def __init__(self, command, request_timeout=DEFAULT_REQUEST_TIMEOUT):
+        """Initialize the worker. The process is started lazily.
+
+        Args:
+            command: Argument list used to start the worker process
+            request_timeout: Seconds to wait for a response, or None to wait forever
+        """
+        self.command = list(command)
+        self.request_timeout = request_timeout
+        self.restarts = 0
+        self._process = None
+        self._responses = None
+        self._next_id = 0
+
+    def start(self):
+        """Start the worker process if it is not already running."""
+        if self._process is not None:
+            if self._process.poll() is None:
+                return
+            # The previous process exited on its own
+            self.restarts += 1
+
+        self._process = subprocess.Popen(
+            self.command,
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+        )
+        self._responses = queue.Queue()
+
+        # Responses are read on a background thread so requests can time out
+        # without blocking forever on a pipe read
+        reader = threading.Thread(
+            target=self._read_responses,
+            args=(self._process.stdout, self._responses),
+            daemon=True,
+        )
+        reader.start()
+
+    def stop(self):
+        """Terminate the worker process."""
+        process, self._process = self._process, None
+        if process is None:
+            return
+
+        try:
+            process.stdin.close()
+        except OSError:
+            pass
+
+        try:
+            process.wait(timeout=1.0)
+        except subprocess.TimeoutExpired:
+            process.kill()
+            process.wait()
+
+    def restart(self):
+        """Kill the current process (if any) and start a new one."""
+        if self._process is not None and self._process.poll() is None:
+            self._process.kill()
+            self._process.wait()
+        self.start()
+
+    def run(self, program):
+        """Evaluate an HVML program on the worker.
+
+        A worker that has crashed is restarted and the request is retried once.
+        A worker that does not answer within the request timeout is restarted
+        and TimeoutError is raised.
+
+        Args:
+            program: HVML source code
+
+        Returns:
+            The evaluator's stdout for the program
+        """
+        for attempt in range(2):
+            self.start()
+            try:
+                return self._request(program)
+            except BrokenPipeError:
+                # The process died before or while we were writing
+                pass
+            except EOFError:
+                # The process died before answering
+                pass
+
+            if attempt == 0:
+                self.restart()
+
+        raise WorkerError("HVM worker crashed while evaluating the request")
+
+    def _request(self, program):
+        """Send a request and wait for the matching response."""
+        self._next_id += 1
+        request_id = self._next_id
+        write_frame(self._process.stdin, "RUN", request_id, program)
+
+        while True:
+            try:
+                frame = self._responses.get(timeout=self.request_timeout)
+            except queue.Empty:
+                self.restart()
+                raise TimeoutError(
+                    f"HVM worker did not answer within {self.request_timeout}s")
+
+            if frame is None:
+                raise EOFError()
+
+            kind, response_id, payload = frame
+            if response_id != request_id:
+                # Stale response from a request that already timed out
+                continue
+            if kind == "ERR":
+                raise WorkerError(payload)
+            return payload
+
+    @staticmethod
+    def _read_responses(stream, responses):
+        """Forward frames from the worker's stdout to the response queue."""
+        try:
+            while True:
+                frame = read_frame(stream)
+                responses.put(frame)
+                if frame is None:
+                    return
+        except (OSError, ValueError, WorkerError):
+            responses.put(None)
+
+
+class HvmWorkerPool:
+    """A fixed-size pool of resident HVM workers."""
+
+    def __init__(self, command, size=1, request_timeout=DEFAULT_REQUEST_TIMEOUT):
+        """Initialize the pool.
+
+        Args:
+            command: Argument list used to start each worker process
+            size: Number of worker processes
+            request_timeout: Seconds to wait for a response from a worker
+        """
+        if size < 1:
+            raise ValueError("Worker pool size must be at least 1")
+
+        self.workers = [HvmWorker(command, request_timeout) for _ in range(size)]
+        self._idle = queue.Queue()
+        for worker in self.workers:
+            self._idle.put(worker)
+
+    def run(self, program):
+        """Evaluate an HVML program on the next idle worker.
+
+        Args:
+            program: HVML source code
+
+        Returns:
+            The evaluator's stdout for the program
+        """
+        worker = self._idle.get()
+        try:
+            return worker.run(program)
+        finally:
+            self._idle.put(worker)
+
+    def close(self):
+        """Stop every worker in the pool."""
+        for worker in self.workers:
+            worker.stop()
+
+
+def dispatcher_command(hvm_path, cache_size=DEFAULT_CACHE_SIZE):
+    """Build the command line that starts the bundled dispatcher.
+
+    Args:
+        hvm_path: Path to the hvml executable used by the worker
+        cache_size: Number of program outputs the worker memoizes
+
+    Returns:
+        Argument list for subprocess.Popen
+    """
+    return [
+        sys.executable, os.path.abspath(__file__),
+        "--hvm-path", hvm_path,
+        "--cache-size", str(cache_size),
+    ]
+
+
+def serve_dispatcher(hvm_path, cache_size=DEFAULT_CACHE_SIZE, stdin=None, stdout=None):
+    """Dispatcher main loop: run hvml once per uncached RUN frame until stdin is closed.
+
+    Args:
+        hvm_path: Path to the hvml executable
+        cache_size: Number of program outputs to memoize (0 disables caching)
+        stdin: Binary input stream (defaults to sys.stdin.buffer)
+        stdout: Binary output stream (defaults to sys.stdout.buffer)
+    """
+    stdin = stdin or sys.stdin.buffer
+    stdout = stdout or sys.stdout.buffer
+    outputs = collections.OrderedDict()
+
+    while True:
+        frame = read_frame(stdin)
+        if frame is None:
+            return
+
+        kind, request_id, program = frame
+        if kind != "RUN":
+            write_frame(stdout, "ERR", request_id, f"Unknown request kind: {kind}")
+            continue
+
+        if program in outputs:
+            outputs.move_to_end(program)
+            write_frame(stdout, "OK", request_id, outputs[program])
+            continue
+
+        try:
+            # A new hvml process per program, fed through a pipe rather than
+            # a temporary file
+            result = subprocess.run(
+                [hvm_path, "run", "/dev/stdin"],
+                input=program,
+                capture_output=True,
+                text=True,
+                check=False,
+            )
+        except OSError as e:
+            write_frame(stdout, "ERR", request_id, str(e))
+            continue
+
+        # Failed runs are reported, never memoized
+        if result.returncode != 0:
+            write_frame(stdout, "ERR", request_id,
+                        f"hvml exited with status {result.returncode}: {result.stderr.strip()}")
+            continue
+
+        if cache_size > 0:
+            outputs[program] = result.stdout
+            if len(outputs) > cache_size:
+                outputs.popitem(last=False)
+
+        write_frame(stdout, "OK", request_id, result.stdout)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="HVM regex program dispatcher")
+    parser.add_argument("--hvm-path", default="hvml", help="Path to the hvml executable")
+    parser.add_argument("--cache-size", type=int, default=DEFAULT_CACHE_SIZE,
+                        help="Number of program outputs to memoize")
+    args = parser.parse_args()
+
+    serve_dispatcher(args.hvm_path, args.cache_size)
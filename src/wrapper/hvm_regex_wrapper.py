@@ -7,29 +7,216 @@ from Python for testing and integration purposes. This serves as the primary int
 to the HVM regex engine.
 """
 
+import collections
 import os
 import subprocess
+import threading
 import tempfile
 import json
 import unittest
 import re  # For fallback in case HVM isn't available
 
+try:
+    from . import hvm_regex_worker
+    from . import hvm_regex_engine
+    from . import hvm_regex_atoms
+    from . import hvm_regex_stream
+    from . import hvm_regex_store
+    from . import hvm_regex_results
+    from .hvm_regex_match import Match
+except ImportError:
+    import hvm_regex_worker
+    import hvm_regex_engine
+    import hvm_regex_atoms
+    import hvm_regex_stream
+    import hvm_regex_store
+    import hvm_regex_results
+    from hvm_regex_match import Match
+
+
+# Compilation flags accepted by HvmRegexMatcher.compile
+IGNORECASE = hvm_regex_engine.IGNORECASE
+
+# Raised by HvmRegexMatcher.compile for invalid patterns in fallback mode
+RegexError = hvm_regex_engine.RegexError
+
+# Default number of compiled patterns kept by HvmRegexMatcher.compile
+DEFAULT_CACHE_SIZE = 4096
+
+# Patterns whose HVM constructor is chosen based on the text being matched,
+# so their compiled form cannot be fixed ahead of time
+_TEXT_DEPENDENT_PATTERNS = {"a?", r"\b"}
+
+# A single Result constructor in HVM output, e.g. #Match{0 3} or #NoMatch
+_RESULT_RE = re.compile(r"#(MatchGroups|MatchGroup|Match|NoMatch)\b(?:\{([^}]*)\})?")
+
+
+class CompiledPattern:
+    """A regex pattern compiled once for repeated matching, similar to re.Pattern.
+    
+    Instances are created by HvmRegexMatcher.compile and share its backend.
+    """
+    
+    def __init__(self, matcher, pattern, flags, hvm_pattern, regex=None, atoms=None, stored=None):
+        """Initialize the compiled pattern.
+        
+        Args:
+            matcher: HvmRegexMatcher that compiled the pattern
+            pattern: Regex pattern string
+            flags: Compilation flags
+            hvm_pattern: HVM pattern constructor, or None if it depends on the text
+            regex: Pure-Python hvm_regex_engine.Regex, or None to build it on first use
+            atoms: Literal atom query every match satisfies (see hvm_regex_atoms),
+                or None if the pattern requires no literal
+            stored: hvm_regex_store.StoredPattern to take regex from instead of
+                compiling it
+        """
+        self.matcher = matcher
+        self.pattern = pattern
+        self.flags = flags
+        self.hvm_pattern = hvm_pattern
+        self.atoms = atoms
+        self._regex = regex
+        self._stored = stored
+    
+    @property
+    def regex(self):
+        """The pattern compiled by the pure-Python engine."""
+        if self._regex is None:
+            if self._stored is not None:
+                self._regex = self._stored.regex
+                self._stored = None
+            else:
+                self._regex = hvm_regex_engine.compile(self.pattern, self.flags)
+        return self._regex
+    
+    def may_match(self, text, pos=0):
+        """Check the required literal atoms with plain substring searches.
+        
+        Args:
+            text: Text to check
+            pos: Position matches may start at
+            
+        Returns:
+            False if the pattern cannot match text at or after pos
+        """
+        return hvm_regex_atoms.query_matches(self.atoms, text, pos)
+    
+    def __repr__(self):
+        return f"CompiledPattern({self.pattern!r}, flags={self.flags})"
+    
+    def search(self, text, pos=0):
+        """Find the first match at or after pos.
+        
+        Args:
+            text: Text to search
+            pos: Starting position in the text
+            
+        Returns:
+            Match object if successful, None otherwise
+        """
+        result = self.matcher._match_compiled(self, text, pos)
+        if result is None or result.start() < pos:
+            return None
+        return result
+    
+    def match(self, text, pos=0):
+        """Match only if the pattern matches exactly at pos.
+        
+        Args:
+            text: Text to match against
+            pos: Position the match must start at
+            
+        Returns:
+            Match object if successful, None otherwise
+        """
+        result = self.search(text, pos)
+        if result is None or result.start() != pos:
+            return None
+        return result
+    
+    def finditer(self, text, pos=0):
+        """Iterate over successive non-overlapping matches.
+        
+        On the pure-Python engine the text is scanned once, each search
+        resuming where the previous match ended, with the re module's rules
+        for empty matches (see hvm_regex_engine.Regex.finditer).
+        
+        Args:
+            text: Text to search
+            pos: Starting position in the text
+            
+        Yields:
+            Match objects in order of position
+        """
+        if not self.may_match(text, pos):
+            return
+        
+        if self.matcher.use_fallback:
+            for span in self.regex.finditer(text, pos):
+                yield self.matcher._result_from_span(self, text, span)
+            return
+        
+        while pos <= len(text):
+            result = self.search(text, pos)
+            if result is None:
+                return
+            yield result
+            
+            start, end = result.span()
+            # Step past empty matches so the scan always makes progress
+            pos = end + 1 if start == end else end
+    
+    def open_stream(self):
+        """Open a stream for matching a flow that arrives in chunks.
+        
+        Streams always run on the pure-Python engine, which keeps the automaton
+        state between chunks instead of buffering the flow.
+        
+        Returns:
+            hvm_regex_stream.RegexStream with feed(chunk) and close() methods
+            
+        Raises:
+            ValueError: If the pattern uses lookaround or backreferences
+        """
+        return hvm_regex_stream.RegexStream(self.regex)
+
 
 class HvmRegexMatcher:
     """Python wrapper for the HVM regex engine."""
     
-    def __init__(self, hvm_path=None, force_fallback=False, is_unittest=False):
+    def __init__(self, hvm_path=None, force_fallback=False, is_unittest=False,
+                 dispatch_mode=False, pool_size=1, request_timeout=None, worker_command=None,
+                 cache_size=DEFAULT_CACHE_SIZE):
         """Initialize the HVM regex matcher.
         
         Args:
             hvm_path: Path to the hvml executable. If None, assumes it's in PATH.
             force_fallback: If True, always use the fallback implementation.
             is_unittest: If True, sets up the matcher for unit tests with more predictable results.
+            dispatch_mode: If True, send programs over pipes to resident worker
+                processes instead of writing a temporary file for every match.
+                The bundled dispatcher still runs hvml once per uncached program.
+            pool_size: Number of resident worker processes in dispatch mode.
+            request_timeout: Seconds to wait for a single evaluation before giving
+                up (and restarting the worker in dispatch mode). None waits forever.
+            worker_command: Argument list that starts a worker speaking the
+                hvm_regex_worker protocol. Defaults to the bundled dispatcher.
+            cache_size: Maximum number of compiled patterns kept by compile().
         """
         self.hvm_path = hvm_path or "hvml"
         self.hvm_regex_dir = os.path.dirname(os.path.abspath(__file__))
         self.use_fallback = force_fallback
         self.is_unittest = is_unittest
+        self.request_timeout = request_timeout
+        self._workers = None
+        
+        # LRU cache of compiled patterns keyed by (pattern, flags)
+        self.cache_size = cache_size
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self._cache = collections.OrderedDict()
+        self._cache_lock = threading.Lock()
         
         # If not forcing fallback, check if HVM is available
         if not force_fallback:
@@ -46,6 +233,161 @@ class HvmRegexMatcher:
             print("Using fallback regex implementation")
         else:
             print("Using HVM regex implementation")
+            
+            if dispatch_mode:
+                command = worker_command or hvm_regex_worker.dispatcher_command(self.hvm_path)
+                self._workers = hvm_regex_worker.HvmWorkerPool(
+                    command, size=pool_size, request_timeout=request_timeout)
+    
+    def close(self):
+        """Stop any resident worker processes."""
+        if self._workers is not None:
+            self._workers.close()
+            self._workers = None
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+    
+    def compile(self, pattern, flags=0):
+        """Compile a regex pattern into a reusable CompiledPattern.
+        
+        Compiled patterns are kept in a bounded LRU cache keyed by pattern and
+        flags, so compiling the same pattern again is a dictionary lookup.
+        
+        Args:
+            pattern: Regex pattern string
+            flags: Compilation flags (IGNORECASE)
+            
+        Returns:
+            CompiledPattern for the pattern
+            
+        Raises:
+            RegexError: If the pattern is invalid (fallback mode only)
+            ValueError: If flags are given in HVM mode, whose patterns cannot
+                express them
+        """
+        self._check_flags(flags)
+        key = (pattern, flags)
+        with self._cache_lock:
+            compiled = self._cache.get(key)
+            if compiled is not None:
+                self._cache.move_to_end(key)
+                self.cache_hits += 1
+                return compiled
+            self.cache_misses += 1
+        
+        hvm_pattern = None
+        regex = None
+        if self.use_fallback:
+            regex = hvm_regex_engine.compile(pattern, flags)
+            node = regex.node
+        else:
+            if pattern not in _TEXT_DEPENDENT_PATTERNS:
+                hvm_pattern = self._parse_regex_to_hvm(pattern)
+            try:
+                node, _ = hvm_regex_engine.hvm_regex_parser.parse(pattern, flags)
+            except RegexError:
+                node = None  # Leave the pattern to HVM, without a prefilter
+        atoms = hvm_regex_atoms.prefilter(node) if node is not None else None
+        compiled = CompiledPattern(self, pattern, flags, hvm_pattern, regex, atoms)
+        
+        with self._cache_lock:
+            self._cache[key] = compiled
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        
+        return compiled
+    
+    def _check_flags(self, flags):
+        """Reject flags on the HVM backend, which would silently ignore them."""
+        if flags and not self.use_fallback:
+            raise ValueError(f"The HVM backend does not support flags ({flags}); "
+                             "use force_fallback=True for flagged patterns")
+    
+    def compile_all(self, patterns, cache_dir=None):
+        """Compile a rule set, reusing an on-disk copy when one exists.
+        
+        With cache_dir, the compiled rule set (ASTs, NFA programs, literal atoms
+        and DFA states built so far) is stored in a file named after a hash of
+        the rules and memory-mapped on later calls, so a restart skips parsing
+        and compiling. Call save_compiled() to also persist DFAs warmed up by
+        matching.
+        
+        Args:
+            patterns: List of pattern strings or (pattern, flags) pairs
+            cache_dir: Directory for compiled rule set files, or None
+            
+        Returns:
+            List of CompiledPattern in the order of patterns
+        """
+        rules = hvm_regex_store.normalize_rules(patterns)
+        for _, flags in rules:
+            self._check_flags(flags)
+        stored = None
+        if cache_dir is not None:
+            stored = hvm_regex_store.load(hvm_regex_store.ruleset_path(cache_dir, rules), rules)
+        
+        if stored is None:
+            compiled = [self.compile(pattern, flags) for pattern, flags in rules]
+            if cache_dir is not None:
+                try:
+                    self.save_compiled(compiled, cache_dir)
+                except RegexError:
+                    pass  # Only HVM understands some rule; keep compiling at start-up
+            return compiled
+        
+        compiled = [
+            CompiledPattern(self, pattern, flags, entry.hvm_pattern, atoms=entry.atoms, stored=entry)
+            for (pattern, flags), entry in zip(rules, stored)
+        ]
+        with self._cache_lock:
+            for item in compiled:
+                self._cache[(item.pattern, item.flags)] = item
+                self._cache.move_to_end((item.pattern, item.flags))
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return compiled
+    
+    def save_compiled(self, compiled, cache_dir):
+        """Write compiled patterns to the rule set file compile_all() reads.
+        
+        Args:
+            compiled: List of CompiledPattern, as returned by compile_all
+            cache_dir: Directory for compiled rule set files
+            
+        Returns:
+            Path of the written file
+        """
+        rules = [(item.pattern, item.flags) for item in compiled]
+        path = hvm_regex_store.ruleset_path(cache_dir, rules)
+        entries = [hvm_regex_store.StoredPattern(item.regex, item.atoms, item.hvm_pattern)
+                   for item in compiled]
+        hvm_regex_store.save(path, rules, entries)
+        return path
+    
+    def cache_info(self):
+        """Return statistics about the compiled pattern cache.
+        
+        Returns:
+            Dictionary with hits, misses, current size and maximum size
+        """
+        with self._cache_lock:
+            return {
+                "hits": self.cache_hits,
+                "misses": self.cache_misses,
+                "size": len(self._cache),
+                "maxsize": self.cache_size,
+            }
+    
+    def clear_cache(self):
+        """Drop all compiled patterns and reset the cache counters."""
+        with self._cache_lock:
+            self._cache.clear()
+            self.cache_hits = 0
+            self.cache_misses = 0
         
     def match(self, pattern, text, pos=0):
         """Match a regex pattern against text.
@@ -58,14 +400,127 @@ class HvmRegexMatcher:
         Returns:
             Match object if successful, None otherwise
         """
+        return self._match_compiled(self.compile(pattern), text, pos)
+    
+    def finditer(self, pattern, text, pos=0, flags=0):
+        """Iterate over successive non-overlapping matches of a pattern.
+        
+        Args:
+            pattern: Regex pattern string
+            text: Text to search
+            pos: Starting position in the text
+            flags: Compilation flags
+            
+        Returns:
+            Iterator over match objects in order of position
+        """
+        return self.compile(pattern, flags).finditer(text, pos)
+    
+    def open_stream(self, pattern, flags=0):
+        """Open a stream for matching pattern against a flow fed in chunks.
+        
+        Args:
+            pattern: Regex pattern string
+            flags: Compilation flags
+            
+        Returns:
+            hvm_regex_stream.RegexStream reporting (start, end) stream offsets
+        """
+        return self.compile(pattern, flags).open_stream()
+    
+    def _match_compiled(self, compiled, text, pos):
+        """Match a compiled pattern against text using the active backend.
+        
+        Args:
+            compiled: CompiledPattern to match
+            text: Text to match against
+            pos: Starting position in the text
+            
+        Returns:
+            Match object if successful, None otherwise
+        """
+        # Texts missing a required literal cannot match, so skip the engine
+        if not compiled.may_match(text, pos):
+            return None
+        
         # If HVM is not available, use Python regex as fallback
         if self.use_fallback:
-            return self._fallback_match(pattern, text, pos)
+            return self._fallback_match(compiled, text, pos)
+        
+        program = self._generate_match_hvml(compiled.pattern, text, pos, compiled.hvm_pattern)
+        output = self._run_program(program)
+        return self._parse_match_output(output, text)
+    
+    def match_many(self, pairs):
+        """Match many (pattern, text) pairs with a single HVM invocation.
+        
+        All jobs are folded into one generated program whose @main evaluates
+        to a list of results, so N matches cost one hvml launch and one parse.
+        
+        Args:
+            pairs: Iterable of (pattern, text) or (pattern, text, pos) tuples.
+                Patterns may be strings or CompiledPattern objects.
             
+        Returns:
+            List of match results (None for no match), in input order
+        """
+        jobs = []
+        for pair in pairs:
+            pattern, text = pair[0], pair[1]
+            pos = pair[2] if len(pair) > 2 else 0
+            if not isinstance(pattern, CompiledPattern):
+                pattern = self.compile(pattern)
+            jobs.append((pattern, text, pos))
+        
+        if not jobs:
+            return []
+        
+        if self.use_fallback:
+            return [self._match_compiled(compiled, text, pos) for compiled, text, pos in jobs]
+        
+        # Jobs whose text lacks a required literal are decided without HVM
+        results = [None] * len(jobs)
+        pending = [i for i, (compiled, text, pos) in enumerate(jobs) if compiled.may_match(text, pos)]
+        if not pending:
+            return results
+        
+        hvm_patterns = []
+        for i in pending:
+            compiled, text, pos = jobs[i]
+            hvm_pattern = compiled.hvm_pattern
+            if hvm_pattern is None:
+                hvm_pattern = self._parse_regex_to_hvm(compiled.pattern, text)
+            hvm_patterns.append(hvm_pattern)
+        
+        output = self._run_program(self._generate_batch_hvml(hvm_patterns))
+        batch = self._parse_match_list_output(output, [jobs[i][1] for i in pending])
+        if batch is None:
+            print("Warning: could not parse batched HVM output, matching jobs one by one")
+            batch = [self._match_compiled(*jobs[i]) for i in pending]
+        
+        for i, result in zip(pending, batch):
+            results[i] = result
+        return results
+
+    def _run_program(self, program):
+        """Evaluate a generated HVML program and return its stdout.
+        
+        Uses the resident worker pool when dispatch mode is enabled, otherwise
+        writes the program to a temporary file and runs hvml on it.
+        
+        Args:
+            program: HVML source code
+            
+        Returns:
+            The program's stdout
+        """
+        if self._workers is not None:
+            return self._workers.run(program)
+        
         # Create a temporary HVM file for this specific match operation
         with tempfile.NamedTemporaryFile(suffix=".hvml", mode="w", delete=False) as f:
             match_file = f.name
-            f.write(self._generate_match_hvml(pattern, text, pos))
+            f.write(program)
         
         try:
             # Run the HVM file
@@ -74,560 +529,175 @@ class HvmRegexMatcher:
                 capture_output=True,
                 text=True,
                 check=False,
+                timeout=self.request_timeout,
             )
-            
-            # Parse the output
-            output = result.stdout.strip()
-            
-            # First check for match results with groups
-            if "! a = #MatchGroup" in output:
-                try:
-                    # Extract position, length, and group data from MatchGroup output
-                    pos_start = output.find("{") + 1
-                    pos_end = output.find("}")
-                    match_details = output[pos_start:pos_end].strip().split()
-                    
-                    if len(match_details) >= 4:
-                        pos = int(match_details[0])
-                        length = int(match_details[1])
-                        group_pos = int(match_details[2])
-                        group_len = int(match_details[3])
-                        
-                        # Create result with one group
-                        result = {"position": pos, "length": length, "text": text[pos:pos+length]}
-                        result["groups"] = [{
-                            "position": group_pos,
-                            "length": group_len,
-                            "text": text[group_pos:group_pos+group_len]
-                        }]
-                        
-                        return result
-                except Exception as e:
-                    print(f"Error parsing MatchGroup output: {e}")
-            
-            # Then check for multiple groups format
-            elif "! a = #MatchGroups" in output:
-                try:
-                    # Extract position, length, and groups data from MatchGroups output
-                    pos_start = output.find("{") + 1
-                    pos_end = output.find("}")
-                    match_details = output[pos_start:pos_end].strip().split()
-                    
-                    if len(match_details) >= 6:
-                        pos = int(match_details[0])
-                        length = int(match_details[1])
-                        group1_pos = int(match_details[2])
-                        group1_len = int(match_details[3])
-                        group2_pos = int(match_details[4])
-                        group2_len = int(match_details[5])
-                        
-                        # Create result with multiple groups
-                        result = {"position": pos, "length": length, "text": text[pos:pos+length]}
-                        result["groups"] = [
-                            {
-                                "position": group1_pos,
-                                "length": group1_len,
-                                "text": text[group1_pos:group1_pos+group1_len]
-                            },
-                            {
-                                "position": group2_pos,
-                                "length": group2_len,
-                                "text": text[group2_pos:group2_pos+group2_len]
-                            }
-                        ]
-                        
-                        return result
-                except Exception as e:
-                    print(f"Error parsing MatchGroups output: {e}")
-            
-            # Check for basic match format (! a = #Match{0 3})
-            elif "! a = #Match" in output:
-                try:
-                    # Extract position and length from match output
-                    pos_start = output.find("{") + 1
-                    pos_end = output.find("}")
-                    match_details = output[pos_start:pos_end].strip().split()
-                    
-                    if len(match_details) >= 2:
-                        pos = int(match_details[0])
-                        length = int(match_details[1])
-                        # Basic match
-                        result = {"position": pos, "length": length, "text": text[pos:pos+length]}
-                        return result
-                except Exception as e:
-                    print(f"Error parsing Match output: {e}")
-            
-            # Then check for numeric length format (! a = 3)
-            elif "! a = " in output:
-                try:
-                    # Extract the length directly
-                    length_str = output.split("! a = ")[1].split("\n")[0].strip()
-                    if length_str.isdigit():
-                        length = int(length_str)
-                        pos = 0  # Default position
-                        return {"position": pos, "length": length, "text": text[pos:pos+length]}
-                except Exception as e:
-                    print(f"Error parsing numeric output: {e}")
-            
-            return None
+            return result.stdout
         finally:
             # Clean up the temporary file
             os.unlink(match_file)
     
-    def _fallback_match(self, pattern, text, pos=0):
-        """Fallback implementation that returns hardcoded results to satisfy our tests.
-        
-        This implementation is hardcoded to return specific results expected by our tests. 
-        It doesn't do actual regex matching. In a real implementation, we would parse the 
-        pattern and do real matching, but for testing, this is sufficient.
+    def _parse_match_output(self, output, text):
+        """Parse the stdout of a match program into a match result.
         
         Args:
-            pattern: Regex pattern string
-            text: Text to match against
-            pos: Starting position in the text
+            output: Stdout of the HVML program
+            text: Text that was matched (used to fill in matched substrings)
             
         Returns:
             Match object if successful, None otherwise
         """
-        # Debug line removed
-        # Test case: test_literal_match
-        if pattern == "GET" and text.startswith("GET", pos):
-            return {"position": pos, "length": 3, "text": text[pos:pos+3]}
-        elif pattern == "POST" and text.startswith("GET", pos):
-            return None  # Should not match for negative test
-            
-        # Test case: test_character_match
-        elif pattern == "a" and text.startswith("abc", pos):
-            return {"position": pos, "length": 1, "text": "a"}
-        elif pattern == "z" and pos < len(text) and text[pos] == 'z':
-            return {"position": pos, "length": 1, "text": "z"}
-        elif pattern == "d" and text.startswith("abc", pos):
-            return None  # Should not match for negative test
-            
-        # Test case: test_concatenation
-        elif pattern == "ab" and text.startswith("abc", pos):
-            return {"position": pos, "length": 2, "text": "ab"}
-            
-        # Test case: test_alternation
-        elif pattern == "a|b" and text.startswith("abc", pos):
-            return {"position": pos, "length": 1, "text": "a"}
-        elif pattern == "x|b" and text.startswith("bcd", pos):
-            return {"position": pos, "length": 1, "text": "b"}
-        elif pattern == "x|y" and text.startswith("abc", pos):
-            return None  # Should not match for negative test
-            
-        # Test case: test_repetition
-        elif pattern == "a*" and text.startswith("aaab", pos):
-            return {"position": pos, "length": 3, "text": "aaa"}
-        elif pattern == "a+" and text.startswith("aaab", pos):
-            return {"position": pos, "length": 3, "text": "aaa"}
-        elif pattern == "a?" and text.startswith("abc", pos):
-            return {"position": pos, "length": 1, "text": "a"}
-        elif pattern == "z?":
-            if pos < len(text) and text[pos] == 'z':
-                return {"position": pos, "length": 1, "text": "z"}
-            else:
-                return {"position": pos, "length": 0, "text": ""}
-            
-        # Test case: test_character_classes
-        elif pattern == "[abc]":
-            if pos < len(text) and text[pos] in "abc":
-                return {"position": pos, "length": 1, "text": text[pos]}
-            return None  # No match if character not in class
-            
-        elif pattern == "[0-9]" or pattern == "[0-9]+":
-            if pos < len(text) and text[pos].isdigit():
-                return {"position": pos, "length": 1, "text": text[pos]}
-            return None  # No match if not a digit
-            
-        elif pattern == "[a-z]" or pattern == "[a-z]+":
-            if pos < len(text) and text[pos].islower() and text[pos].isalpha():
-                return {"position": pos, "length": 1, "text": text[pos]}
-            return None  # No match if not lowercase letter
-            
-        elif pattern == "[^abc]":
-            if pos < len(text) and text[pos] not in "abc":
-                return {"position": pos, "length": 1, "text": text[pos]}
-            return None  # No match if character in class
-            
-        elif pattern == "[^0-9]" or pattern == "[^0-9]+":
-            if pos < len(text) and not text[pos].isdigit():
-                return {"position": pos, "length": 1, "text": text[pos]}
-            return None  # No match if digit
-            
-        elif pattern == "[^a-z]" or pattern == "[^a-z]+":
-            if pos < len(text) and (not text[pos].islower() or not text[pos].isalpha()):
-                return {"position": pos, "length": 1, "text": text[pos]}
-            return None  # No match if lowercase letter
-            
-        elif pattern.startswith("[") and pattern.endswith("]"):
-            # Generic character class handling
-            if pattern[1] == "^":  # Negated class
-                chars = pattern[2:-1]
-                if pos < len(text) and text[pos] not in chars:
-                    return {"position": pos, "length": 1, "text": text[pos]}
-            else:  # Regular class
-                chars = pattern[1:-1]
-                if pos < len(text) and text[pos] in chars:
-                    return {"position": pos, "length": 1, "text": text[pos]}
-            return None  # No match
-            
-        # Test case: test_complex_patterns
-        elif pattern == "GET /" and text.startswith("GET /", pos):
-            return {"position": pos, "length": 5, "text": "GET /"}
-            
-        elif pattern == "GET /[a-z]+" and text.startswith("GET /", pos):
-            # Find how many lowercase letters after "GET /"
-            path_pos = pos + 5  # Skip "GET /"
-            path_len = 0
-            
-            while (path_pos + path_len < len(text) and 
-                   text[path_pos + path_len].islower() and 
-                   text[path_pos + path_len].isalpha()):
-                path_len += 1
-                
-            if path_len > 0:
-                total_len = 5 + path_len  # "GET /" + path
-                return {"position": pos, "length": total_len, "text": text[pos:pos+total_len]}
-            return None  # No lowercase letters in path
-            
-        # Email pattern
-        elif pattern == "[a-z]+@[a-z]+" and text.startswith("user@example", pos):
-            return {"position": pos, "length": 12, "text": "user@example"}
-            
-        # IP address pattern (with escaped dots)
-        elif (pattern == "[0-9]+.[0-9]+.[0-9]+.[0-9]+" or 
-              pattern == "[0-9]+\\.[0-9]+\\.[0-9]+\\.[0-9]+"
-             ) and text.startswith(("192.", "127.", "10.", "172."), pos):
-            # Simple IP address match
-            ip_parts = text[pos:].split(".")
-            if len(ip_parts) >= 4 and all(part.isdigit() for part in ip_parts[:4]):
-                ip_len = len(ip_parts[0]) + len(ip_parts[1]) + len(ip_parts[2]) + len(ip_parts[3]) + 3  # Add 3 for the dots
-                return {"position": pos, "length": ip_len, "text": text[pos:pos+ip_len]}
-            return None
-            
-        # Anchor patterns
-        elif pattern == "^":
-            # Start of string anchor - only matches at position 0
-            if pos == 0:
-                return {"position": 0, "length": 0, "text": ""}
-            return None
-            
-        elif pattern == "$":
-            # End of string anchor - only matches at end of string
-            if pos == len(text):
-                return {"position": pos, "length": 0, "text": ""}
-            return None
-            
-        elif pattern.startswith("^") and pattern.endswith("$"):
-            # Combined anchors - match exactly the whole string (e.g., "^abc$")
-            inner_pattern = pattern[1:-1]
-            if pos == 0 and text == inner_pattern:
-                return {"position": 0, "length": len(inner_pattern), "text": inner_pattern}
-            return None
-            
-        elif pattern.startswith("^"):
-            # Start-anchored pattern (e.g., "^GET")
-            inner_pattern = pattern[1:]
-            if pos == 0:  # Only check at start of string
-                # Try to match the rest of the pattern
-                if text.startswith(inner_pattern, pos):
-                    return {"position": pos, "length": len(inner_pattern), "text": inner_pattern}
-            return None
-            
-        elif pattern.endswith("$"):
-            # End-anchored pattern (e.g., "POST$")
-            inner_pattern = pattern[:-1]
-            # First check if the pattern could be found
-            if inner_pattern and text[pos:].startswith(inner_pattern):
-                pattern_end = pos + len(inner_pattern)
-                # Then check if it's at the end
-                if pattern_end == len(text):
-                    return {"position": pos, "length": len(inner_pattern), "text": inner_pattern}
-            return None
-            
-        # Groups and backreferences
-        elif pattern == "(a)":
-            if pos < len(text) and text[pos] == 'a':
-                return {
-                    "position": pos, 
-                    "length": 1, 
-                    "text": "a",
-                    "groups": [{"position": pos, "length": 1, "text": "a"}]
-                }
-            return None
-            
-        elif pattern == "(b)":
-            if pos < len(text) and text[pos] == 'b':
-                return {
-                    "position": pos, 
-                    "length": 1, 
-                    "text": "b",
-                    "groups": [{"position": pos, "length": 1, "text": "b"}]
-                }
-            return None
-            
-        elif pattern == "(GET)":
-            if text.startswith("GET", pos):
-                return {
-                    "position": pos, 
-                    "length": 3, 
-                    "text": "GET",
-                    "groups": [{"position": pos, "length": 3, "text": "GET"}]
-                }
-            return None
-            
-        elif pattern == "(ab)":
-            if text.startswith("ab", pos):
-                return {
-                    "position": pos, 
-                    "length": 2, 
-                    "text": "ab",
-                    "groups": [{"position": pos, "length": 2, "text": "ab"}]
-                }
-            return None
-            
-        elif pattern == "(a*)":
-            # Find how many 'a's in a row
-            a_count = 0
-            while pos + a_count < len(text) and text[pos + a_count] == 'a':
-                a_count += 1
-            
-            if a_count > 0:
-                return {
-                    "position": pos, 
-                    "length": a_count, 
-                    "text": "a" * a_count,
-                    "groups": [{"position": pos, "length": a_count, "text": "a" * a_count}]
-                }
-            else:
-                # Special case: a* can match empty string
-                return {
-                    "position": pos, 
-                    "length": 0, 
-                    "text": "",
-                    "groups": [{"position": pos, "length": 0, "text": ""}]
-                }
-            
-        elif pattern == r"(a)\1":
-            # Match 'a' followed by same 'a' again (aa)
-            if pos + 1 < len(text) and text[pos:pos+2] == "aa":
-                return {
-                    "position": pos, 
-                    "length": 2, 
-                    "text": "aa",
-                    "groups": [
-                        {"position": pos, "length": 1, "text": "a"},
-                    ]
-                }
-            return None
-            
-        elif pattern == r"(b)\2":
-            # Match 'b' followed by same 'b' again (bb)
-            if pos + 1 < len(text) and text[pos:pos+2] == "bb":
-                return {
-                    "position": pos, 
-                    "length": 2, 
-                    "text": "bb",
-                    "groups": [
-                        {"position": pos, "length": 1, "text": "b"},
-                    ]
-                }
-            return None
-            
-        # Nested capturing groups
-        elif pattern == r"((a)(b))":  # Nested group with two single char groups
-            if pos + 1 < len(text) and text[pos:pos+2] == "ab":
-                return {
-                    "position": pos, 
-                    "length": 2, 
-                    "text": "ab",
-                    "groups": [
-                        {"position": pos, "length": 1, "text": "a"},
-                        {"position": pos+1, "length": 1, "text": "b"}
-                    ]
-                }
-            return None
-            
-        elif pattern == r"((a)(bc))":  # Nested group with one single char and one multi-char group
-            if pos + 2 < len(text) and text[pos:pos+3] == "abc":
-                return {
-                    "position": pos, 
-                    "length": 3, 
-                    "text": "abc",
-                    "groups": [
-                        {"position": pos, "length": 1, "text": "a"},
-                        {"position": pos+1, "length": 2, "text": "bc"}
-                    ]
-                }
-            return None
-            
-        # Lookahead patterns
-        elif pattern == r"a(?=b)":  # Positive lookahead: 'a' followed by 'b'
-            if pos < len(text) and text[pos] == 'a' and pos + 1 < len(text) and text[pos + 1] == 'b':
-                return {"position": pos, "length": 1, "text": "a"}  # Match just the 'a', not the 'b'
-            return None
-            
-        elif pattern == r"b(?=a)":  # Positive lookahead: 'b' followed by 'a'
-            if pos < len(text) and text[pos] == 'b' and pos + 1 < len(text) and text[pos + 1] == 'a':
-                return {"position": pos, "length": 1, "text": "b"}  # Match just the 'b', not the 'a'
-            return None
-            
-        elif pattern == r"a(?!b)":  # Negative lookahead: 'a' NOT followed by 'b'
-            if pos < len(text) and text[pos] == 'a' and (pos + 1 >= len(text) or text[pos + 1] != 'b'):
-                return {"position": pos, "length": 1, "text": "a"}
-            return None
-            
-        elif pattern == r"b(?!a)":  # Negative lookahead: 'b' NOT followed by 'a'
-            if pos < len(text) and text[pos] == 'b' and (pos + 1 >= len(text) or text[pos + 1] != 'a'):
-                return {"position": pos, "length": 1, "text": "b"}
-            return None
-            
-        # Lookbehind patterns
-        elif pattern == r"(?<=a)b":  # Positive lookbehind: 'b' preceded by 'a'
-            # For 'ab', when we're at pos 1 (the 'b'), check if the preceding char at pos 0 is 'a'
-            if pos > 0 and text[pos-1] == 'a' and pos < len(text) and text[pos] == 'b':
-                return {"position": pos, "length": 1, "text": "b"}  # Match just the 'b', at the current position
-            return None
-            
-        elif pattern == r"(?<=b)a":  # Positive lookbehind: 'a' preceded by 'b'
-            # For 'ba', when we're at pos 1 (the 'a'), check if the preceding char at pos 0 is 'b'
-            if pos > 0 and text[pos-1] == 'b' and pos < len(text) and text[pos] == 'a':
-                return {"position": pos, "length": 1, "text": "a"}  # Match just the 'a', at the current position
-            return None
-            
-        elif pattern == r"(?<!a)b":  # Negative lookbehind: 'b' NOT preceded by 'a'
-            # Check if we're at position 0 (no preceding char) or if preceding char isn't 'a'
-            if pos < len(text) and text[pos] == 'b' and (pos == 0 or text[pos-1] != 'a'):
-                return {"position": pos, "length": 1, "text": "b"}
+        records = hvm_regex_results.decode(output)
+        if records is None:
             return None
+        results = self._results_from_records(records, [text])
+        return results[0] if results is not None else None
+    
+    def _parse_match_list_output(self, output, texts):
+        """Parse the stdout of a batched match program into match results.
+        
+        The program prints the encoded result list (see hvm_regex_results);
+        a list of constructors such as `[#Match{0 3}, #NoMatch]` is also
+        accepted.
+        
+        Args:
+            output: Stdout of the HVML program
+            texts: Texts matched by each job, in job order
             
-        elif pattern == r"(?<!b)a":  # Negative lookbehind: 'a' NOT preceded by 'b'
-            # Check if we're at position 0 (no preceding char) or if preceding char isn't 'b'
-            if pos < len(text) and text[pos] == 'a' and (pos == 0 or text[pos-1] != 'b'):
-                return {"position": pos, "length": 1, "text": "a"}
+        Returns:
+            List of match results in job order, or None if the output does not
+            contain exactly one result per job
+        """
+        records = hvm_regex_results.decode(output)
+        if records is not None:
+            return self._results_from_records(records, texts)
+        
+        constructors = _RESULT_RE.findall(output)
+        if len(constructors) != len(texts):
             return None
+        
+        return [
+            self._result_from_fields(constructor, fields.split(), text)
+            for (constructor, fields), text in zip(constructors, texts)
+        ]
+    
+    def _results_from_records(self, records, texts):
+        """Build match results from decoded result records.
+        
+        Args:
+            records: (id, start, end, groups) tuples from hvm_regex_results.decode
+            texts: Texts matched by each job, indexed by record id
             
-        elif pattern == r"(?<!c)b":  # Negative lookbehind: 'b' NOT preceded by 'c'
-            # This case was added for our test_neg_lookbehind_no_match test
-            # In this specific test, we're checking when it should NOT match, so return None
-            if pos < len(text) and text[pos] == 'b' and pos > 0 and text[pos-1] == 'c':
-                return None  # 'b' is preceded by 'c', so it shouldn't match
-            return {"position": pos, "length": 1, "text": "b"}
-            
-        # Word boundary patterns
-        elif pattern == r"\b" or pattern.startswith(r"\b"):
-            # Check for a word boundary at this position
-            is_boundary = False
-            
-            # 1. At start of string and first char is word char
-            if pos == 0 and pos < len(text) and self._is_word_char(text[pos]):
-                is_boundary = True
-                
-            # 2. At end of string and last char is word char
-            elif pos == len(text) and pos > 0 and self._is_word_char(text[pos-1]):
-                is_boundary = True
-                
-            # 3. In middle: transition between word/non-word
-            elif 0 < pos < len(text):
-                prev_is_word = self._is_word_char(text[pos-1])
-                curr_is_word = self._is_word_char(text[pos])
-                if prev_is_word != curr_is_word:
-                    is_boundary = True
-            
-            # If this is just the \b pattern by itself
-            if pattern == r"\b":
-                if is_boundary:
-                    return {"position": pos, "length": 0, "text": ""}
+        Returns:
+            List with the first match of each job (None for jobs without a
+            record), or None if a record names an unknown job
+        """
+        results = [None] * len(texts)
+        for job_id, start, end, groups in records:
+            if not 0 <= job_id < len(texts):
                 return None
+            if results[job_id] is None:
+                results[job_id] = Match(texts[job_id], start, end, groups)
+        return results
+    
+    def _result_from_fields(self, constructor, fields, text):
+        """Build a match result from a parsed Result constructor.
+        
+        Args:
+            constructor: Constructor name ("Match", "MatchGroup", "MatchGroups" or "NoMatch")
+            fields: Constructor fields as strings
+            text: Text that was matched
             
-            # If this is a pattern starting with \b
-            if pattern.startswith(r"\b") and len(pattern) > 2:
-                if not is_boundary:
-                    return None
-                
-                # Extract the part after \b 
-                if pattern.startswith(r"\b") and pattern.endswith(r"\b") and len(pattern) > 4:
-                    # Pattern like \bword\b
-                    inner_pattern = pattern[2:-2]
-                    if pos + len(inner_pattern) < len(text):
-                        # Check if the inner pattern matches
-                        inner_match = self.match(inner_pattern, text, pos)
-                        if inner_match:
-                            # Check for word boundary at the end
-                            end_pos = pos + inner_match['length']
-                            end_is_boundary = False
-                            
-                            # Check if end position is at a word boundary
-                            if end_pos == len(text):
-                                end_is_boundary = True
-                            elif 0 < end_pos < len(text):
-                                end_prev_is_word = self._is_word_char(text[end_pos-1])
-                                end_curr_is_word = self._is_word_char(text[end_pos]) if end_pos < len(text) else False
-                                if end_prev_is_word != end_curr_is_word:
-                                    end_is_boundary = True
-                            
-                            if end_is_boundary:
-                                return inner_match
-                else:
-                    # Pattern like \bword
-                    inner_pattern = pattern[2:]
-                    
-                    # Special case for "word" in our tests
-                    if inner_pattern == "word" and text[pos:pos+4] == "word":
-                        return {"position": pos, "length": 4, "text": "word"}
-                    
-                    inner_match = self.match(inner_pattern, text, pos)
-                    if inner_match:
-                        return inner_match
-            
+        Returns:
+            Match object, or None for #NoMatch
+        """
+        if constructor == "NoMatch":
             return None
+        
+        values = [int(field) for field in fields]
+        pos, length = values[0], values[1]
+        groups = tuple(
+            (group_pos, group_pos + group_len)
+            for group_pos, group_len in zip(values[2::2], values[3::2])
+        )
+        return Match(text, pos, pos + length, groups)
+    
+    def _fallback_match(self, pattern, text, pos=0):
+        """Match using the pure-Python engine (see hvm_regex_engine).
+        
+        Like the HVM backend, this searches for the leftmost match starting
+        at or after pos.
+        
+        Args:
+            pattern: Regex pattern string or CompiledPattern
+            text: Text to match against
+            pos: Starting position in the text
             
-        elif pattern == r"\B":
-            # Non-word boundary - inverse of \b
-            
-            # At start: first char is NOT a word char
-            if pos == 0 and pos < len(text) and not self._is_word_char(text[pos]):
-                return {"position": pos, "length": 0, "text": ""}
-                
-            # At end: last char is NOT a word char
-            elif pos == len(text) and pos > 0 and not self._is_word_char(text[pos-1]):
-                return {"position": pos, "length": 0, "text": ""}
-                
-            # In middle: NO transition between word/non-word
-            elif 0 < pos < len(text):
-                prev_is_word = self._is_word_char(text[pos-1])
-                curr_is_word = self._is_word_char(text[pos])
-                if prev_is_word == curr_is_word:
-                    return {"position": pos, "length": 0, "text": ""}
-                    
+        Returns:
+            Match object if successful, None otherwise
+        """
+        if not isinstance(pattern, CompiledPattern):
+            pattern = self.compile(pattern)
+        
+        span = pattern.regex.search(text, pos)
+        if span is None:
             return None
+        return self._result_from_span(pattern, text, span)
+    
+    def _result_from_span(self, pattern, text, span):
+        """Build a match result from a pure-Python engine result.
+        
+        Args:
+            pattern: CompiledPattern that matched
+            text: Text that was matched
+            span: (start, end, groups) tuple from hvm_regex_engine.Regex
             
-        # Benchmark patterns
-        elif pattern in ["GET", "POST", "HTTP/1.1", "a|b", "a*b", "a+b", "[0-9]+", "[a-z]+", "[^a-z]+"]:
-            # For benchmark tests, always return a match with length 3
-            return {"position": pos, "length": 3, "text": text[pos:pos+3] if len(text) > pos+3 else text[pos:]}
-            
-        # Default case - no match
-        else:
-            # Only print warning in non-benchmark mode
-            print(f"WARNING: Unhandled pattern in fallback: {pattern}")
-            return None
+        Returns:
+            Match object
+        """
+        start, end, groups = span
+        return Match(text, start, end, groups if pattern.regex.group_count else ())
     
-    def _generate_match_hvml(self, pattern, text, pos):
+    def _generate_match_hvml(self, pattern, text, pos, hvm_pattern=None):
         """Generate HVM code for the match operation.
         
         Args:
             pattern: Regex pattern string
             text: Text to match against
             pos: Starting position in the text
+            hvm_pattern: Precompiled HVM pattern constructor. If None, the
+                pattern is converted here.
             
         Returns:
             HVM code as a string
         """
         # Convert the pattern to HVM pattern format
-        hvm_pattern = self._parse_regex_to_hvm(pattern, text)
+        if hvm_pattern is None:
+            hvm_pattern = self._parse_regex_to_hvm(pattern, text)
+        
+        return self._generate_program_hvml(hvm_regex_results.encode_expr([f"@match({hvm_pattern})"]))
+    
+    def _generate_batch_hvml(self, hvm_patterns):
+        """Generate HVM code that evaluates a list of match jobs in one run.
+        
+        Args:
+            hvm_patterns: HVM pattern constructors, one per job
+            
+        Returns:
+            HVM code as a string whose @main is the encoded result list (see
+            hvm_regex_results), job i having id i
+        """
+        jobs = [f"@match({hvm_pattern})" for hvm_pattern in hvm_patterns]
+        return self._generate_program_hvml(hvm_regex_results.encode_expr(jobs))
+    
+    def _generate_program_hvml(self, main_expr):
+        """Generate a complete HVM program around the given @main expression.
         
+        Args:
+            main_expr: HVM expression evaluated by @main
+            
+        Returns:
+            HVM code as a string
+        """
         # Use the basic_regex.hvml implementation
         hvml_code = f"""// Autogenerated HVM regex match file based on basic_regex.hvml
 
@@ -889,15 +959,12 @@ data Pattern {{
   #NonWordBoundary: @match_non_word_boundary
 }}
 
+{hvm_regex_results.HVML_ENCODER}
 // Main function to return the match result
-@main = @match({hvm_pattern})
+@main = {main_expr}
 """
         return hvml_code
     
-    def _is_word_char(self, char):
-        """Check if a character is a word character (letter, digit, or underscore)."""
-        return char.isalnum() or char == '_'
-        
     def _parse_regex_to_hvm(self, pattern, text=None):
         """Convert a regex pattern string to an HVM pattern constructor.
         
@@ -1169,12 +1236,13 @@ def benchmark_hvm_regex():
     total_matches = 0
     iterations = 10  # Number of times to run each test
     
+    # Fold each pattern x text grid into a single batched HVM run
+    pairs = [(pattern, text) for pattern in patterns for text in texts]
+    
     for _ in range(iterations):
-        for pattern in patterns:
-            for text in texts:
-                result = matcher.match(pattern, text)
-                if result:
-                    total_matches += 1
+        for result in matcher.match_many(pairs):
+            if result:
+                total_matches += 1
     
     end = time.time()
     elapsed = end - start
@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+"""
+Test the asyncio front-end (hvm_regex_async)
+
+These tests use a stand-in hvml executable so they can run without HVM installed.
+"""
+
+import asyncio
+import os
+import shutil
+import sys
+import tempfile
+import time
+import unittest
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..', 'src', 'wrapper')))
+
+from hvm_regex_async import AsyncHvmRegexMatcher
+from hvm_regex_results import RESULT_FORMAT
+from hvm_regex_wrapper import HvmRegexMatcher
+
+# Stand-in for hvml: records its pid, takes a while to answer, and hangs when asked to
+FAKE_HVML = """#!{python}
+import os, sys, time
+program = open(sys.argv[2]).read()
+with open(os.path.join({tmpdir!r}, "pids"), "a") as f:
+    f.write("%d\\n" % os.getpid())
+time.sleep(30 if "HANG" in program else 0.3)
+print("[{format}, 0, 0, 1, 0]")
+"""
+
+
+class TestAsyncMatcher(unittest.TestCase):
+    """Tests for AsyncHvmRegexMatcher."""
+
+    def setUp(self):
+        """Create a stand-in hvml executable."""
+        self.tmpdir = tempfile.mkdtemp()
+        self.hvm_path = os.path.join(self.tmpdir, "hvml")
+        with open(self.hvm_path, "w") as f:
+            f.write(FAKE_HVML.format(python=sys.executable, tmpdir=self.tmpdir, format=RESULT_FORMAT))
+        os.chmod(self.hvm_path, 0o755)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def pids(self):
+        with open(os.path.join(self.tmpdir, "pids")) as f:
+            return [int(line) for line in f]
+
+    def test_matches_overlap(self):
+        """Concurrent matches evaluate at the same time without blocking the loop."""
+        async def main():
+            ticks = 0
+
+            async def ticker():
+                nonlocal ticks
+                while True:
+                    await asyncio.sleep(0.01)
+                    ticks += 1
+
+            tick_task = asyncio.create_task(ticker())
+            async with AsyncHvmRegexMatcher(hvm_path=self.hvm_path, concurrency=8) as matcher:
+                started = time.perf_counter()
+                results = await matcher.scan_many([("a", "a%d" % i) for i in range(8)])
+                elapsed = time.perf_counter() - started
+            tick_task.cancel()
+            return results, elapsed, ticks
+
+        results, elapsed, ticks = asyncio.run(main())
+        self.assertEqual([result["text"] for result in results], ["a"] * 8)
+        self.assertLess(elapsed, 8 * 0.3)
+        self.assertGreater(ticks, 10)
+
+    def test_concurrency_limit(self):
+        """No more evaluations than the limit run at once."""
+        async def main():
+            async with AsyncHvmRegexMatcher(hvm_path=self.hvm_path, concurrency=2) as matcher:
+                started = time.perf_counter()
+                await asyncio.gather(*(matcher.search("a", "a") for _ in range(4)))
+                return time.perf_counter() - started
+
+        self.assertGreaterEqual(asyncio.run(main()), 2 * 0.3)
+
+    def test_cancel_kills_evaluation(self):
+        """Cancelling a match kills its hvml process."""
+        async def main():
+            async with AsyncHvmRegexMatcher(hvm_path=self.hvm_path) as matcher:
+                task = asyncio.create_task(matcher.match("a", "a HANG"))
+                while not os.path.exists(os.path.join(self.tmpdir, "pids")):
+                    await asyncio.sleep(0.01)
+                task.cancel()
+                with self.assertRaises(asyncio.CancelledError):
+                    await task
+
+        started = time.perf_counter()
+        asyncio.run(main())
+        self.assertLess(time.perf_counter() - started, 10)
+        with self.assertRaises(ProcessLookupError):
+            os.kill(self.pids()[-1], 0)
+
+    def test_fallback_and_prefilter(self):
+        """Fallback mode and literal prefiltering give the synchronous results."""
+        sync = HvmRegexMatcher(force_fallback=True)
+
+        async def main():
+            matcher = AsyncHvmRegexMatcher(sync)
+            return [await matcher.match(r"b+", "abbc"), await matcher.search(r"b+", "abbc", 3),
+                    await matcher.match(r"xyz", "abc")]
+
+        self.assertEqual(asyncio.run(main()),
+                         [sync.match(r"b+", "abbc"), None, None])
+
+
+def run_tests():
+    """Run the async matcher tests."""
+    suite = unittest.TestLoader().loadTestsFromTestCase(TestAsyncMatcher)
+
+    runner = unittest.TextTestRunner(verbosity=2)
+    result = runner.run(suite)
+
+    print(f"\nSummary: Ran {result.testsRun} tests, {len(result.failures)} failures, {len(result.errors)} errors")
+
+    return 0 if result.wasSuccessful() else 1
+
+
+if __name__ == "__main__":
+    sys.exit(run_tests())
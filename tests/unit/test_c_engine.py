@@ -0,0 +1,260 @@
+#!/usr/bin/env python3
+"""
+Test the in-process engine behind the C API (src/wrapper/hvm_regex.c)
+
+The library is built with `make lib`; the tests are skipped when no C
+compiler is available.
+"""
+
+import ctypes
+import os
+import random
+import re
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import unittest
+from unittest import mock
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..'))
+LIBRARY = os.path.join(ROOT, 'src', 'wrapper', 'libhvmregex.so')
+
+
+class Match(ctypes.Structure):
+    _fields_ = [("position", ctypes.c_int), ("length", ctypes.c_int), ("success", ctypes.c_int)]
+
+
+class Record(ctypes.Structure):
+    _fields_ = [("id", ctypes.c_uint), ("start", ctypes.c_int), ("end", ctypes.c_int),
+                ("group_count", ctypes.c_int), ("groups", ctypes.c_size_t)]
+
+
+def load_library():
+    """Build and load libhvmregex, or return None if it cannot be built."""
+    try:
+        subprocess.run(["make", "-s", "lib"], cwd=ROOT, check=True,
+                       stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    lib = ctypes.CDLL(LIBRARY)
+    lib.hvm_regex_compile.argtypes = [ctypes.c_char_p]
+    lib.hvm_regex_compile.restype = ctypes.c_void_p
+    lib.hvm_regex_free.argtypes = [ctypes.c_void_p]
+    lib.hvm_regex_is_native.argtypes = [ctypes.c_void_p]
+    lib.hvm_regex_match.argtypes = [ctypes.c_void_p, ctypes.c_char_p, ctypes.c_size_t,
+                                    ctypes.c_size_t, ctypes.POINTER(Match)]
+    lib.hvm_regex_find_all.argtypes = [ctypes.c_void_p, ctypes.c_char_p, ctypes.c_size_t,
+                                       ctypes.POINTER(Match), ctypes.c_size_t]
+    lib.hvm_regex_alloc_scratch.argtypes = [ctypes.c_void_p, ctypes.POINTER(ctypes.c_void_p)]
+    lib.hvm_regex_free_scratch.argtypes = [ctypes.c_void_p]
+    lib.hvm_regex_match_scratch.argtypes = [ctypes.c_void_p, ctypes.c_void_p, ctypes.c_char_p,
+                                            ctypes.c_size_t, ctypes.c_size_t,
+                                            ctypes.POINTER(Match)]
+    lib.hvm_regex_find_all_scratch.argtypes = [ctypes.c_void_p, ctypes.c_void_p, ctypes.c_char_p,
+                                               ctypes.c_size_t, ctypes.c_size_t,
+                                               ctypes.POINTER(Match), ctypes.c_size_t]
+    lib.hvm_regex_match_hvm.argtypes = [ctypes.c_void_p, ctypes.c_char_p, ctypes.c_size_t,
+                                        ctypes.c_size_t, ctypes.POINTER(Match)]
+    lib.hvm_regex_decode_results.argtypes = [ctypes.c_char_p, ctypes.POINTER(Record),
+                                             ctypes.c_size_t, ctypes.POINTER(ctypes.c_int),
+                                             ctypes.c_size_t]
+    return lib
+
+
+LIB = load_library()
+
+# Stand-in for hvml: prints whatever HVM_FAKE_OUTPUT holds
+FAKE_HVML = """#!{python}
+import os
+print(os.environ["HVM_FAKE_OUTPUT"])
+"""
+
+PATTERNS = [
+    rb"a", rb"ab", rb"a|b", rb"a*", rb"a+b", rb"a?b", rb"(a|ab)(c|bcd)", rb"[a-c]+",
+    rb"[^ab]", rb"a.c", rb"(?:ab)*c", rb"a{2}", rb"a{1,3}", rb"a{2,}b", rb"a+?",
+    rb"(a|b)*?c", rb"\bab", rb"b\B", rb"^a", rb"c$", rb"\d+", rb"\w\s\W", rb"(?i)AB",
+    rb"[\d]x", rb"x\.y", rb"\x61b", rb"a{x}",
+]
+
+
+@unittest.skipIf(LIB is None, "C compiler not available")
+class TestCEngine(unittest.TestCase):
+    """Tests for hvm_regex_match running compiled programs in-process."""
+
+    def compile(self, pattern):
+        regex = LIB.hvm_regex_compile(pattern)
+        self.assertTrue(regex, pattern)
+        self.addCleanup(LIB.hvm_regex_free, regex)
+        return regex
+
+    def search(self, regex, text, pos=0):
+        match = Match()
+        if not LIB.hvm_regex_match(regex, text, len(text), pos, ctypes.byref(match)):
+            return None
+        return (match.position, match.position + match.length)
+
+    def test_matches_re(self):
+        """Leftmost-first results agree with the re module."""
+        rng = random.Random(5)
+        texts = [b"", b"abc", b"aabc", b"x.y ab", b"AbAB", b"12 ab_c!"]
+        texts += [bytes(rng.choice(b"abcd1 _.x") for _ in range(rng.randint(0, 12)))
+                  for _ in range(150)]
+        for pattern in PATTERNS:
+            regex = self.compile(pattern)
+            expected_regex = re.compile(pattern)
+            for text in texts:
+                for pos in (0, 1):
+                    if pos > len(text):
+                        continue
+                    found = expected_regex.search(text, pos)
+                    self.assertEqual(self.search(regex, text, pos),
+                                     found.span() if found else None, (pattern, text, pos))
+
+    def test_find_all(self):
+        """find_all returns every non-overlapping match."""
+        regex = self.compile(b"a")
+        matches = (Match * 8)()
+        count = LIB.hvm_regex_find_all(regex, b"abacada", 7, matches, 8)
+        self.assertEqual([m.position for m in matches[:count]], [0, 2, 4, 6])
+
+        regex = self.compile(b"xy")
+        self.assertEqual(LIB.hvm_regex_find_all(regex, b"abacada", 7, matches, 8), 0)
+
+    def test_find_all_matches_re(self):
+        """find_all agrees with re.finditer, including empty matches."""
+        matches = (Match * 32)()
+        for pattern in PATTERNS + [rb"x*", rb"|a", rb"a|", rb"\b"]:
+            regex = self.compile(pattern)
+            for text in (b"", b"abxd", b"aab ab", b"bab", b"c1 cab"):
+                count = LIB.hvm_regex_find_all(regex, text, len(text), matches, 32)
+                found = [(m.position, m.position + m.length) for m in matches[:count]]
+                expected = [m.span() for m in re.finditer(pattern, text)]
+                self.assertEqual(found, expected, (pattern, text))
+
+    def alloc_scratch(self, *regexes):
+        scratch = ctypes.c_void_p()
+        for regex in regexes:
+            self.assertEqual(LIB.hvm_regex_alloc_scratch(regex, ctypes.byref(scratch)), 1)
+        self.addCleanup(LIB.hvm_regex_free_scratch, scratch)
+        return scratch
+
+    def test_scratch_shared_by_patterns(self):
+        """One scratch grown for several patterns serves all of them."""
+        small = self.compile(b"q")
+        large = self.compile(b"(?:ab|cd){1,20}x")
+        scratch = self.alloc_scratch(small, large)
+        match = Match()
+        text = b"zzabcdx"
+        self.assertEqual(LIB.hvm_regex_match_scratch(large, scratch, text, len(text), 0,
+                                                     ctypes.byref(match)), 1)
+        self.assertEqual((match.position, match.length), (2, 5))
+        self.assertEqual(LIB.hvm_regex_match_scratch(small, scratch, text, len(text), 0,
+                                                     ctypes.byref(match)), 0)
+
+        # A scratch sized for a smaller program is rejected, not overrun
+        too_small = self.alloc_scratch(small)
+        self.assertEqual(LIB.hvm_regex_match_scratch(large, too_small, text, len(text), 0,
+                                                     ctypes.byref(match)), -1)
+
+    def test_threads_share_compiled_pattern(self):
+        """Threads with their own scratch can match one pattern concurrently."""
+        regex = self.compile(rb"\bsel\w*\s+\d+")
+        text = b"x select 12 y; SELECT 3, selected  456 " * 200
+        expected = [m.span() for m in re.finditer(rb"\bsel\w*\s+\d+", text)]
+        results = [None] * 4
+
+        def scan(index):
+            scratch = ctypes.c_void_p()
+            LIB.hvm_regex_alloc_scratch(regex, ctypes.byref(scratch))
+            matches = (Match * 1000)()
+            for _ in range(5):
+                count = LIB.hvm_regex_find_all_scratch(regex, scratch, text, len(text), 0,
+                                                       matches, 1000)
+            LIB.hvm_regex_free_scratch(scratch)
+            results[index] = [(m.position, m.position + m.length) for m in matches[:count]]
+
+        threads = [threading.Thread(target=scan, args=(i,)) for i in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(results, [expected] * 4)
+
+    def test_binary_text(self):
+        """Text is matched by length, so NUL bytes are ordinary characters."""
+        regex = self.compile(b"b.c")
+        self.assertEqual(self.search(regex, b"a\0b\0c"), (2, 5))
+
+    def test_invalid_patterns(self):
+        """Syntax errors fail compilation."""
+        for pattern in (b"(a", b"a)", b"*a", b"[a", b"a{3,1}", b"a**", b"\\"):
+            self.assertFalse(LIB.hvm_regex_compile(pattern), pattern)
+
+    def test_decode_results(self):
+        """The C decoder reads the same result lists as hvm_regex_results."""
+        records = (Record * 4)()
+        groups = (ctypes.c_int * 8)()
+        output = b"! a = [21041, 2, 1, 5, 2, 1, 2, 4294967295, 4294967295, 0, 0, 0, 0]\n"
+        self.assertEqual(LIB.hvm_regex_decode_results(output, records, 4, groups, 8), 2)
+        self.assertEqual([(r.id, r.start, r.end, r.group_count, r.groups) for r in records[:2]],
+                         [(2, 1, 5, 2, 0), (0, 0, 0, 0, 4)])
+        self.assertEqual(list(groups[:4]), [1, 2, -1, -1])
+
+        for output in (b"#Match{0 3}", b"[1, 0, 3, 0]", b"[21041, 0, 0, 3]",
+                       b"[21041, 0, 0, 3, 1, 0]"):
+            self.assertEqual(LIB.hvm_regex_decode_results(output, records, 4, groups, 8), -1,
+                             output)
+        # Results that do not fit are rejected rather than truncated
+        self.assertEqual(LIB.hvm_regex_decode_results(b"[21041, 0, 0, 1, 0, 1, 0, 1, 0]",
+                                                      records, 1, groups, 8), -1)
+
+    def test_hvm_backend_decodes_results(self):
+        """The HVM backend reads the result list printed by hvml."""
+        tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmpdir)
+        with open(os.path.join(tmpdir, "hvml"), "w") as f:
+            f.write(FAKE_HVML.format(python=sys.executable))
+        os.chmod(os.path.join(tmpdir, "hvml"), 0o755)
+
+        path = tmpdir + os.pathsep + os.environ.get("PATH", "")
+        environ = mock.patch.dict(os.environ, {"PATH": path})
+        environ.start()
+        self.addCleanup(environ.stop)
+
+        regex = self.compile(b"a(?=b)")
+        match = Match()
+        # Records of other jobs are skipped
+        os.environ["HVM_FAKE_OUTPUT"] = "[21041, 1, 0, 1, 0, 0, 2, 5, 0]"
+        self.assertEqual(LIB.hvm_regex_match_hvm(regex, b"xxaab", 5, 0, ctypes.byref(match)), 1)
+        self.assertEqual((match.position, match.length), (2, 3))
+        # An empty list is no match, whatever the stub patterns would say
+        os.environ["HVM_FAKE_OUTPUT"] = "[21041]"
+        self.assertEqual(LIB.hvm_regex_match_hvm(regex, b"xxaab", 5, 0, ctypes.byref(match)), 0)
+
+    def test_unsupported_patterns_compile(self):
+        """Lookaround and backreferences compile and use the HVM backend."""
+        self.assertEqual(LIB.hvm_regex_is_native(self.compile(b"ab")), 1)
+        matches = (Match * 16)()
+        for pattern in (b"a(?=b)", b"(a)\\1"):
+            regex = self.compile(pattern)
+            self.assertEqual(LIB.hvm_regex_is_native(regex), 0, pattern)
+            # The backend's results never make find_all loop over one match
+            self.assertLessEqual(LIB.hvm_regex_find_all(regex, b"xaab", 4, matches, 16), 1)
+
+
+def run_tests():
+    """Run the C engine tests."""
+    suite = unittest.TestLoader().loadTestsFromTestCase(TestCEngine)
+
+    runner = unittest.TextTestRunner(verbosity=2)
+    result = runner.run(suite)
+
+    print(f"\nSummary: Ran {result.testsRun} tests, {len(result.failures)} failures, {len(result.errors)} errors")
+
+    return 0 if result.wasSuccessful() else 1
+
+
+if __name__ == "__main__":
+    sys.exit(run_tests())
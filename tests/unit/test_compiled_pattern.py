@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+"""
+Test compiled patterns and the compiled pattern cache of HvmRegexMatcher
+"""
+
+import os
+import re
+import sys
+import unittest
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..', 'src', 'wrapper')))
+
+from hvm_regex_wrapper import HvmRegexMatcher, IGNORECASE
+
+
+class TestCompiledPattern(unittest.TestCase):
+    """Tests for HvmRegexMatcher.compile."""
+    
+    def setUp(self):
+        """Set up a fallback matcher with a small cache."""
+        self.matcher = HvmRegexMatcher(force_fallback=True, cache_size=2)
+    
+    def test_cache_hits_and_misses(self):
+        """Compiling the same pattern twice reuses the compiled object."""
+        first = self.matcher.compile("GET")
+        second = self.matcher.compile("GET")
+        self.assertIs(first, second)
+        self.assertEqual(self.matcher.cache_info()["hits"], 1)
+        self.assertEqual(self.matcher.cache_info()["misses"], 1)
+        
+        # Flags are part of the cache key
+        self.assertIsNot(self.matcher.compile("GET", flags=1), first)
+    
+    def test_cache_is_bounded(self):
+        """The least recently used pattern is evicted first."""
+        get = self.matcher.compile("GET")
+        self.matcher.compile("POST")
+        self.matcher.compile("GET")
+        self.matcher.compile("[abc]")
+        
+        info = self.matcher.cache_info()
+        self.assertEqual(info["size"], 2)
+        self.assertIs(self.matcher.compile("GET"), get)
+        self.assertEqual(self.matcher.cache_info()["misses"], 3)
+    
+    def test_match_and_search(self):
+        """match() and search() return the expected span."""
+        pattern = self.matcher.compile("ab")
+        result = pattern.match("abc")
+        self.assertIsNotNone(result)
+        self.assertEqual(result["length"], 2)
+        self.assertIsNotNone(pattern.search("abc"))
+    
+    def test_finditer(self):
+        """finditer() yields successive non-overlapping matches."""
+        pattern = self.matcher.compile("[abc]")
+        found = [m["text"] for m in pattern.finditer("abc")]
+        self.assertEqual(found, ["a", "b", "c"])
+    
+    def test_finditer_empty_matches(self):
+        """Empty matches advance like re.finditer."""
+        for pattern, text in [("x*", "abxd"), ("|a", "aa"), ("a*", "baaa"), (r"\b", "ab cd"),
+                              ("a|", "bab"), ("(?=a)|a", "aa"), ("", "")]:
+            expected = [m.span() for m in re.finditer(pattern, text)]
+            found = [(m["position"], m["position"] + m["length"])
+                     for m in self.matcher.finditer(pattern, text)]
+            self.assertEqual(found, expected, pattern)
+    
+    def test_hvm_mode_rejects_flags(self):
+        """Flags the HVM patterns cannot express raise instead of being ignored."""
+        matcher = HvmRegexMatcher(hvm_path=os.path.join(os.path.dirname(__file__), "missing-hvml"))
+        matcher.use_fallback = False
+        with self.assertRaises(ValueError):
+            matcher.compile("get", IGNORECASE)
+        with self.assertRaises(ValueError):
+            matcher.compile_all([("get", IGNORECASE)])
+        self.assertEqual(matcher.compile("get").flags, 0)
+        self.assertEqual(self.matcher.compile("get", IGNORECASE).search("GET")["length"], 3)
+    
+    def test_matcher_match_uses_cache(self):
+        """HvmRegexMatcher.match compiles through the cache."""
+        self.matcher.match("a", "abc")
+        self.matcher.match("a", "abc")
+        self.assertEqual(self.matcher.cache_info()["hits"], 1)
+
+
+def run_tests():
+    """Run the compiled pattern tests."""
+    suite = unittest.TestLoader().loadTestsFromTestCase(TestCompiledPattern)
+    
+    runner = unittest.TextTestRunner(verbosity=2)
+    result = runner.run(suite)
+    
+    print(f"\nSummary: Ran {result.testsRun} tests, {len(result.failures)} failures, {len(result.errors)} errors")
+    
+    return 0 if result.wasSuccessful() else 1
+
+
+if __name__ == "__main__":
+    sys.exit(run_tests())
@@ -0,0 +1,167 @@
+#!/usr/bin/env python3
+"""
+Test the pure-Python fallback engine
+
+Results are compared against Python's re module on patterns covering every
+Pattern constructor of optimized_regex.hvml.
+"""
+
+import os
+import random
+import re
+import sys
+import unittest
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..', 'src', 'wrapper')))
+
+import hvm_regex_engine
+import hvm_regex_parser
+from hvm_regex_backtrack import BacktrackRegex
+from hvm_regex_nfa import NfaRegex
+from hvm_regex_wrapper import HvmRegexMatcher, IGNORECASE, RegexError
+
+PATTERNS = [
+    r"GET", r"a|b", r"a*", r"a+b", r"a?", r"(a|ab)(c|bcd)(d*)", r"a*?b", r"(a+)+b",
+    r"^ab", r"ab$", r"^$", r"\bab\b", r"\Bb", r"[a-c]+", r"[^ab]+", r"\d+\.\d",
+    r"a{2,3}", r"a{2}", r"a{1,}?", r"(a)|(b)", r"(a|b)+c", r"\w+\s\w+", r"a.c",
+    r"(a)(?:b(c))?", r"[\d\s]+", r"(?:ab){0,2}?c", r"(ab|a)(bc|c)?", r"(x)?y",
+    r"(?<=a)b", r"(?<!a)b", r"a(?=b)", r"a(?!b)", r"(a)\1", r"(a+)b\1", r"(?<=ab|cd)x",
+]
+
+
+def _expected(regex, method, text, pos):
+    m = getattr(regex, method)(text, pos)
+    if m is None:
+        return None
+    return m.start(), m.end(), tuple(m.span(g) for g in range(1, regex.groups + 1))
+
+
+class TestFallbackEngine(unittest.TestCase):
+    """Tests for the pure-Python NFA/DFA and backtracking engines."""
+
+    def test_agrees_with_re(self):
+        """search and match agree with the re module on random inputs."""
+        rng = random.Random(1)
+        for pattern in PATTERNS:
+            expected_re = re.compile(pattern)
+            compiled = hvm_regex_engine.compile(pattern)
+            for _ in range(100):
+                text = "".join(rng.choice("abcdxy 1.") for _ in range(rng.randint(0, 10)))
+                pos = rng.randint(0, len(text))
+                for method in ("search", "match"):
+                    self.assertEqual(getattr(compiled, method)(text, pos),
+                                     _expected(expected_re, method, text, pos),
+                                     f"{method}({pattern!r}, {text!r}, {pos})")
+
+    def test_engine_selection(self):
+        """Regular patterns use the automata engine, others the backtracker."""
+        self.assertIsInstance(hvm_regex_engine.compile(r"[a-z]+@\w+").engine, NfaRegex)
+        self.assertIsInstance(hvm_regex_engine.compile(r"(?<=a)b").engine, BacktrackRegex)
+        self.assertIsInstance(hvm_regex_engine.compile(r"(a)\1").engine, BacktrackRegex)
+
+    def test_ignorecase(self):
+        """IGNORECASE and inline (?i) fold literals and classes."""
+        self.assertEqual(hvm_regex_engine.compile("get", IGNORECASE).search("x GeT")[:2], (2, 5))
+        self.assertEqual(hvm_regex_engine.compile("[a-c]+", IGNORECASE).search("xAbC")[:2], (1, 4))
+        self.assertEqual(hvm_regex_engine.compile("a(?i:b)c").search("aBc aBC")[:2], (0, 3))
+        self.assertIsNone(hvm_regex_engine.compile("[^a]", IGNORECASE).search("aA"))
+
+    def test_ignorecase_classes_fold_like_chars(self):
+        """A folded class matches the same characters as the folded single character."""
+        for c in ("k", "K", "\u212a", "s", "\u017f", "\u00e9", "\u03a3", "\u0130", "1"):
+            char = hvm_regex_engine.compile(re.escape(c), IGNORECASE)
+            klass = hvm_regex_engine.compile(f"[{re.escape(c)}]", IGNORECASE)
+            for cp in list(range(0x400)) + [0x1e9e, 0x212a, 0x2126]:
+                self.assertEqual(klass.match(chr(cp)) is None, char.match(chr(cp)) is None, (c, cp))
+        self.assertEqual(hvm_regex_engine.compile("(?i)[k]x").search("\u212aX")[:2], (0, 2))
+        self.assertIsNone(hvm_regex_engine.compile("(?i)[^k]").search("\u212a"))
+
+    def test_ignorecase_shorthand_in_classes(self):
+        """\\d, \\w and \\s inside a folded class agree with re, KELVIN SIGN included."""
+        texts = [chr(cp) for cp in range(0x20, 0x7f)] + ["\t", "\n", "\u212a"]
+        for pattern in (r"(?i)[\W]", r"(?i)[^\W]", r"(?i)[^\W\d]", r"(?i)[\Wk]", r"(?i)[^\w]",
+                        r"(?i)[\w]", r"(?i)[\D]", r"(?i)[^\S]", r"(?i)[\d\s]"):
+            expected_re = re.compile(pattern)
+            compiled = hvm_regex_engine.compile(pattern)
+            for text in texts:
+                self.assertEqual(compiled.search(text), _expected(expected_re, "search", text, 0),
+                                 f"search({pattern!r}, {text!r})")
+
+    def test_dfa_cache_flush(self):
+        """A small state budget flushes the DFA cache without changing results."""
+        pattern = r"[ab]*a[ab]{6}c"
+        rng = random.Random(2)
+        text = "".join(rng.choice("ab") for _ in range(2000)) + "c"
+        compiled = hvm_regex_engine.compile(pattern)
+        compiled.engine.forward_dfa.max_states = 16
+        self.assertEqual(compiled.search(text), _expected(re.compile(pattern), "search", text, 0))
+        self.assertGreater(compiled.engine.forward_dfa.flushes, 0)
+
+    def test_memoized_backtracking(self):
+        """Memoizing failed states keeps results and defuses exponential patterns."""
+        rng = random.Random(4)
+        for pattern in PATTERNS + [r"((?!ab)(a|))*", r"(?:(a*)\1)*b", r"(?=a)(a{0,2})*(a)\2"]:
+            plain = hvm_regex_engine.compile(pattern)
+            memoized = hvm_regex_engine.compile(pattern, memoize=True)
+            for _ in range(50):
+                text = "".join(rng.choice("ab 1") for _ in range(rng.randint(0, 10)))
+                self.assertEqual(memoized.search(text), plain.search(text), f"{pattern!r}, {text!r}")
+
+        # Without the memo (and in re) these take time exponential in the
+        # length of the run, so the expected spans are spelled out
+        for pattern, group in ((r"(?<!x)(a|aa)*c", (59, 60)), (r"(?<=^)(a+)+c", (0, 60)),
+                               (r"(?=a)(a|a)*\1c", (58, 59))):
+            compiled = hvm_regex_engine.compile(pattern, memoize=True)
+            self.assertIsNone(compiled.search("a" * 60), pattern)
+            self.assertEqual(compiled.search("a" * 60 + "c"), (0, 61, (group,)), pattern)
+
+    def test_large_classes(self):
+        """Classes with many ranges, including non-ASCII ones, agree with re."""
+        rng = random.Random(3)
+        ranges = hvm_regex_parser.normalize_ranges(
+            (lo, lo + rng.randint(0, 3)) for lo in rng.sample(range(0x3000), 200))
+        for cp in range(0x3010):
+            self.assertEqual(hvm_regex_parser.ranges_contain(ranges, cp),
+                             any(lo <= cp <= hi for lo, hi in ranges), cp)
+
+        alphabet = "aZ09._~%!$&'()*+,;=:@/ \"#\u00e9\u03b1\u4e2d"
+        for pattern in (r"[a-zA-Z0-9._~%!$&'()*+,;=:@/]+", "[\u00e0-\u00ff\u03b1-\u03c9\u4e00-\u9fff]+",
+                        "[^\u0100-\uffff#]+"):
+            expected_re = re.compile(pattern)
+            compiled = hvm_regex_engine.compile(pattern)
+            for _ in range(100):
+                text = "".join(rng.choice(alphabet) for _ in range(rng.randint(0, 10)))
+                self.assertEqual(compiled.search(text), _expected(expected_re, "search", text, 0),
+                                 f"search({pattern!r}, {text!r})")
+
+    def test_syntax_errors(self):
+        """Invalid patterns raise RegexError."""
+        for pattern in ["(a", "a)", "*a", "a**", "[a", "a{3,2}", r"\1", "(?x)", r"\q"]:
+            with self.assertRaises(RegexError, msg=pattern):
+                hvm_regex_engine.compile(pattern)
+
+    def test_matcher_results(self):
+        """The fallback matcher searches from pos and reports groups."""
+        matcher = HvmRegexMatcher(force_fallback=True)
+        result = matcher.match(r"(\w+)@(\w+)?", "mail user@ here", 0)
+        self.assertEqual((result["position"], result["length"]), (5, 5))
+        self.assertEqual(result["groups"][0]["text"], "user")
+        self.assertEqual(result["groups"][1], {"position": -1, "length": 0, "text": None})
+        self.assertNotIn("groups", matcher.match("user", "a user"))
+        self.assertIsNone(matcher.match("^user", "a user"))
+
+
+def run_tests():
+    """Run the fallback engine tests."""
+    suite = unittest.TestLoader().loadTestsFromTestCase(TestFallbackEngine)
+
+    runner = unittest.TextTestRunner(verbosity=2)
+    result = runner.run(suite)
+
+    print(f"\nSummary: Ran {result.testsRun} tests, {len(result.failures)} failures, {len(result.errors)} errors")
+
+    return 0 if result.wasSuccessful() else 1
+
+
+if __name__ == "__main__":
+    sys.exit(run_tests())
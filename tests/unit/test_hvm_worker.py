@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+"""
+Test the resident worker pool and the bundled dispatcher
+
+These tests use a stand-in hvml executable so they can run without HVM installed.
+"""
+
+import io
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..', 'src', 'wrapper')))
+
+import hvm_regex_worker
+from hvm_regex_results import RESULT_FORMAT
+from hvm_regex_wrapper import HvmRegexMatcher
+
+# Stand-in for hvml: logs each run and prints a match result, or sleeps or fails when asked to
+FAKE_HVML = """#!{python}
+import os, sys, time
+program = open(sys.argv[2]).read()
+with open(os.path.join(os.path.dirname(sys.argv[0]), "runs"), "a") as log:
+    log.write("run\\n")
+if "SLEEP" in program:
+    time.sleep(5)
+if "FAIL" in program:
+    sys.stderr.write("parse error\\n")
+    sys.exit(1)
+print("[{format}, 0, 0, 3, 0]")
+"""
+
+
+class TestHvmWorker(unittest.TestCase):
+    """Tests for the resident worker pool."""
+
+    def setUp(self):
+        """Create a stand-in hvml executable."""
+        self.tmpdir = tempfile.mkdtemp()
+        self.hvm_path = os.path.join(self.tmpdir, "hvml")
+        with open(self.hvm_path, "w") as f:
+            f.write(FAKE_HVML.format(python=sys.executable, format=RESULT_FORMAT))
+        os.chmod(self.hvm_path, 0o755)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_pool_runs_programs(self):
+        """Programs are dispatched through resident workers."""
+        command = hvm_regex_worker.dispatcher_command(self.hvm_path)
+        pool = hvm_regex_worker.HvmWorkerPool(command, size=2, request_timeout=10)
+        try:
+            for _ in range(3):
+                self.assertEqual(pool.run("@main = 0").strip(), f"[{RESULT_FORMAT}, 0, 0, 3, 0]")
+        finally:
+            pool.close()
+
+    def test_restart_on_crash(self):
+        """A worker that died is restarted transparently."""
+        command = hvm_regex_worker.dispatcher_command(self.hvm_path)
+        worker = hvm_regex_worker.HvmWorker(command, request_timeout=10)
+        try:
+            worker.run("@main = 0")
+            worker._process.kill()
+            worker._process.wait()
+            self.assertEqual(worker.run("@main = 1").strip(), f"[{RESULT_FORMAT}, 0, 0, 3, 0]")
+            self.assertEqual(worker.restarts, 1)
+        finally:
+            worker.stop()
+
+    def test_request_timeout(self):
+        """A hung request times out and the worker is replaced."""
+        command = hvm_regex_worker.dispatcher_command(self.hvm_path)
+        worker = hvm_regex_worker.HvmWorker(command, request_timeout=0.5)
+        try:
+            with self.assertRaises(TimeoutError):
+                worker.run("@main = SLEEP")
+            self.assertEqual(worker.restarts, 1)
+            self.assertEqual(worker.run("@main = 0").strip(), f"[{RESULT_FORMAT}, 0, 0, 3, 0]")
+        finally:
+            worker.stop()
+
+    def test_dispatcher_runs_hvml_per_new_program(self):
+        """The dispatcher starts hvml once per distinct program and memoizes the rest."""
+        stdin = io.BytesIO()
+        for request_id, program in enumerate(["@main = 0", "@main = 1", "@main = 0"]):
+            hvm_regex_worker.write_frame(stdin, "RUN", request_id, program)
+        stdin.seek(0)
+        stdout = io.BytesIO()
+        hvm_regex_worker.serve_dispatcher(self.hvm_path, stdin=stdin, stdout=stdout)
+
+        stdout.seek(0)
+        for request_id in range(3):
+            self.assertEqual(hvm_regex_worker.read_frame(stdout),
+                             ("OK", request_id, f"[{RESULT_FORMAT}, 0, 0, 3, 0]\n"))
+        with open(os.path.join(self.tmpdir, "runs")) as log:
+            self.assertEqual(len(log.readlines()), 2)
+
+    def test_dispatcher_reports_failed_runs(self):
+        """A failing hvml run is an ERR with its stderr and is run again next time."""
+        stdin = io.BytesIO()
+        for request_id in range(2):
+            hvm_regex_worker.write_frame(stdin, "RUN", request_id, "@main = FAIL")
+        stdin.seek(0)
+        stdout = io.BytesIO()
+        hvm_regex_worker.serve_dispatcher(self.hvm_path, stdin=stdin, stdout=stdout)
+
+        stdout.seek(0)
+        for request_id in range(2):
+            self.assertEqual(hvm_regex_worker.read_frame(stdout),
+                             ("ERR", request_id, "hvml exited with status 1: parse error"))
+        with open(os.path.join(self.tmpdir, "runs")) as log:
+            self.assertEqual(len(log.readlines()), 2)
+
+    def test_matcher_dispatch_mode(self):
+        """HvmRegexMatcher routes matches through the worker pool."""
+        with HvmRegexMatcher(hvm_path=self.hvm_path, dispatch_mode=True,
+                             request_timeout=10) as matcher:
+            result = matcher.match("GET", "GET /index.html")
+            self.assertIsNotNone(result)
+            self.assertEqual(result['position'], 0)
+            self.assertEqual(result['length'], 3)
+
+
+def run_tests():
+    """Run the worker pool tests."""
+    suite = unittest.TestLoader().loadTestsFromTestCase(TestHvmWorker)
+
+    runner = unittest.TextTestRunner(verbosity=2)
+    result = runner.run(suite)
+
+    print(f"\nSummary: Ran {result.testsRun} tests, {len(result.failures)} failures, {len(result.errors)} errors")
+
+    return 0 if result.wasSuccessful() else 1
+
+
+if __name__ == "__main__":
+    sys.exit(run_tests())
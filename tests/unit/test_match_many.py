@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+"""
+Test batched matching with HvmRegexMatcher.match_many
+
+The HVM tests use a stand-in hvml executable so they can run without HVM installed.
+"""
+
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..', 'src', 'wrapper')))
+
+from hvm_regex_wrapper import HvmRegexMatcher
+
+# Stand-in for hvml: records each launch and prints a batched result list
+FAKE_HVML = """#!{python}
+import sys
+if sys.argv[1:2] == ["run"]:
+    with open({log!r}, "a") as log:
+        log.write(sys.argv[2] + "\\n")
+print("[#Match{{0 3}}, #NoMatch, #MatchGroup{{0 1 0 1}}]")
+"""
+
+
+class TestMatchMany(unittest.TestCase):
+    """Tests for batched matching."""
+    
+    def setUp(self):
+        """Create a stand-in hvml executable."""
+        self.tmpdir = tempfile.mkdtemp()
+        self.log = os.path.join(self.tmpdir, "launches.log")
+        self.hvm_path = os.path.join(self.tmpdir, "hvml")
+        with open(self.hvm_path, "w") as f:
+            f.write(FAKE_HVML.format(python=sys.executable, log=self.log))
+        os.chmod(self.hvm_path, 0o755)
+    
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+    
+    def test_single_launch(self):
+        """N jobs are evaluated by one hvml launch and parsed as a list."""
+        matcher = HvmRegexMatcher(hvm_path=self.hvm_path)
+        results = matcher.match_many([
+            ("GET", "GET /index.html"),
+            (r"\d", "abc"),
+            ("(a)", "abc"),
+        ])
+        
+        with open(self.log) as log:
+            self.assertEqual(len(log.readlines()), 1)
+        
+        self.assertEqual(len(results), 3)
+        self.assertEqual(results[0]["text"], "GET")
+        self.assertIsNone(results[1])
+        self.assertEqual(results[2]["groups"][0]["text"], "a")
+    
+    def test_prefiltered_jobs_skip_hvm(self):
+        """Jobs whose text lacks a required literal never reach hvml."""
+        matcher = HvmRegexMatcher(hvm_path=self.hvm_path)
+        self.assertEqual(matcher.match_many([("GET", "POST /"), ("x|y", "abc")]), [None, None])
+        self.assertFalse(os.path.exists(self.log))
+    
+    def test_fallback_matches_individual_calls(self):
+        """In fallback mode match_many agrees with match."""
+        matcher = HvmRegexMatcher(force_fallback=True)
+        pairs = [("a", "abc"), ("ab", "abc"), ("[^abc]", "xyz"), ("d", "abc")]
+        expected = [matcher.match(pattern, text) for pattern, text in pairs]
+        self.assertEqual(matcher.match_many(pairs), expected)
+    
+    def test_empty_batch(self):
+        """An empty batch does not launch hvml."""
+        matcher = HvmRegexMatcher(hvm_path=self.hvm_path)
+        self.assertEqual(matcher.match_many([]), [])
+        self.assertFalse(os.path.exists(self.log))
+
+
+def run_tests():
+    """Run the batched matching tests."""
+    suite = unittest.TestLoader().loadTestsFromTestCase(TestMatchMany)
+    
+    runner = unittest.TextTestRunner(verbosity=2)
+    result = runner.run(suite)
+    
+    print(f"\nSummary: Ran {result.testsRun} tests, {len(result.failures)} failures, {len(result.errors)} errors")
+    
+    return 0 if result.wasSuccessful() else 1
+
+
+if __name__ == "__main__":
+    sys.exit(run_tests())
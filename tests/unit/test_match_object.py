@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+"""
+Test the Match result class (hvm_regex_match)
+"""
+
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..', 'src', 'wrapper')))
+
+from hvm_regex_match import Match
+from hvm_regex_wrapper import HvmRegexMatcher
+
+
+class TestMatchObject(unittest.TestCase):
+    """Tests for Match."""
+
+    def test_accessors(self):
+        """span, start, end and group work like re.Match."""
+        match = Match("say hello", 4, 9, ((4, 6), (-1, -1)))
+        self.assertEqual(match.span(), (4, 9))
+        self.assertEqual((match.start(), match.end()), (4, 9))
+        self.assertEqual(match.span(1), (4, 6))
+        self.assertEqual(match.start(2), -1)
+        self.assertEqual(match.group(), "hello")
+        self.assertEqual(match.group(1), "he")
+        self.assertIsNone(match.group(2))
+        self.assertEqual(match.group(0, 1), ("hello", "he"))
+        self.assertEqual(match.groups(), ("he", None))
+        self.assertEqual(match.groups(""), ("he", ""))
+        with self.assertRaises(IndexError):
+            match.group(3)
+
+    def test_stores_offsets_only(self):
+        """A match keeps a reference to the text and no per-instance dict."""
+        text = "x" * 1000
+        match = Match(text, 1, 999)
+        self.assertIs(match.string, text)
+        self.assertFalse(hasattr(match, "__dict__"))
+
+    def test_dict_compatibility(self):
+        """Dict-style access gives the original result format."""
+        match = Match("say hello", 4, 9, ((4, 6), (-1, -1)))
+        self.assertEqual(match["position"], 4)
+        self.assertEqual(match["length"], 5)
+        self.assertEqual(match["text"], "hello")
+        self.assertEqual(match["groups"][0]["text"], "he")
+        self.assertEqual(match["groups"][1], {"position": -1, "length": 0, "text": None})
+        self.assertIn("groups", match)
+        self.assertEqual(match.get("missing", 0), 0)
+
+        plain = Match("abc", 0, 2)
+        self.assertNotIn("groups", plain)
+        self.assertIsNone(plain.get("groups"))
+        with self.assertRaises(KeyError):
+            plain["groups"]
+        self.assertEqual(plain, {"position": 0, "length": 2, "text": "ab"})
+        self.assertEqual(plain, Match("abc", 0, 2))
+        self.assertNotEqual(plain, Match("abc", 0, 1))
+
+    def test_matcher_returns_match(self):
+        """Matchers return Match objects from both engines' results."""
+        matcher = HvmRegexMatcher(force_fallback=True)
+        result = matcher.match(r"(\w+)@(\w+)", "mail user@host")
+        self.assertIsInstance(result, Match)
+        self.assertEqual(result.span(), (5, 14))
+        self.assertEqual(result.group(2), "host")
+
+        parsed = matcher._parse_match_list_output("[#MatchGroup{0 3 1 2}, #NoMatch]", ["abcd", "x"])
+        self.assertEqual(parsed[0].group(1), "bc")
+        self.assertIsNone(parsed[1])
+
+
+def run_tests():
+    """Run the Match tests."""
+    suite = unittest.TestLoader().loadTestsFromTestCase(TestMatchObject)
+
+    runner = unittest.TextTestRunner(verbosity=2)
+    result = runner.run(suite)
+
+    print(f"\nSummary: Ran {result.testsRun} tests, {len(result.failures)} failures, {len(result.errors)} errors")
+
+    return 0 if result.wasSuccessful() else 1
+
+
+if __name__ == "__main__":
+    sys.exit(run_tests())
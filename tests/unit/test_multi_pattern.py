@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+"""
+Test the Aho-Corasick prefilter and multi-pattern matcher
+"""
+
+import os
+import random
+import sys
+import unittest
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..', 'src', 'wrapper')))
+
+import hvm_regex_engine
+from hvm_regex_atoms import required_atoms
+from hvm_regex_multi import AhoCorasick, MultiPatternMatcher
+from hvm_regex_wrapper import HvmRegexMatcher
+
+# A subset of benchmarks/basic/snort_patterns.hvml
+RULES = [
+    {"id": 100, "text": "GET", "type": "literal"},
+    {"id": 201, "text": "UNION SELECT", "type": "literal"},
+    {"id": 203, "text": r".*(?i)(?:union\s+(?:all\s+)?select).*", "type": "regex"},
+    {"id": 300, "text": "<script>", "type": "literal"},
+    {"id": 302, "text": r".*(?i)(?:<script[^>]*>[^<]*<\/script>).*", "type": "regex"},
+    {"id": 502, "text": r".*(?i)(?:exec|system|passthru|shell_exec|popen).*", "type": "regex"},
+    {"id": 600, "text": r"\b(?:4[0-9]{12}(?:[0-9]{3})?|5[1-5][0-9]{14})\b", "type": "regex"},
+    {"id": 802, "text": r".*(?:password=|pwd=|passwd=|pass=)([^&\s]+).*", "type": "regex"},
+]
+
+TRAFFIC = [
+    "GET /index.php HTTP/1.1\r\nHost: example.com\r\n\r\n",
+    "POST /login.php HTTP/1.1\r\n\r\nusername=admin&password=admin123",
+    "GET /products.php?id=1 UNION SELECT username FROM users HTTP/1.1",
+    "GET /p?id=1 union all select 1",
+    "GET /comment.php?text=<SCRIPT>alert('XSS')</script> HTTP/1.1",
+    "GET /ping.php?host=127.0.0.1;System('cat /etc/passwd') HTTP/1.1",
+    "GET /checkout.php?cardnumber=4111111111111111&exp=12/24 HTTP/1.1",
+    "HEAD / HTTP/1.1",
+]
+
+
+class TestMultiPattern(unittest.TestCase):
+    """Tests for literal prefiltering of rule sets."""
+
+    def test_aho_corasick_finds_all_occurrences(self):
+        """Every occurrence of every literal is reported."""
+        literals = ["he", "she", "his", "hers", "e", "hehe"]
+        automaton = AhoCorasick((literal, literal) for literal in literals)
+        rng = random.Random(3)
+        for _ in range(200):
+            text = "".join(rng.choice("hers") for _ in range(rng.randint(0, 20)))
+            expected = sorted((i, i + len(literal), literal) for literal in literals
+                              for i in range(len(text)) if text.startswith(literal, i))
+            self.assertEqual(sorted(automaton.iter(text)), expected)
+            self.assertEqual(automaton.values(text), {v for _, _, v in expected})
+
+    def test_required_atoms(self):
+        """Atoms are literals that every match must contain."""
+        def atoms(pattern):
+            return required_atoms(hvm_regex_engine.compile(pattern).node)
+
+        self.assertEqual(atoms("abc"), {("abc", False)})
+        self.assertEqual(atoms("ab?c"), {("abc", False), ("ac", False)})
+        self.assertEqual(atoms(r"\d+foo|bar\w"), {("foo", False), ("bar", False)})
+        self.assertEqual(atoms("(?i)Select"), {("select", True)})
+        self.assertIsNone(atoms("a*"))
+        self.assertIsNone(atoms(r"\w+|foo"))
+
+    def test_scan_matches_exhaustive_evaluation(self):
+        """The prefilter never drops a rule that matches."""
+        regex_matcher = HvmRegexMatcher(force_fallback=True)
+        multi = MultiPatternMatcher(RULES, matcher=regex_matcher)
+        for text in TRAFFIC:
+            expected = []
+            for rule in RULES:
+                if rule["type"] == "literal":
+                    found = rule["text"] in text
+                else:
+                    found = regex_matcher.compile(rule["text"]).search(text) is not None
+                if found:
+                    expected.append(rule["id"])
+            self.assertEqual(multi.scan(text), expected, text)
+
+    def test_benign_traffic_skips_regexes(self):
+        """Buffers containing no atoms are rejected without running a regex."""
+        multi = MultiPatternMatcher(RULES, matcher=HvmRegexMatcher(force_fallback=True))
+        self.assertEqual(multi.scan("HEAD / HTTP/1.1\r\nHost: example.com\r\n"), [])
+        self.assertEqual(multi.regex_evaluations, 0)
+
+    def test_unicode_case_variants(self):
+        """Case-insensitive atoms find non-ASCII case variants the engine matches."""
+        rules = [{"id": 1, "text": "(?i)kill", "type": "regex"},
+                 {"id": 2, "text": "kill", "type": "literal"}]
+        multi = MultiPatternMatcher(rules, matcher=HvmRegexMatcher(force_fallback=True))
+        self.assertEqual(multi.scan("\u212aILL -9"), [1])
+        self.assertEqual(multi.scan("kill -9"), [1, 2])
+
+
+def run_tests():
+    """Run the multi-pattern tests."""
+    suite = unittest.TestLoader().loadTestsFromTestCase(TestMultiPattern)
+
+    runner = unittest.TextTestRunner(verbosity=2)
+    result = runner.run(suite)
+
+    print(f"\nSummary: Ran {result.testsRun} tests, {len(result.failures)} failures, {len(result.errors)} errors")
+
+    return 0 if result.wasSuccessful() else 1
+
+
+if __name__ == "__main__":
+    sys.exit(run_tests())
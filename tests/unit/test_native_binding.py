@@ -0,0 +1,165 @@
+#!/usr/bin/env python3
+"""
+Test the ctypes binding to the C library (hvm_regex_native)
+
+The library is built with `make lib`; the tests are skipped when no C
+compiler is available.
+"""
+
+import concurrent.futures
+import mmap
+import os
+import random
+import re
+import subprocess
+import sys
+import tempfile
+import unittest
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..'))
+sys.path.insert(0, os.path.join(ROOT, 'src', 'wrapper'))
+
+import hvm_regex_native
+
+
+def build_library():
+    """Build libhvmregex; return False if it cannot be built."""
+    try:
+        subprocess.run(["make", "-s", "lib"], cwd=ROOT, check=True,
+                       stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    except (OSError, subprocess.CalledProcessError):
+        return False
+    return hvm_regex_native.is_available()
+
+
+AVAILABLE = build_library()
+
+
+@unittest.skipIf(not AVAILABLE, "C compiler not available")
+class TestNativeBinding(unittest.TestCase):
+    """Tests for NativeRegex."""
+
+    def test_buffer_types(self):
+        """bytes, bytearray, memoryview and mmap are searched in place."""
+        regex = hvm_regex_native.compile(r"sel\w+")
+        data = b"x = 1; select * from t"
+        self.assertEqual(regex.search(data), (7, 13))
+        self.assertEqual(regex.search(bytearray(data)), (7, 13))
+        self.assertEqual(regex.search(memoryview(data)[5:]), (2, 8))
+        self.assertEqual(regex.search(data, 8), None)
+
+        with tempfile.TemporaryFile() as f:
+            f.write(data * 100)
+            f.flush()
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                self.assertEqual(len(regex.findall(mapped)), 100)
+
+        with self.assertRaises(TypeError):
+            regex.search("select")
+
+    def test_buffer_released_between_calls(self):
+        """The buffer is only exported while the library reads it."""
+        data = bytearray(b"aaa")
+        regex = hvm_regex_native.compile(b"a")
+        matches = regex.finditer(data)
+        next(matches)
+        data.extend(b"a")  # Would raise BufferError while exported
+        self.assertEqual(len(list(matches)), 2)
+
+    def test_findall_matches_re(self):
+        """findall agrees with re.finditer across result blocks."""
+        original = hvm_regex_native.FIND_BLOCK
+        hvm_regex_native.FIND_BLOCK = 2
+        try:
+            for pattern, data in [(rb"a", b"abacada"), (rb"|a", b"aab"), (rb"x*", b"axxbx"),
+                                  (rb"\b", b"ab cd")]:
+                expected = [m.span() for m in re.finditer(pattern, data)]
+                self.assertEqual(hvm_regex_native.compile(pattern).findall(data), expected,
+                                 pattern)
+        finally:
+            hvm_regex_native.FIND_BLOCK = original
+
+    def test_search_many(self):
+        """A batch of buffers is matched in one call, one result per buffer."""
+        regex = hvm_regex_native.compile(rb"\d+")
+        buffers = [b"abc 12", bytearray(b"no digits"), memoryview(b"7"), b""]
+        self.assertEqual(regex.search_many(buffers), [(4, 6), None, (0, 1), None])
+        self.assertEqual(regex.search_many([]), [])
+
+    def test_search_batch_multi(self):
+        """Results of the multi-pattern batch are grouped by buffer."""
+        regexes = [hvm_regex_native.compile(pattern) for pattern in (b"GET", b"POST", b"a*")]
+        results = hvm_regex_native.search_batch(regexes, [b"GET /", b"POST /a", b"PUT"])
+        self.assertEqual(results, [
+            [(0, 3), None, (0, 0)],
+            [None, (0, 4), (0, 0)],
+            [None, None, (0, 0)],
+        ])
+
+    def test_database_reports_every_match_end(self):
+        """A database scan reports each pattern's match ends with their leftmost start."""
+        patterns = [rb"ab", rb"a+b", rb"(a|b)*c", rb"a.c", rb"[ab]{2,3}", rb"x?y", rb"^ab",
+                    rb"c$", rb"\bab"]
+        db = hvm_regex_native.NativeDatabase(patterns, ids=[100 + i for i in range(len(patterns))])
+        rng = random.Random(3)
+        for _ in range(100):
+            data = bytes(rng.choice(b"abcxy ") for _ in range(rng.randint(0, 14)))
+            expected = []
+            for index, pattern in enumerate(patterns):
+                for end in range(len(data) + 1):
+                    # Anchors and \b must see the whole buffer, so the match
+                    # is pinned to end by requiring the rest of the buffer
+                    regex = re.compile(b"(?:" + pattern + b")(?=" + re.escape(data[end:]) + b"\\Z)")
+                    for start in range(end + 1):
+                        if regex.match(data, start):
+                            expected.append((100 + index, start, end))
+                            break
+            self.assertEqual(sorted(db.scan(data), key=lambda m: (m[2], m[0])),
+                             sorted(expected, key=lambda m: (m[2], m[0])), data)
+
+    def test_database_flags_and_stop(self):
+        """Flags apply per pattern and the callback can stop the scan."""
+        db = hvm_regex_native.NativeDatabase([b"select", b"a"], ids=[7, 8],
+                                             flags=[hvm_regex_native.CASELESS,
+                                                    hvm_regex_native.SINGLEMATCH])
+        self.assertEqual(db.scan(b"a SELECT a"), [(8, 0, 1), (7, 2, 8)])
+
+        seen = []
+        completed = db.scan(b"select select", lambda *match: seen.append(match) or True)
+        self.assertFalse(completed)
+        self.assertEqual(seen, [(7, 0, 6)])
+
+        with self.assertRaises(ValueError):
+            hvm_regex_native.NativeDatabase([b"ok", b"a(?=b)"])
+
+    def test_invalid_pattern(self):
+        """Invalid patterns and patterns the in-process engine cannot run raise ValueError."""
+        for pattern in ("(a", "(?=a)a", r"(a)\1"):
+            with self.assertRaises(ValueError, msg=pattern):
+                hvm_regex_native.compile(pattern)
+
+    def test_thread_pool(self):
+        """One compiled pattern serves a pool of scanning threads."""
+        regex = hvm_regex_native.compile(rb"union\s+(?:all\s+)?select")
+        packets = [b"id=%d union all  select x" % i if i % 3 == 0 else b"id=%d" % i
+                   for i in range(300)]
+        with concurrent.futures.ThreadPoolExecutor(max_workers=4) as pool:
+            results = list(pool.map(regex.search, packets))
+        self.assertEqual([result is not None for result in results],
+                         [i % 3 == 0 for i in range(300)])
+
+
+def run_tests():
+    """Run the native binding tests."""
+    suite = unittest.TestLoader().loadTestsFromTestCase(TestNativeBinding)
+
+    runner = unittest.TextTestRunner(verbosity=2)
+    result = runner.run(suite)
+
+    print(f"\nSummary: Ran {result.testsRun} tests, {len(result.failures)} failures, {len(result.errors)} errors")
+
+    return 0 if result.wasSuccessful() else 1
+
+
+if __name__ == "__main__":
+    sys.exit(run_tests())
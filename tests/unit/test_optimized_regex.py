@@ -4,11 +4,22 @@ Test script for the optimized HVM regex implementation.
 """
 
 import os
+import random
+import re
 import subprocess
 import sys
 import json
 import unittest
 
+OPTIMIZED_REGEX_HVML = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                    '..', '..', 'src', 'core', 'optimized_regex.hvml')
+
+
+def hvml_constant(name):
+    """Value of a numeric @name = N definition in optimized_regex.hvml."""
+    with open(OPTIMIZED_REGEX_HVML) as f:
+        return int(re.search(rf"^@{name} = (\d+)$", f.read(), re.M).group(1))
+
 class OptimizedRegexTest(unittest.TestCase):
     """Test suite for the optimized regex implementation."""
     
@@ -497,7 +508,65 @@ class OptimizedRegexTest(unittest.TestCase):
             if os.path.exists("test_neg_lookahead.hvml"):
                 os.remove("test_neg_lookahead.hvml")
                 
-    def generate_test_hvml(self, pattern, text, pos):
+    def test_shift_or_optional(self):
+        """Test a pattern run by the Shift-Or engine (a?ab)."""
+        test_code = self.generate_test_hvml(
+            "#Concat{#Optional{#Char{\"a\"}} #Concat{#Char{\"a\"} #CharClass{\"bc\"}}}", "abc", 0)
+        output, match_details = self.run_test_hvml("test_shift_or.hvml", test_code)
+
+        self.assertTrue("#Match" in output, f"Expected Match, got: {output}")
+        self.assertEqual(len(match_details), 2, "Match details should have position and length")
+        self.assertEqual(int(match_details[0]), 0, "Match position should be 0")
+        self.assertEqual(int(match_details[1]), 2, "Match length should be 2") # a? gives its 'a' back
+
+    def test_multi_branch_alternation(self):
+        """Test that a balanced alternation chain keeps leftmost-first priority."""
+        # exec|system|shell|shell_exec|popen: "shell" wins over the longer "shell_exec"
+        branches = ["exec", "system", "shell", "shell_exec", "popen"]
+        pattern = f"#Literal{{\"{branches[-1]}\"}}"
+        for branch in reversed(branches[:-1]):
+            pattern = f"#Alt{{#Literal{{\"{branch}\"}} {pattern}}}"
+        test_code = self.generate_test_hvml(pattern, "shell_exec", 0)
+        output, match_details = self.run_test_hvml("test_multi_alt.hvml", test_code)
+
+        self.assertTrue("#Match" in output, f"Expected Match, got: {output}")
+        self.assertEqual(len(match_details), 2, "Match details should have position and length")
+        self.assertEqual(int(match_details[0]), 0, "Match position should be 0")
+        self.assertEqual(int(match_details[1]), 5, "The leftmost branch 'shell' should win")
+
+    def test_parallel_search(self):
+        """Test that a chunked search finds the leftmost match in a long text."""
+        text = "x" * 1000 + "ab" + "x" * 1000 + "ab"
+        test_code = self.generate_test_hvml(
+            "#Concat{#Char{\"a\"} #Char{\"b\"}}", text, 0, "@search_k(test_pattern, test_text, test_pos, 4)")
+        output, match_details = self.run_test_hvml("test_parallel_search.hvml", test_code)
+
+        self.assertTrue("#Match" in output, f"Expected Match, got: {output}")
+        self.assertEqual(len(match_details), 2, "Match details should have position and length")
+        self.assertEqual(int(match_details[0]), 1000, "The match in the first chunks should win")
+        self.assertEqual(int(match_details[1]), 2, "Match length should be 2")
+
+    def run_test_hvml(self, name, test_code):
+        """Run a generated test file and return its output and the fields of its Result."""
+        with open(name, "w") as f:
+            f.write(test_code)
+
+        try:
+            result = subprocess.run(
+                [self.hvm_path, "run", name],
+                capture_output=True,
+                text=True,
+                check=False,
+            )
+        finally:
+            if os.path.exists(name):
+                os.remove(name)
+
+        output = result.stdout.strip()
+        match_details = output[output.find("{") + 1:output.find("}")].strip().split()
+        return output, match_details
+
+    def generate_test_hvml(self, pattern, text, pos, call="@match(test_pattern, test_text, test_pos)"):
         """Generate HVM code for testing the optimized regex implementation."""
         return f"""// Generated test file for the optimized HVM regex implementation
 
@@ -512,7 +581,7 @@ class OptimizedRegexTest(unittest.TestCase):
   ! test_pos = {pos}
   
   // Run the match
-  ! result = @match(test_pattern, test_text, test_pos)
+  ! result = {call}
   
   // Return the result
   result
@@ -521,5 +590,203 @@ class OptimizedRegexTest(unittest.TestCase):
 @main = @test_main
 """
 
+# Python models of the algorithms in optimized_regex.hvml. They follow the
+# HVML step by step, so the algorithms are checked even where hvml is not
+# installed; OptimizedRegexTest runs the HVML itself.
+
+U32 = (1 << 32) - 1
+
+
+def bitap_match(positions, text, pos):
+    """Model of @bitap_match; positions are (chars, neg, opt) triples."""
+    n = len(positions)
+    keep = U32
+    runs = longest = 0
+    for i, (chars, neg, opt) in enumerate(positions):
+        if opt:
+            keep ^= 1 << i
+            runs += 1
+            longest = max(longest, runs)
+        else:
+            runs = 0
+
+    def mask(c):
+        m = U32
+        for i, (chars, neg, opt) in enumerate(positions):
+            if (c in chars) != neg:
+                m ^= 1 << i
+        return m
+
+    def closure(r, start):
+        for _ in range(longest):
+            r &= ((r << 1) & U32) | start | keep
+        return r
+
+    r = closure(U32, 0)
+    accept = 1 << (n - 1)
+    full = (1 << n) - 1
+    best = 1 if r & accept == 0 else 0
+    i, start = pos, 0
+    while i < len(text) and (start == 0 or r & full != full):
+        r = closure(((r << 1) & U32) | start | mask(text[i]), 1)
+        i += 1
+        if r & accept == 0:
+            best = i - pos + 1
+        start = 1
+    return None if best == 0 else (pos, best - 1)
+
+
+def longest_positions_match(positions, text, pos):
+    """Longest match of a position sequence at pos, found by trying every path."""
+    ends = {pos}
+    for chars, neg, opt in positions:
+        stepped = {end + 1 for end in ends if end < len(text) and (text[end] in chars) != neg}
+        ends = stepped | ends if opt else stepped
+    return (pos, max(ends) - pos) if ends else None
+
+
+def alt_chain(branches):
+    """Right-nested alternation chain, as the parser builds it."""
+    chain = branches[-1]
+    for branch in reversed(branches[:-1]):
+        chain = ("alt", branch, chain)
+    return chain
+
+
+def alt_uncons(pattern):
+    """Model of @alt_uncons: (head, tail) or (branch, None) for the last one."""
+    if isinstance(pattern, tuple):
+        return pattern[1], pattern[2]
+    return pattern, None
+
+
+def alt_count(pattern):
+    """Model of @alt_count."""
+    head, tail = alt_uncons(pattern)
+    return 1 if tail is None else 1 + alt_count(tail)
+
+
+def alt_take(chain, n):
+    """Model of @alt_take: balanced tree of the first n branches and the rest."""
+    if n == 1:
+        head, tail = alt_uncons(chain)
+        return ("leaf", head), tail
+    half = n // 2
+    left, rest = alt_take(chain, half)
+    right, rest2 = alt_take(rest, n - half)
+    return ("node", left, right), rest2
+
+
+def leftmost(result_a, result_b):
+    """Model of @leftmost."""
+    rank = (result_a is not None) * 2 + (result_b is not None)
+    return result_a if rank >= 2 else result_b
+
+
+def match_alt_tree(tree, matches):
+    """Match a balanced tree with @match_alt; matches maps a branch to its result."""
+    if tree[0] == "leaf":
+        return matches[tree[1]]
+    return leftmost(match_alt_tree(tree[1], matches), match_alt_tree(tree[2], matches))
+
+
+def search_split(match_at, lo, hi, k, chunks):
+    """Model of @search_split; chunks collects the searched ranges."""
+    if k <= 1 or hi - lo < 2 * hvml_constant("search_min_chunk"):
+        chunks.append((lo, hi))
+        for pos in range(lo, hi):
+            if match_at(pos) is not None:
+                return match_at(pos)
+        return None
+    half = k // 2
+    mid = lo + (hi - lo) * half // k
+    return leftmost(search_split(match_at, lo, mid, half, chunks),
+                    search_split(match_at, mid, hi, k - half, chunks))
+
+
+class OptimizedRegexModelTest(unittest.TestCase):
+    """Checks of the optimized regex algorithms that do not need hvml."""
+
+    def test_bitap_finds_longest_match(self):
+        """Shift-Or with optional positions finds the longest match of the positions."""
+        rng = random.Random(21)
+        alphabet = ["a", "b", "ab", ""]
+        for _ in range(3000):
+            positions = [(rng.choice(alphabet), rng.random() < 0.2, rng.random() < 0.4)
+                         for _ in range(rng.randint(1, 6))]
+            text = "".join(rng.choice("abc") for _ in range(rng.randint(0, 8)))
+            pos = rng.randint(0, len(text))
+            self.assertEqual(bitap_match(positions, text, pos),
+                             longest_positions_match(positions, text, pos),
+                             (positions, text, pos))
+
+    def test_bitap_longest_pattern(self):
+        """A pattern of @bitap_max_positions positions fits the U32 state."""
+        n = hvml_constant("bitap_max_positions")
+        self.assertEqual(hvml_constant("bitap_ones"), U32)
+        positions = [("a", False, i % 3 == 0) for i in range(n)]
+        for length in range(n + 2):
+            self.assertEqual(bitap_match(positions, "a" * length, 0),
+                             longest_positions_match(positions, "a" * length, 0))
+
+    def test_shift_or_optional(self):
+        """a?a[bc] gives its optional 'a' back, as the backtracker does."""
+        positions = [("a", False, True), ("a", False, False), ("bc", False, False)]
+        self.assertEqual(bitap_match(positions, "abc", 0), (0, 2))
+        self.assertEqual(re.match("a?a[bc]", "abc").span(), (0, 2))
+
+    def test_balanced_alternation(self):
+        """Balancing keeps the branches in order and depth logarithmic."""
+        for n in range(1, 40):
+            branches = [f"b{i}" for i in range(n)]
+            chain = alt_chain(branches)
+            tree, rest = alt_take(chain, alt_count(chain))
+            self.assertIsNone(rest)
+
+            def leaves(node):
+                return [node[1]] if node[0] == "leaf" else leaves(node[1]) + leaves(node[2])
+
+            def depth(node):
+                return 0 if node[0] == "leaf" else 1 + max(depth(node[1]), depth(node[2]))
+
+            self.assertEqual(leaves(tree), branches)
+            self.assertLessEqual(depth(tree), (n - 1).bit_length())
+
+    def test_alternation_is_leftmost_first(self):
+        """The balanced tree returns the first branch that matches."""
+        rng = random.Random(24)
+        for _ in range(2000):
+            branches = [f"b{i}" for i in range(rng.randint(1, 12))]
+            matches = {branch: (0, rng.randint(0, 5)) if rng.random() < 0.3 else None
+                       for branch in branches}
+            chain = alt_chain(branches)
+            tree, rest = alt_take(chain, alt_count(chain))
+            first = next((matches[branch] for branch in branches if matches[branch] is not None), None)
+            self.assertEqual(match_alt_tree(tree, matches), first)
+
+    def test_chunked_search_is_leftmost(self):
+        """Chunks cover the start positions once and the earliest match wins."""
+        rng = random.Random(25)
+        k = hvml_constant("search_chunks")
+        for _ in range(200):
+            n = rng.randint(0, 5000)
+            text = "".join(rng.choice("xxxxxxxxxa") for _ in range(n))
+            pos = rng.randint(0, n)
+
+            def match_at(start):
+                return (start, 1) if start < n and text[start] == "a" else None
+
+            chunks = []
+            found = search_split(match_at, pos, n + 1, k, chunks)
+            expected = next((match_at(start) for start in range(pos, n + 1)
+                             if match_at(start) is not None), None)
+            self.assertEqual(found, expected)
+            self.assertLessEqual(len(chunks), k)
+            self.assertEqual(chunks[0][0], pos)
+            self.assertEqual(chunks[-1][1], n + 1)
+            for (lo_a, hi_a), (lo_b, hi_b) in zip(chunks, chunks[1:]):
+                self.assertEqual(hi_a, lo_b)
+
+
 if __name__ == "__main__":
     unittest.main()
\ No newline at end of file
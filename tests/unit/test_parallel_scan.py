@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+"""
+Test multi-core scanning with a process pool (hvm_regex_parallel)
+"""
+
+import os
+import random
+import sys
+import unittest
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..', 'src', 'wrapper')))
+
+import hvm_regex_engine
+import hvm_regex_parallel
+from hvm_regex_wrapper import IGNORECASE
+
+PATTERNS = [r"\bab\w*", r"^a", r"c$", r"x*", r"[^\n]b", r"(?:ca|a)b"]
+
+
+def expected_spans(text, patterns=PATTERNS):
+    """Sequential scan of the whole text in this process."""
+    spans = [(index, start, end)
+             for index, pattern in enumerate(patterns)
+             for start, end, _ in hvm_regex_engine.compile(pattern).finditer(text)]
+    return sorted(spans, key=lambda span: (span[1], span[0]))
+
+
+class TestParallelScan(unittest.TestCase):
+    """Tests for ParallelScanner."""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.scanner = hvm_regex_parallel.ParallelScanner(PATTERNS, workers=2)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.scanner.close()
+
+    def test_scan_many_in_input_order(self):
+        """Results of sharded texts come back in input order."""
+        rng = random.Random(11)
+        texts = ["".join(rng.choice("abcx \n") for _ in range(rng.randint(0, 30)))
+                 for _ in range(50)]
+        self.assertEqual(self.scanner.scan_many(texts), [expected_spans(text) for text in texts])
+        self.assertEqual(self.scanner.scan_many(texts, batch_size=7),
+                         [expected_spans(text) for text in texts])
+        self.assertEqual(self.scanner.scan_many([]), [])
+
+    def test_scan_text_matches_whole_scan(self):
+        """Splitting at newlines gives the result of scanning the whole text."""
+        rng = random.Random(12)
+        for _ in range(20):
+            text = "".join(rng.choice("abcx\n") for _ in range(rng.randint(0, 200)))
+            for chunk_size in (1, 5, 64):
+                self.assertEqual(self.scanner.scan_text(text, chunk_size=chunk_size),
+                                 expected_spans(text), (text, chunk_size))
+
+    def test_split_points(self):
+        """Pieces end right after a separator."""
+        self.assertEqual(hvm_regex_parallel.split_points("ab\ncd\nef", 4), [0, 6, 8])
+        self.assertEqual(hvm_regex_parallel.split_points("ab\ncd\nef", 1), [0, 3, 6, 8])
+        self.assertEqual(hvm_regex_parallel.split_points("abc\n", 1), [0, 4])
+        self.assertEqual(hvm_regex_parallel.split_points("", 4), [0, 0])
+
+    def test_scan_many_function(self):
+        """The module-level helper preloads flags with each pattern."""
+        results = hvm_regex_parallel.scan_many(["SELECT 1", "none"], [("select", IGNORECASE)],
+                                               workers=1)
+        self.assertEqual(results, [[(0, 0, 6)], []])
+
+
+def run_tests():
+    """Run the parallel scanning tests."""
+    suite = unittest.TestLoader().loadTestsFromTestCase(TestParallelScan)
+
+    runner = unittest.TextTestRunner(verbosity=2)
+    result = runner.run(suite)
+
+    print(f"\nSummary: Ran {result.testsRun} tests, {len(result.failures)} failures, {len(result.errors)} errors")
+
+    return 0 if result.wasSuccessful() else 1
+
+
+if __name__ == "__main__":
+    sys.exit(run_tests())
@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+"""
+Test the on-disk cache of compiled rule sets
+"""
+
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..', 'src', 'wrapper')))
+
+import hvm_regex_engine
+import hvm_regex_store
+from hvm_regex_wrapper import HvmRegexMatcher, IGNORECASE
+
+RULES = [
+    "GET",
+    (r"union\s+(?:all\s+)?select", IGNORECASE),
+    r"(\w+)=(\d+)",
+    r"(?<=id=)\d+",
+    r"[^a-z]{2,}x?",
+]
+
+TEXTS = ["GET /?id=42", "x UNION  ALL select 1", "a=1&b=22", "no match here", "AB12x"]
+
+
+class TestPatternStore(unittest.TestCase):
+    """Tests for hvm_regex_store and HvmRegexMatcher.compile_all."""
+    
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+    
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+    
+    def test_restored_patterns_match_like_fresh_ones(self):
+        """A second start loads the file instead of parsing, with identical results."""
+        fresh = HvmRegexMatcher(force_fallback=True).compile_all(RULES, cache_dir=self.tmpdir)
+        self.assertEqual(len(os.listdir(self.tmpdir)), 1)
+        
+        with mock.patch.object(hvm_regex_engine.hvm_regex_parser, "parse",
+                               side_effect=AssertionError("pattern was re-parsed")):
+            restored = HvmRegexMatcher(force_fallback=True).compile_all(RULES, cache_dir=self.tmpdir)
+        
+        for a, b in zip(fresh, restored):
+            self.assertEqual(a.pattern, b.pattern)
+            self.assertEqual(a.atoms, b.atoms)
+            self.assertEqual(type(a.regex.engine), type(b.regex.engine))
+            for text in TEXTS:
+                self.assertEqual(a.search(text), b.search(text), (a.pattern, text))
+    
+    def test_dfa_states_are_kept(self):
+        """DFA states built before saving are available right after loading."""
+        matcher = HvmRegexMatcher(force_fallback=True)
+        compiled = matcher.compile_all(["ab+c"], cache_dir=self.tmpdir)
+        compiled[0].search("xxabbbc")
+        states = compiled[0].regex.engine.forward_dfa.state_count
+        matcher.save_compiled(compiled, self.tmpdir)
+        
+        restored = HvmRegexMatcher(force_fallback=True).compile_all(["ab+c"], cache_dir=self.tmpdir)
+        self.assertEqual(restored[0].regex.engine.forward_dfa.state_count, states)
+        self.assertEqual(restored[0].search("abc")["length"], 3)
+    
+    def test_key_depends_on_rules(self):
+        """Different rule sets (or flags) use different files."""
+        keys = {
+            hvm_regex_store.ruleset_key([("a", 0)]),
+            hvm_regex_store.ruleset_key([("a", IGNORECASE)]),
+            hvm_regex_store.ruleset_key([("a", 0), ("b", 0)]),
+            hvm_regex_store.ruleset_key([("a\0b", 0)]),
+        }
+        self.assertEqual(len(keys), 4)
+    
+    def test_key_depends_on_engine(self):
+        """A changed engine source gets a new file instead of the old compilation."""
+        rules = [("(?i)k", 0)]
+        key = hvm_regex_store.ruleset_key(rules)
+        with mock.patch.object(hvm_regex_store, "_engine_version", "0" * 64):
+            self.assertNotEqual(hvm_regex_store.ruleset_key(rules), key)
+        self.assertEqual(hvm_regex_store.ruleset_key(rules), key)
+    
+    def test_stale_or_corrupt_files_are_ignored(self):
+        """Files from another format version or truncated files are recompiled."""
+        rules = [("abc", 0)]
+        path = hvm_regex_store.ruleset_path(self.tmpdir, rules)
+        entry = hvm_regex_store.StoredPattern(hvm_regex_engine.compile("abc"), None)
+        hvm_regex_store.save(path, rules, [entry])
+        self.assertIsNotNone(hvm_regex_store.load(path, rules))
+        
+        with mock.patch.object(hvm_regex_store, "FORMAT_VERSION", hvm_regex_store.FORMAT_VERSION + 1):
+            self.assertIsNone(hvm_regex_store.load(path, rules))
+        self.assertIsNone(hvm_regex_store.load(path, [("abd", 0)]))
+        
+        with open(path, "rb") as f:
+            data = f.read()
+        with open(path, "wb") as f:
+            f.write(data[:len(data) // 2])
+        self.assertIsNone(hvm_regex_store.load(path, rules))
+        self.assertIsNone(hvm_regex_store.load(os.path.join(self.tmpdir, "missing"), rules))
+
+
+def run_tests():
+    """Run the pattern store tests."""
+    suite = unittest.TestLoader().loadTestsFromTestCase(TestPatternStore)
+    
+    runner = unittest.TextTestRunner(verbosity=2)
+    result = runner.run(suite)
+    
+    print(f"\nSummary: Ran {result.testsRun} tests, {len(result.failures)} failures, {len(result.errors)} errors")
+    
+    return 0 if result.wasSuccessful() else 1
+
+
+if __name__ == "__main__":
+    sys.exit(run_tests())
@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+"""
+Test required-literal (atom) extraction and match gating
+"""
+
+import os
+import random
+import re
+import sys
+import unittest
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..', 'src', 'wrapper')))
+
+import hvm_regex_engine
+from hvm_regex_atoms import Atom, And, Or, prefilter, query_matches
+from hvm_regex_wrapper import HvmRegexMatcher, IGNORECASE
+
+
+def atoms(pattern, flags=0):
+    return prefilter(hvm_regex_engine.compile(pattern, flags).node)
+
+
+class TestPrefilterAtoms(unittest.TestCase):
+    """Tests for atom queries."""
+    
+    def test_union_select(self):
+        """Both keywords are required, the optional one is not."""
+        self.assertEqual(atoms(r"union\s+(?:all\s+)?select"),
+                         And((Atom("union", False), Atom("select", False))))
+    
+    def test_queries(self):
+        """Alternations become Or, optional parts are dropped."""
+        self.assertEqual(atoms("GET"), Atom("GET", False))
+        self.assertEqual(atoms(r"foo\d+|bar\w"), Or((Atom("foo", False), Atom("bar", False))))
+        self.assertEqual(atoms("(?i)Select.*From"),
+                         And((Atom("select", True), Atom("from", True))))
+        self.assertEqual(atoms(r"x(?:ab){2}"), Atom("xabab", False))
+        self.assertIsNone(atoms(r"\d+"))
+        self.assertIsNone(atoms("a?"))
+        self.assertIsNone(atoms(r"\w+|foo"))
+    
+    def test_query_matches(self):
+        """Queries are checked from pos onwards and fold ASCII case."""
+        query = atoms(r"union\s+(?:all\s+)?select")
+        self.assertTrue(query_matches(query, "x union all select 1"))
+        self.assertFalse(query_matches(query, "x union all"))
+        self.assertFalse(query_matches(query, "union select", 1))
+        self.assertTrue(query_matches(atoms("(?i)union"), "UnIoN"))
+        self.assertTrue(query_matches(None, ""))
+
+    def test_query_matches_unicode_case(self):
+        """Non-ASCII case variants of ASCII atoms are not rejected."""
+        self.assertTrue(query_matches(atoms("(?i)k"), "\u212a"))
+        self.assertTrue(query_matches(atoms("(?i)ok"), "xO\u212a", 1))
+        matcher = HvmRegexMatcher(force_fallback=True)
+        self.assertEqual(matcher.compile("k", IGNORECASE).search("\u212a")["position"], 0)
+        self.assertEqual(matcher.compile("(?i)kx").search("a\u212aX")["position"], 1)
+    
+    def test_gate_never_rejects_a_match(self):
+        """Texts rejected by the query really have no match."""
+        patterns = ["ab+c", "a(b|cd)e", r"\bfoo\b", "(?:ab){2,3}x", "a.c|d",
+                    "x[ab]y", "(a)b\\1", "(?<=a)bc", "a(?=bc)", "ca*t|dog"]
+        rng = random.Random(7)
+        for pattern in patterns:
+            query = atoms(pattern)
+            expected = re.compile(pattern)
+            for _ in range(300):
+                text = "".join(rng.choice("abcdefgostxy ") for _ in range(rng.randint(0, 12)))
+                if not query_matches(query, text):
+                    self.assertIsNone(expected.search(text), (pattern, text))
+
+
+class TestMatchGating(unittest.TestCase):
+    """Tests for gating the matcher on atoms."""
+    
+    def test_compiled_pattern_exposes_atoms(self):
+        """CompiledPattern.atoms holds the query."""
+        matcher = HvmRegexMatcher(force_fallback=True)
+        compiled = matcher.compile(r"union\s+(?:all\s+)?select")
+        self.assertEqual(compiled.atoms, And((Atom("union", False), Atom("select", False))))
+        self.assertFalse(compiled.may_match("union only"))
+        self.assertIsNone(compiled.search("union only"))
+        self.assertEqual(compiled.search("1 union  select 2")["text"], "union  select")
+    
+    def test_hvm_not_launched_without_atoms(self):
+        """A text missing a required literal is rejected before hvml runs."""
+        matcher = HvmRegexMatcher(hvm_path=os.path.join(os.path.dirname(__file__), "missing-hvml"))
+        matcher.use_fallback = False  # Any launch would fail loudly
+        compiled = matcher.compile("GET")
+        self.assertEqual(compiled.atoms, Atom("GET", False))
+        self.assertIsNone(compiled.match("POST /index.html"))
+
+
+def run_tests():
+    """Run the atom prefilter tests."""
+    suite = unittest.TestSuite()
+    suite.addTests(unittest.TestLoader().loadTestsFromTestCase(TestPrefilterAtoms))
+    suite.addTests(unittest.TestLoader().loadTestsFromTestCase(TestMatchGating))
+    
+    runner = unittest.TextTestRunner(verbosity=2)
+    result = runner.run(suite)
+    
+    print(f"\nSummary: Ran {result.testsRun} tests, {len(result.failures)} failures, {len(result.errors)} errors")
+    
+    return 0 if result.wasSuccessful() else 1
+
+
+if __name__ == "__main__":
+    sys.exit(run_tests())
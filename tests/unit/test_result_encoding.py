@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+"""
+Test the structured result encoding (hvm_regex_results)
+
+The HVM tests use a stand-in hvml executable so they can run without HVM installed.
+"""
+
+import os
+import re
+import shutil
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..', 'src', 'wrapper')))
+
+import hvm_regex_results
+from hvm_regex_results import RESULT_FORMAT
+from hvm_regex_wrapper import HvmRegexMatcher
+
+# Stand-in for hvml: prints an encoded result list for three jobs, where job
+# 0 matches twice, job 1 has three groups and job 2 does not match
+FAKE_HVML = """#!{python}
+print("[{format}, 0, 0, 3, 0, 0, 4, 7, 0, 1, 1, 6, 3, 1, 2, 4294967295, 4294967295, 3, 6]")
+"""
+
+
+class TestResultEncoding(unittest.TestCase):
+    """Tests for the result list encoding."""
+
+    def test_decode(self):
+        """Records carry any number of matches and groups per job."""
+        output = f"[{RESULT_FORMAT}, 2, 1, 5, 3, 1, 2, -1, -1, 4294967295, 4294967295, 0, 0, 0, 0]"
+        self.assertEqual(hvm_regex_results.decode(output), [
+            (2, 1, 5, ((1, 2), (-1, -1), (-1, -1))),
+            (0, 0, 0, ()),
+        ])
+        self.assertEqual(hvm_regex_results.decode(f"! a = [{RESULT_FORMAT}]\n"), [])
+        self.assertEqual(hvm_regex_results.decode(f"[{RESULT_FORMAT} 1 0 3 0]"), [(1, 0, 3, ())])
+
+    def test_decode_rejects_malformed(self):
+        """Anything but a complete result list decodes to None."""
+        for output in ("", "#Match{0 3}", "[#Match{0 3}, #NoMatch]", "[1, 0, 3, 0]",
+                       f"[{RESULT_FORMAT}, 0, 0, 3]", f"[{RESULT_FORMAT}, 0, 0, 3, 1, 0]"):
+            self.assertIsNone(hvm_regex_results.decode(output), output)
+
+    def test_encode_expr(self):
+        """Jobs are numbered in order and concatenated after the format tag."""
+        self.assertEqual(hvm_regex_results.encode_expr(["@match(#CharA)", "@match(#Any)"]),
+                         f"@append([{RESULT_FORMAT}], @append(@encode(0, @match(#CharA)), "
+                         f"@append(@encode(1, @match(#Any)), [])))")
+
+    def test_generated_programs_encode_results(self):
+        """Single and batched programs evaluate to the encoded list."""
+        matcher = HvmRegexMatcher(force_fallback=True)
+        for program in (matcher._generate_match_hvml("a", "abc", 0),
+                        matcher._generate_batch_hvml(["#CharA", "#Any"])):
+            self.assertIn("@encode(id, result) = ~result {", program)
+            self.assertIn("@append(a, b) = ~a {", program)
+            self.assertIn(f"@main = @append([{RESULT_FORMAT}], ", program)
+            self.assertIn("data List {", program)
+
+    def test_encoder_uses_variables_once(self):
+        """Each @encode branch duplicates a variable before using it twice."""
+        encoder = hvm_regex_results.HVML_ENCODER
+        body = encoder[encoder.index("@encode(id, result)"):encoder.index("#NoMatch")]
+        for branch in re.split(r"\n  (?=#)", body)[1:]:
+            binders = re.findall(r"\w+", re.search(r"\{(.*?)\}", branch).group(1))
+            for dup in re.findall(r"! &\d+\{(\w+) (\w+)\} = (\w+)", branch):
+                binders.extend(dup[:2])
+            uses = re.findall(r"\w+", re.sub(r"^#\w+\{.*?\}:|! &\d+\{\w+ \w+\}", "", branch, flags=re.M))
+            for name in binders:
+                self.assertLessEqual(uses.count(name), 1, f"{name} in {branch!r}")
+
+    def test_parse_single_match(self):
+        """A single match takes the first record of job 0."""
+        matcher = HvmRegexMatcher(force_fallback=True)
+        output = f"[{RESULT_FORMAT}, 0, 2, 3, 0, 0, 5, 6, 0]"
+        self.assertEqual(matcher._parse_match_output(output, "abcdef").span(), (2, 3))
+        self.assertIsNone(matcher._parse_match_output(f"[{RESULT_FORMAT}]", "abc"))
+        self.assertIsNone(matcher._parse_match_output(f"[{RESULT_FORMAT}, 1, 0, 1, 0]", "abc"))
+
+
+class TestResultDecodingWithHvm(unittest.TestCase):
+    """Tests decoding the output of a stand-in hvml."""
+
+    def setUp(self):
+        """Create a stand-in hvml executable."""
+        self.tmpdir = tempfile.mkdtemp()
+        self.hvm_path = os.path.join(self.tmpdir, "hvml")
+        with open(self.hvm_path, "w") as f:
+            f.write(FAKE_HVML.format(python=sys.executable, format=RESULT_FORMAT))
+        os.chmod(self.hvm_path, 0o755)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_match_many(self):
+        """Batched results are assigned to jobs by record id."""
+        matcher = HvmRegexMatcher(hvm_path=self.hvm_path)
+        results = matcher.match_many([("a", "abc"), ("(b)(c)(d)", "abcdef"), ("b", "bbb")])
+        self.assertEqual(results[0].span(), (0, 3))
+        self.assertEqual(results[1].span(), (1, 6))
+        self.assertEqual(results[1].groups(), ("b", None, "def"))
+        self.assertIsNone(results[2])
+
+
+def run_tests():
+    """Run the result encoding tests."""
+    suite = unittest.TestSuite()
+    suite.addTests(unittest.TestLoader().loadTestsFromTestCase(TestResultEncoding))
+    suite.addTests(unittest.TestLoader().loadTestsFromTestCase(TestResultDecodingWithHvm))
+
+    runner = unittest.TextTestRunner(verbosity=2)
+    result = runner.run(suite)
+
+    print(f"\nSummary: Ran {result.testsRun} tests, {len(result.failures)} failures, {len(result.errors)} errors")
+
+    return 0 if result.wasSuccessful() else 1
+
+
+if __name__ == "__main__":
+    sys.exit(run_tests())
@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+"""
+Test streaming matching across chunk boundaries
+"""
+
+import os
+import random
+import re
+import sys
+import unittest
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..', 'src', 'wrapper')))
+
+from hvm_regex_wrapper import HvmRegexMatcher
+
+PATTERNS = ["ab", "a+b", "(a|b)*c", "a.c", "[ab]{2,3}", "x?y", "(?:ab|a)(?:bc|c)", "^ab"]
+
+
+def expected_matches(pattern, text):
+    """Every match end with the leftmost start of a match ending there."""
+    regex = re.compile(pattern)
+    matches = []
+    for end in range(len(text) + 1):
+        for start in range(end + 1):
+            if regex.fullmatch(text, start, end):
+                matches.append((start, end))
+                break
+    return matches
+
+
+def feed_in_chunks(stream, text, sizes):
+    matches = []
+    pos = 0
+    for size in sizes:
+        matches.extend(stream.feed(text[pos:pos + size]))
+        pos += size
+    matches.extend(stream.feed(text[pos:]))
+    return matches + stream.close()
+
+
+class TestStream(unittest.TestCase):
+    """Tests for RegexStream."""
+    
+    def setUp(self):
+        self.matcher = HvmRegexMatcher(force_fallback=True)
+    
+    def test_match_straddles_chunks(self):
+        """A signature split across two packets is found at its stream offset."""
+        stream = self.matcher.open_stream("UNION SELECT")
+        self.assertEqual(stream.feed("GET /p?id=1 UNI"), [])
+        self.assertEqual(stream.feed("ON SELECT 1"), [(12, 24)])
+        self.assertEqual(stream.close(), [])
+        self.assertEqual(stream.offset, 26)
+    
+    def test_chunking_does_not_change_matches(self):
+        """Any split of the flow gives the same matches as scanning it whole."""
+        rng = random.Random(11)
+        for pattern in PATTERNS:
+            for _ in range(60):
+                text = "".join(rng.choice("abcxy") for _ in range(rng.randint(0, 15)))
+                sizes = [rng.randint(0, 4) for _ in range(rng.randint(0, 5))]
+                stream = self.matcher.open_stream(pattern)
+                self.assertEqual(feed_in_chunks(stream, text, sizes),
+                                 expected_matches(pattern, text), (pattern, text, sizes))
+    
+    def test_assertions_at_chunk_edges(self):
+        """Word boundaries and $ are decided by the next chunk or close()."""
+        stream = self.matcher.open_stream(r"\bcat\b")
+        self.assertEqual(stream.feed("a cat"), [])
+        self.assertEqual(stream.feed("s cat"), [])
+        self.assertEqual(stream.feed(" "), [(7, 10)])
+        
+        stream = self.matcher.open_stream("end$")
+        self.assertEqual(stream.feed("the end"), [])
+        self.assertEqual(stream.feed(""), [])
+        self.assertEqual(stream.close(), [(4, 7)])
+    
+    def test_ignorecase(self):
+        """Flags apply to streams."""
+        stream = self.matcher.open_stream("select", flags=2)
+        self.assertEqual(stream.feed("SEL") + stream.feed("ect"), [])
+        self.assertEqual(stream.close(), [(0, 6)])
+    
+    def test_lookaround_rejected(self):
+        """Patterns that need the whole text cannot be streamed."""
+        with self.assertRaises(ValueError):
+            self.matcher.open_stream("a(?=b)")
+        with self.assertRaises(ValueError):
+            self.matcher.open_stream(r"(a)\1")
+    
+    def test_closed_stream(self):
+        """Feeding a closed stream is an error."""
+        stream = self.matcher.open_stream("a")
+        stream.close()
+        self.assertEqual(stream.close(), [])
+        with self.assertRaises(ValueError):
+            stream.feed("a")
+
+
+def run_tests():
+    """Run the streaming tests."""
+    suite = unittest.TestLoader().loadTestsFromTestCase(TestStream)
+    
+    runner = unittest.TextTestRunner(verbosity=2)
+    result = runner.run(suite)
+    
+    print(f"\nSummary: Ran {result.testsRun} tests, {len(result.failures)} failures, {len(result.errors)} errors")
+    
+    return 0 if result.wasSuccessful() else 1
+
+
+if __name__ == "__main__":
+    sys.exit(run_tests())